@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""Checks the in-package ABX scorer and analyzer against ABXpy
+
+Computes the ABX distances of a features folder with ABXpy, then scores and
+analyzes the triplets with ABXpy.score and ABXpy.analyze on one side and with
+the in-package engine (abx_engine.score and analyze) on the other side.
+Reports the time of both and exits with an error if the analyze tables or the
+averaged ABX error rates differ.
+
+Example, on the english 1s subset of a 2017 track1 submission:
+
+    python benchmarks/abx_parity.py \\
+        submission/2017/track1/english/1s \\
+        $DATASET/2017/ABXTasks/english/1s/1s_byCtxt_acSpkr.abx
+
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import h5py
+import numpy as np
+import pandas
+from ABXpy.analyze import analyze
+from ABXpy.distances.distances import compute_distances
+from ABXpy.score import score
+
+from zerospeech2020.evaluation import abx, abx_engine, abx_task
+
+
+def _read_distances(task, distance_file, index):
+    """Reads the pairs distances computed by ABXpy
+
+    The distances of a by-block are stored in ABXpy's distance file at the
+    position of its pairs in the task file (as given by the 'unique_pairs'
+    attributes), they are returned in the order of the pairs in the compiled
+    task `index`.
+
+    """
+    try:
+        with h5py.File(task, 'r') as ftask, \
+                h5py.File(distance_file, 'r') as fdist:
+            data = fdist['distances']['data']
+            distances = []
+            for by in index.bys:
+                _, start, stop = ftask['unique_pairs'].attrs[by]
+                distances.append(data[start:stop, 0])
+    except (OSError, KeyError) as err:
+        raise ValueError(f'failed to read ABX distances: {err}')
+
+    distances = np.concatenate(distances).astype(np.float64)
+    if distances.shape != (index.n_pairs,):
+        raise ValueError(
+            f'ABX distances do not match the task {task}: '
+            f'found {len(distances)} pairs, expected {index.n_pairs}')
+    return distances
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('features', help='folder containing the features')
+    parser.add_argument('task', help='the ABX task file')
+    parser.add_argument(
+        '-y', '--year', default='2017', choices=['2017', '2019'])
+    parser.add_argument(
+        '-t', '--task-type', default='across', choices=['across', 'within'])
+    parser.add_argument(
+        '-d', '--distance', default='cosine',
+        choices=['cosine', 'KL', 'levenshtein'])
+    parser.add_argument('-j', '--njobs', type=int, default=1)
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='[%(levelname)s] %(message)s', level=logging.INFO)
+    log = logging.getLogger()
+
+    load_fun = {
+        '2017': abx._load_features_2017,
+        '2019': abx._load_features_2019}[args.year]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        features = os.path.join(temp_dir, 'features.h5')
+        distances = os.path.join(temp_dir, 'distances.h5')
+        abx._convert(args.features, features, load_fun)
+        log.info('computing %s distances with ABXpy ...', args.distance)
+        compute_distances(
+            features, 'features', args.task, distances,
+            abx._DIST2FUN[args.distance],
+            True if args.distance == 'cosine' else None, n_cpu=args.njobs)
+
+        t0 = time.time()
+        scores = os.path.join(temp_dir, 'scores.h5')
+        analyzed = os.path.join(temp_dir, 'analyze.csv')
+        score(args.task, distances, scores)
+        analyze(args.task, scores, analyzed)
+        expected = abx._average(analyzed, args.task_type)
+        expected_table = pandas.read_csv(analyzed, sep='\t')
+        log.info('ABXpy: ABX = %.4f%%, %.1fs', expected, time.time() - t0)
+
+        t0 = time.time()
+        index = abx_task.load_task(args.task)
+        table = abx_engine.analyze(index, abx_engine.score(
+            index, _read_distances(args.task, distances, index)))
+        found = abx._average_frame(table.copy(), args.task_type)
+        log.info('native: ABX = %.4f%%, %.1fs', found, time.time() - t0)
+
+    # compare the tables row by row, regardless of their order
+    columns = ['by'] + index.regressors
+    expected_table = expected_table.sort_values(columns).reset_index(drop=True)
+    table = table.sort_values(columns).reset_index(drop=True)
+    if not (
+            len(table) == len(expected_table)
+            and all((table[c].astype(str) == expected_table[c].astype(str))
+                    .all() for c in columns)
+            and np.array_equal(table['n'], expected_table['n'])
+            and np.allclose(table['score'], expected_table['score'])
+            and np.isclose(found, expected)):
+        log.error('the native analyze table differs from ABXpy')
+        sys.exit(1)
+    log.info('the analyze tables and ABX error rates are identical')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""Compares the ABX scores computed with and without pruning of the DTW
+
+Scores the triplets of an ABX task with the native engine, first by computing
+the DTW distances of all the pairs (abx_engine.compute_distances), then by
+computing bounds of the distances and the DTW of the pairs required by the
+triplets the bounds do not decide (abx_bounds.score). Reports the time of
+both, the pruning rates and the time saved, and exits with an error if the
+scores differ.
+
+Example, on the english 1s subset of a 2017 track1 submission:
+
+    python benchmarks/dtw_pruning.py \\
+        submission/2017/track1/english/1s \\
+        $DATASET/2017/ABXTasks/english/1s/1s_byCtxt_acSpkr.abx -j 4
+
+"""
+
+import argparse
+import logging
+import sys
+import time
+
+import numpy as np
+
+from zerospeech2020.evaluation import abx, abx_bounds, abx_engine, abx_task
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('features', help='folder containing the features')
+    parser.add_argument('task', help='the ABX task file')
+    parser.add_argument(
+        '-y', '--year', default='2017', choices=['2017', '2019'])
+    parser.add_argument(
+        '-n', '--not-normalized', action='store_true',
+        help='do not normalize the DTW distances')
+    parser.add_argument('-j', '--njobs', type=int, default=1)
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='[%(levelname)s] %(message)s', level=logging.INFO)
+    log = logging.getLogger()
+
+    index = abx_task.load_task(args.task)
+    load_fun = {
+        '2017': abx._load_features_2017,
+        '2019': abx._load_features_2019}[args.year]
+    features = abx_engine.load_features(args.features, load_fun)
+    distance = abx._DIST2FUN['cosine']
+    normalized = not args.not_normalized
+
+    t0 = time.time()
+    expected = abx_engine.score(index, abx_engine.compute_distances(
+        index, features, distance, normalized, njobs=args.njobs))
+    full = time.time() - t0
+    log.info('full: %.1fs', full)
+
+    t0 = time.time()
+    scores, stats = abx_bounds.score(
+        index, features, distance, abx._DIST2FRAMES['cosine'], normalized,
+        njobs=args.njobs)
+    pruned = time.time() - t0
+    log.info(
+        'pruned: %.1fs, %.1f%% of %s triplets scored from bounds, '
+        '%.1f%% of %s distances computed',
+        pruned,
+        100 * stats['pruned_triplets'] / max(stats['triplets'], 1),
+        stats['triplets'],
+        100 * stats['exact_pairs'] / max(stats['pairs'], 1),
+        stats['pairs'])
+    log.info(
+        'time saved: %.1fs (%.1f%%)', full - pruned,
+        100 * (full - pruned) / max(full, 1e-9))
+
+    if not np.array_equal(scores, expected):
+        log.error('the pruned scores differ')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""Checks the ABX scores computed on float32 features against float64
+
+Computes the ABX error rate of a features folder with float64 and float32
+features, and reports the difference and the memory used by the features.
+Exits with an error if the difference exceeds the tolerance, by default the
+one documented in zerospeech2020.evaluation.abx.FLOAT32_TOLERANCE.
+
+Example, on the english 120s subset of a 2017 track1 submission:
+
+    python benchmarks/float32_tolerance.py \\
+        submission/2017/track1/english/120s \\
+        $DATASET/2017/ABXTasks/english/120s/120s_byCtxt_acSpkr.abx
+
+"""
+
+import argparse
+import logging
+import sys
+import time
+
+from zerospeech2020.evaluation import abx, abx_engine
+
+
+def _features_size(features_path, year, dtype):
+    """Returns the size in bytes of the features once loaded"""
+    load_fun = abx._typed_loader(
+        {'2017': abx._load_features_2017,
+         '2019': abx._load_features_2019}[year], dtype)
+    features = abx_engine.load_features(features_path, load_fun)
+    return sum(feats.nbytes for _, feats in features.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('features', help='folder containing the features')
+    parser.add_argument('task', help='the ABX task file')
+    parser.add_argument(
+        '-y', '--year', default='2017', choices=['2017', '2019'])
+    parser.add_argument(
+        '-t', '--task-type', default='across', choices=['across', 'within'])
+    parser.add_argument(
+        '-d', '--distance', default='cosine',
+        choices=['cosine', 'KL', 'levenshtein'])
+    parser.add_argument(
+        '-e', '--abx-engine', default='native', choices=['abxpy', 'native'])
+    parser.add_argument('-j', '--njobs', type=int, default=1)
+    parser.add_argument(
+        '--tolerance', type=float, default=abx.FLOAT32_TOLERANCE,
+        help='''maximal absolute difference of the ABX error rates (in %%),
+        default to %(default)s''')
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='[%(levelname)s] %(message)s', level=logging.INFO)
+    log = logging.getLogger()
+
+    scores = {}
+    for dtype in ('float64', 'float32'):
+        t0 = time.time()
+        scores[dtype] = abx.abx(
+            args.features, args.year, args.task, args.task_type,
+            args.distance, True if args.distance == 'cosine' else None,
+            njobs=args.njobs, log=log, engine=args.abx_engine, dtype=dtype)
+        log.info(
+            '%s: ABX = %.4f%%, %.1fs, features use %.1f MB',
+            dtype, scores[dtype], time.time() - t0,
+            _features_size(args.features, args.year, dtype) / 2 ** 20)
+
+    delta = abs(scores['float64'] - scores['float32'])
+    log.info('difference = %.4f', delta)
+    if delta > args.tolerance:
+        log.error(
+            'float32 features are out of tolerance (%s)', args.tolerance)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
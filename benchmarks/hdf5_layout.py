@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""Compares storage layouts of the features file converted for ABXpy
+
+The features are written in the h5features format with the default layout
+(as ABXpy.misc.any2h5features.convert does) and with the layout used by the
+evaluation (see zerospeech2020.evaluation.abx.H5_COMPRESSION and
+H5_CHUNK_SIZE). For each layout are reported the size of the file (the bytes
+written in the temporary directory), the write time and the time to read the
+whole file (as done by each ABXpy distance job).
+
+The features are either a folder of 2017 features files, or random features
+mimicking a 120s subset.
+
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import h5features
+import numpy as np
+
+from zerospeech2020.evaluation import abx, abx_engine
+
+
+def _synthetic_features(directory, nfiles, nframes, ndims):
+    rng = np.random.default_rng(0)
+    for n in range(nfiles):
+        # posteriorgram-like features, with 4 significant digits as in usual
+        # submissions
+        feats = rng.dirichlet(np.ones(ndims) * 0.1, nframes)
+        times = 0.0125 + 0.01 * np.arange(nframes)
+        np.savetxt(
+            os.path.join(directory, f'{n}.txt'),
+            np.column_stack((times, feats)), fmt='%.4f')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        'features', nargs='?', default=None,
+        help='folder of 2017 features, default to synthetic features')
+    parser.add_argument(
+        '--synthetic', type=int, nargs=3, default=(100, 12000, 40),
+        metavar=('<files>', '<frames>', '<dims>'),
+        help='''size of the synthetic features, default to %(default)s
+        (about a 120s subset)''')
+    parser.add_argument(
+        '--dtype', default='float64', choices=['float64', 'float32'],
+        help='type of the features, default to %(default)s')
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        features_path = args.features
+        if not features_path:
+            features_path = os.path.join(tmp_dir, 'features')
+            os.makedirs(features_path)
+            _synthetic_features(features_path, *args.synthetic)
+
+        features = abx_engine.load_features(
+            features_path,
+            abx._typed_loader(abx._load_features_2017, args.dtype))
+
+        layouts = {
+            'default': {'compression': None, 'chunk_size': 'auto'},
+            'compact': {}}
+        for name, options in layouts.items():
+            h5_filename = os.path.join(tmp_dir, f'{name}.h5')
+
+            t0 = time.time()
+            abx._write_features(features, h5_filename, **options)
+            write_time = time.time() - t0
+
+            t0 = time.time()
+            h5features.Reader(h5_filename, 'features').read()
+            read_time = time.time() - t0
+
+            print(
+                f'{name}: {os.path.getsize(h5_filename) / 2 ** 20:.1f} MB, '
+                f'written in {write_time:.2f}s, read in {read_time:.2f}s')
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""Measures the startup time of the zerospeech2020 command-line tools
+
+Each command is run several times in a fresh interpreter and the median wall
+time is reported, along with the heaviest imports reported by
+`python -X importtime`.
+
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+
+COMMANDS = {
+    'import evaluation.main': [
+        '-c', 'import zerospeech2020.evaluation.main'],
+    'import validation.main': [
+        '-c', 'import zerospeech2020.validation.main'],
+    'zerospeech2020-evaluate --help': [
+        '-m', 'zerospeech2020.evaluation.main', '--help'],
+    'zerospeech2020-evaluate 2017-track2 --help': [
+        '-m', 'zerospeech2020.evaluation.main', '2017-track2', '--help'],
+    'zerospeech2020-validate --help': [
+        '-m', 'zerospeech2020.validation.main', '--help']}
+
+
+def _time(command, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable] + command, check=True,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def _heaviest_imports(command, n):
+    """Returns the `n` imports with the largest cumulated time (in us)"""
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime'] + command,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        universal_newlines=True).stderr
+
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not name.startswith('  '):  # top-level imports only
+            imports.append((int(cumulative), name.strip()))
+    return sorted(imports, reverse=True)[:n]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '-r', '--repeat', type=int, default=5, metavar='<int>',
+        help='number of runs of each command, default to %(default)s')
+    parser.add_argument(
+        '-n', '--imports', type=int, default=5, metavar='<int>',
+        help='number of heaviest imports to display, default to %(default)s')
+    args = parser.parse_args()
+
+    for name, command in COMMANDS.items():
+        print(f'{name}: {_time(command, args.repeat):.3f}s')
+        for cumulative, module in _heaviest_imports(command, args.imports):
+            print(f'    {cumulative / 1e6:.3f}s  {module}')
+
+
+if __name__ == '__main__':
+    main()
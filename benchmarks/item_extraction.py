@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""Compares the extraction of the ABX items from a dict and a feature store
+
+Extracts the features of all the items of an ABX task by scanning the
+timestamps of each file (features as a dict file -> (times, features)) and
+by binary search in the concatenated features (abx_engine.FeatureStore).
+Reports the time of both and checks the items features are identical.
+
+Example, on the english 120s subset of a 2017 track1 submission:
+
+    python benchmarks/item_extraction.py \\
+        submission/2017/track1/english/120s \\
+        $DATASET/2017/ABXTasks/english/120s/120s_byCtxt_acSpkr.abx
+
+"""
+
+import argparse
+import logging
+import sys
+import time
+
+import numpy as np
+
+from zerospeech2020.evaluation import abx, abx_engine, abx_task
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('features', help='folder containing the features')
+    parser.add_argument('task', help='the ABX task file')
+    parser.add_argument(
+        '-y', '--year', default='2017', choices=['2017', '2019'])
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='[%(levelname)s] %(message)s', level=logging.INFO)
+    log = logging.getLogger()
+
+    index = abx_task.load_task(args.task)
+    load_fun = {
+        '2017': abx._load_features_2017,
+        '2019': abx._load_features_2019}[args.year]
+    store = abx_engine.load_features(args.features, load_fun)
+    features = dict(store.items())
+    items = range(index.n_items)
+
+    t0 = time.time()
+    scanned = abx_engine.item_features(index, features, items)
+    log.info('scan: %s items in %.2fs', index.n_items, time.time() - t0)
+
+    t0 = time.time()
+    searched = abx_engine.item_features(index, store, items)
+    log.info('store: %s items in %.2fs', index.n_items, time.time() - t0)
+
+    if not all(np.array_equal(a, b) for a, b in zip(scanned, searched)):
+        log.error('the items features differ')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""Compares the ABX distances computed after or while reading the features
+
+Computes the distances of all the pairs in an ABX task with the native
+engine, first by reading all the features before computing the distances
+(abx_engine.load_features and compute_distances), then by reading the
+features in background threads while computing the distances
+(abx_engine.stream_distances). Reports the time of each stage and checks the
+distances are identical. With --verbose, the hit rate and bytes fetched of
+the items cache of the streamed distances are reported.
+
+Example, on the english 120s subset of a 2017 track1 submission:
+
+    python benchmarks/prefetch_pipeline.py \\
+        submission/2017/track1/english/120s \\
+        $DATASET/2017/ABXTasks/english/120s/120s_byCtxt_acSpkr.abx -j 4
+
+"""
+
+import argparse
+import logging
+import sys
+import time
+
+import numpy as np
+
+from zerospeech2020.evaluation import abx, abx_engine, abx_task
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('features', help='folder containing the features')
+    parser.add_argument('task', help='the ABX task file')
+    parser.add_argument(
+        '-y', '--year', default='2017', choices=['2017', '2019'])
+    parser.add_argument(
+        '-d', '--distance', default='cosine',
+        choices=['cosine', 'KL', 'levenshtein'])
+    parser.add_argument('-j', '--njobs', type=int, default=1)
+    parser.add_argument('-r', '--nreaders', type=int, default=2)
+    parser.add_argument(
+        '-c', '--cache-size', type=float, default=256,
+        help='size of the items features cache in Mo, default to %(default)s')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='[%(levelname)s] %(message)s',
+        level=logging.DEBUG if args.verbose else logging.INFO)
+    log = logging.getLogger()
+
+    index = abx_task.load_task(args.task)
+    load_fun = {
+        '2017': abx._load_features_2017,
+        '2019': abx._load_features_2019}[args.year]
+    distance = abx._DIST2FUN[args.distance]
+    normalized = True if args.distance == 'cosine' else None
+
+    t0 = time.time()
+    features = abx_engine.load_features(args.features, load_fun)
+    t1 = time.time()
+    sequential = abx_engine.compute_distances(
+        index, features, distance, normalized, njobs=args.njobs)
+    t2 = time.time()
+    log.info(
+        'read then compute: %.1fs (read %.1fs, compute %.1fs)',
+        t2 - t0, t1 - t0, t2 - t1)
+    del features
+
+    t0 = time.time()
+    streamed = abx_engine.stream_distances(
+        index, args.features, load_fun, distance, normalized,
+        njobs=args.njobs, nreaders=args.nreaders,
+        cache_size=args.cache_size, log=log)
+    log.info('streamed: %.1fs', time.time() - t0)
+
+    if not np.array_equal(sequential, streamed, equal_nan=True):
+        log.error('the streamed distances differ')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""Compares the track2 class file reading by tde and in-package
+
+Reads a 2017 track2 class file with tde.readers.disc_reader.Disc and with
+read_2017_classes, transcribing the fragments with the columnar gold phones
+as the native track2 engine does, reports the time of each and checks the
+discovered classes are identical.
+
+Example, on the mandarin class file of a 2017 track2 submission:
+
+    python benchmarks/read_classes.py \\
+        submission/2017/track2/mandarin.txt mandarin.wrd mandarin.phn
+
+"""
+
+import argparse
+import contextlib
+import io
+import logging
+import sys
+import time
+
+from tde.readers.disc_reader import Disc
+from tde.readers.gold_reader import Gold
+
+from zerospeech2020 import read_2017_classes
+from zerospeech2020.evaluation import track2_engine
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('class_file', help='the discovered classes')
+    parser.add_argument('wrd', help='the words gold file')
+    parser.add_argument('phn', help='the phones gold file')
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='[%(levelname)s] %(message)s', level=logging.INFO)
+    log = logging.getLogger()
+
+    gold = Gold(wrd_path=args.wrd, phn_path=args.phn)
+    phones = track2_engine.gold_intervals(gold)[1]
+
+    t0 = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        expected = Disc(args.class_file, gold)
+    log.info('tde: %.1fs', time.time() - t0)
+
+    t0 = time.time()
+    classes = read_2017_classes.read(args.class_file, unique=False)
+    t1 = time.time()
+    found = classes.to_disc(phones)
+    log.info(
+        'native: read %.1fs, transcribed %.1fs', t1 - t0, time.time() - t1)
+
+    # the order of Disc.intervals is arbitrary, as built from a set
+    if (found.clusters != expected.clusters
+            or set(found.intervals) != set(expected.intervals)):
+        log.error('the discovered classes differ')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""Compares the track2 interval metrics computed by tde and in-package
+
+Reads a 2017 track2 class file with the gold of its language, computes the
+boundary, coverage and token/type metrics with tde and with the columnar
+intervals of track2_engine, reports the time of both and checks the metrics
+are identical.
+
+Example, on the mandarin class file of a 2017 track2 submission:
+
+    python benchmarks/track2_intervals.py \\
+        submission/2017/track2/mandarin.txt mandarin.wrd mandarin.phn
+
+"""
+
+import argparse
+import logging
+import sys
+import time
+
+import numpy as np
+from tde.measures.boundary import Boundary
+from tde.measures.coverage import Coverage
+from tde.measures.token_type import TokenType
+from tde.readers.gold_reader import Gold
+
+from zerospeech2020.evaluation import evaluation_2017_track2, track2_engine
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('class_file', help='the discovered classes')
+    parser.add_argument('wrd', help='the words gold file')
+    parser.add_argument('phn', help='the phones gold file')
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='[%(levelname)s] %(message)s', level=logging.INFO)
+    log = logging.getLogger()
+
+    gold = Gold(wrd_path=args.wrd, phn_path=args.phn)
+    disc = evaluation_2017_track2._read_discovered(
+        args.class_file, '', gold, log)
+
+    t0 = time.time()
+    boundary = Boundary(gold, disc)
+    boundary.compute_boundary()
+    coverage = Coverage(gold, disc)
+    coverage.compute_coverage()
+    token_type = TokenType(gold, disc)
+    token_type.compute_token_type()
+    expected = [
+        boundary.precision, boundary.recall, boundary.fscore,
+        coverage.coverage, *token_type.precision, *token_type.recall,
+        *token_type.fscore, len(token_type.type_seen)]
+    log.info('tde: %.1fs', time.time() - t0)
+
+    t0 = time.time()
+    words, phones = track2_engine.gold_intervals(gold)
+    t1 = time.time()
+    intervals = track2_engine.DiscoveredIntervals.from_disc(disc, phones)
+    precision, recall, fscore, types = track2_engine.token_type(
+        words, phones, intervals)
+    found = [
+        *track2_engine.boundary(words, phones, intervals),
+        track2_engine.coverage(phones, intervals),
+        *precision, *recall, *fscore, types]
+    log.info(
+        'native: %.1fs (gold %.1fs, metrics %.1fs)',
+        time.time() - t0, t1 - t0, time.time() - t1)
+
+    if not np.array_equal(expected, found, equal_nan=True):
+        log.error('the metrics differ')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""Compares the NED computed by tde and by the in-package track2 engine
+
+Reads a 2017 track2 class file with the gold of its language, computes the
+NED with tde.measures.ned.Ned and with track2_engine.ned, reports the time of
+both and checks the NED and the number of pairs are the same.
+
+Example, on the mandarin class file of a 2017 track2 submission:
+
+    python benchmarks/track2_ned.py submission/2017/track2/mandarin.txt \\
+        mandarin.wrd mandarin.phn
+
+"""
+
+import argparse
+import logging
+import sys
+import time
+
+import numpy as np
+from tde.measures.ned import Ned
+from tde.readers.gold_reader import Gold
+
+from zerospeech2020.evaluation import evaluation_2017_track2, track2_engine
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('class_file', help='the discovered classes')
+    parser.add_argument('wrd', help='the words gold file')
+    parser.add_argument('phn', help='the phones gold file')
+    parser.add_argument(
+        '-m', '--max-pairs', type=int, default=None,
+        help='estimate the NED on at most that number of pairs per class')
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='[%(levelname)s] %(message)s', level=logging.INFO)
+    log = logging.getLogger()
+
+    gold = Gold(wrd_path=args.wrd, phn_path=args.phn)
+    disc = evaluation_2017_track2._read_discovered(
+        args.class_file, '', gold, log)
+
+    t0 = time.time()
+    ned = Ned(disc)
+    ned.compute_ned()
+    log.info(
+        'tde: NED = %.6f on %s pairs, %.1fs',
+        ned.ned, ned.n_pairs, time.time() - t0)
+
+    t0 = time.time()
+    value, n_pairs = track2_engine.ned(
+        disc.clusters, max_pairs=args.max_pairs)
+    log.info(
+        'native: NED = %.6f on %s pairs, %.1fs',
+        value, n_pairs, time.time() - t0)
+
+    if args.max_pairs is None and not (
+            n_pairs == ned.n_pairs
+            and np.isclose(value, ned.ned, rtol=1e-12, equal_nan=True)):
+        log.error('the NED differs')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
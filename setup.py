@@ -18,11 +18,12 @@ setuptools.setup(
     # include Python code and any file in zerospeech2020/share
     packages=setuptools.find_packages(),
     package_data={'zerospeech2020': [
+        'share/manifest.json.gz',
         'share/2017/track1/*',
         'share/2017/track2/*',
         'share/2019/english/*',
         'share/2019/surprise/*']},
-    zip_safe=True,
+    zip_safe=False,
 
     # the command-line scripts to export
     entry_points={'console_scripts': [
@@ -0,0 +1,186 @@
+"""Fixtures shared by the tests"""
+
+import itertools
+import json
+import os
+
+import numpy as np
+import pytest
+
+from zerospeech2020.evaluation import abx_task
+
+
+def write_index(directory, blocks):
+    """Writes a compiled ABX task in `directory`, returns its TaskIndex
+
+    Each block is a dict with the entries 'by' (the name of the by-block),
+    'items' (a list of (file, onset, offset, phone, speaker)) and 'triplets'
+    (a list of (A, B, X) indices in the block items). The regressors of a
+    triplet are the phones of A and B and the speakers of A and X, as in an
+    'across speaker' ABXpy task.
+
+    """
+    files = sorted({item[0] for block in blocks for item in block['items']})
+    regressors = ['phone_1', 'phone_2', 'speaker_1', 'speaker_2']
+    phones = sorted({i[3] for block in blocks for i in block['items']})
+    speakers = sorted({i[4] for block in blocks for i in block['items']})
+    labels = {
+        'phone_1': phones, 'phone_2': phones,
+        'speaker_1': speakers, 'speaker_2': speakers}
+
+    arrays = {name: [] for name in abx_task._ARRAYS}
+    n_items, n_pairs, n_triplets = 0, 0, 0
+    for block in blocks:
+        items = block['items']
+        triplets = np.asarray(block['triplets'], dtype=np.int64)
+        pairs = sorted({
+            tuple(sorted(pair)) for a, b, x in block['triplets']
+            for pair in ((a, x), (b, x))})
+        pair_index = {pair: n for n, pair in enumerate(pairs)}
+
+        arrays['item_offsets'].append(n_items)
+        arrays['pair_offsets'].append(n_pairs)
+        arrays['triplet_offsets'].append(n_triplets)
+        arrays['item_file'].append([files.index(i[0]) for i in items])
+        arrays['item_onset'].append([i[1] for i in items])
+        arrays['item_offset'].append([i[2] for i in items])
+        arrays['pair_items'].append(
+            np.asarray(pairs, dtype=np.int64).reshape(-1, 2) + n_items)
+        arrays['triplets'].append(triplets + n_items)
+        arrays['triplet_pairs'].append(np.asarray([
+            (pair_index[tuple(sorted((a, x)))] + n_pairs,
+             pair_index[tuple(sorted((b, x)))] + n_pairs)
+            for a, b, x in block['triplets']], dtype=np.int64))
+        arrays['triplet_regressors'].append(np.asarray([
+            (phones.index(items[a][3]), phones.index(items[b][3]),
+             speakers.index(items[a][4]), speakers.index(items[x][4]))
+            for a, b, x in block['triplets']], dtype=np.int32))
+
+        n_items += len(items)
+        n_pairs += len(pairs)
+        n_triplets += len(triplets)
+
+    arrays['item_offsets'].append(n_items)
+    arrays['pair_offsets'].append(n_pairs)
+    arrays['triplet_offsets'].append(n_triplets)
+
+    os.makedirs(directory, exist_ok=True)
+    for name in ('item_offsets', 'pair_offsets', 'triplet_offsets'):
+        np.save(os.path.join(directory, name + '.npy'),
+                np.asarray(arrays[name], dtype=np.int64))
+    for name, dtype in (
+            ('item_file', np.int32), ('item_onset', np.float64),
+            ('item_offset', np.float64), ('pair_items', np.int64),
+            ('triplets', np.int64), ('triplet_pairs', np.int64),
+            ('triplet_regressors', np.int32)):
+        np.save(os.path.join(directory, name + '.npy'), np.concatenate(
+            [np.asarray(a, dtype=dtype) for a in arrays[name]]))
+
+    with open(os.path.join(directory, 'index.json'), 'w') as fout:
+        json.dump({
+            'version': abx_task._INDEX_VERSION,
+            'bys': [block['by'] for block in blocks],
+            'files': files,
+            'regressors': regressors,
+            'labels': labels}, fout)
+    return abx_task.TaskIndex(directory)
+
+
+def make_blocks(n_files=4, n_contexts=3, seed=0):
+    """Returns the blocks of a random 'across speaker' task
+
+    Each file has a speaker and is cut in items of 0.1s, each item having a
+    phone and a context. The by-blocks are the contexts and the triplets are
+    all the (A, B, X) with phone(A) = phone(X) != phone(B), speaker(A) =
+    speaker(B) != speaker(X).
+
+    """
+    rng = np.random.default_rng(seed)
+    items = [
+        (f'f{f}', round(0.1 * n, 1), round(0.1 * n + 0.1, 1),
+         'ab'[rng.integers(2)], f's{f % 2}', int(rng.integers(n_contexts)))
+        for f in range(n_files) for n in range(8)]
+
+    blocks = []
+    for context in range(n_contexts):
+        block = [i[:5] for i in items if i[5] == context]
+        triplets = [
+            (a, b, x) for a, b, x in itertools.permutations(
+                range(len(block)), 3)
+            if block[a][3] == block[x][3] != block[b][3]
+            and block[a][4] == block[b][4] != block[x][4]]
+        if triplets:
+            blocks.append({
+                'by': str((f'c{context}',)),
+                'items': block,
+                'triplets': triplets})
+    return blocks
+
+
+def make_features(n_files=4, ndims=3, seed=0, low=0, high=1):
+    """Returns random features as file -> (times, features)
+
+    There is a frame every 10ms for 0.8s, the timestamps being the centers
+    of the frames.
+
+    """
+    rng = np.random.default_rng(seed)
+    times = np.arange(80) * 0.01 + 0.005
+    return {
+        f'f{f}': (times, rng.uniform(low, high, (len(times), ndims)))
+        for f in range(n_files)}
+
+
+def cosine(x, y):
+    """Cosine frame distances between the frames of x and y"""
+    x = x / np.linalg.norm(x, axis=1, keepdims=True)
+    y = y / np.linalg.norm(y, axis=1, keepdims=True)
+    return np.arccos(np.clip(x @ y.T, -1, 1)) / np.pi
+
+
+def dtw(x, y, frame_distance, normalized):
+    """Reference DTW with unit steps along one or both axes
+
+    When `normalized`, the cost of the best path is divided by its length.
+
+    """
+    costs = frame_distance(x, y)
+    n, m = costs.shape
+    cost = np.full((n + 1, m + 1), np.inf)
+    length = np.zeros((n + 1, m + 1))
+    cost[0, 0] = 0
+    for i in range(1, n + 1):
+        for j in range(1, m + 1):
+            previous = min(
+                (cost[i - 1, j], length[i - 1, j]),
+                (cost[i, j - 1], length[i, j - 1]),
+                (cost[i - 1, j - 1], length[i - 1, j - 1]))
+            cost[i, j] = previous[0] + costs[i - 1, j - 1]
+            length[i, j] = previous[1] + 1
+    return cost[n, m] / length[n, m] if normalized else cost[n, m]
+
+
+def dtw_cosine(x, y, normalized):
+    return dtw(x, y, cosine, normalized)
+
+
+@pytest.fixture
+def task_index(tmp_path):
+    """A compiled 'across speaker' ABX task, see make_blocks()"""
+    return write_index(str(tmp_path / 'index'), make_blocks())
+
+
+@pytest.fixture
+def features():
+    """The features of the files of the `task_index` fixture"""
+    return make_features()
+
+
+@pytest.fixture
+def features_path(tmp_path, features):
+    """The `features` fixture written as 2017 track1 features files"""
+    path = tmp_path / 'features'
+    path.mkdir()
+    for name, (times, feats) in features.items():
+        np.savetxt(str(path / f'{name}.txt'), np.column_stack((times, feats)))
+    return str(path)
@@ -0,0 +1,124 @@
+"""Tests of the ABX pipeline options with the native engine"""
+
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip('ABXpy')
+from zerospeech2020.evaluation import abx
+
+
+@pytest.fixture
+def native(monkeypatch, task_index):
+    """Runs abx.abx() with the native engine on the `task_index` fixture"""
+    monkeypatch.setattr(abx.abx_task, 'load_task', lambda task: task_index)
+
+    def run(features_path, distance='cosine', normalized=True, **options):
+        return abx.abx(
+            features_path, '2017', 'task.abx', 'across', distance,
+            normalized, **{'engine': 'native', **options})
+    return run
+
+
+def test_no_artifacts_without_work_dir(native, features_path, tmp_path,
+                                       monkeypatch):
+    temp = tmp_path / 'temp'
+    temp.mkdir()
+    monkeypatch.setattr(abx.tempfile, 'tempdir', str(temp))
+    monkeypatch.chdir(str(temp))
+
+    score = native(features_path)
+    assert 0 <= score <= 100
+    assert not os.listdir(str(temp))
+
+
+def test_work_dir_and_rescore(native, features_path, tmp_path):
+    work_dir = str(tmp_path / 'work')
+    score = native(features_path, work_dir=work_dir)
+
+    artifacts = abx._work_directory(
+        work_dir, 'task.abx', 'cosine', True, 'float64')
+    assert sorted(os.listdir(artifacts)) == [
+        'analyze.csv', 'distances.npy', 'scores.npy']
+
+    # the features are not needed to rescore
+    assert native(None, rescore_from=work_dir) == score
+
+
+def test_rescore_from_pruned_scores(native, features_path, tmp_path):
+    work_dir = str(tmp_path / 'work')
+    score = native(features_path, work_dir=work_dir, prune=True)
+    assert native(None, rescore_from=work_dir) == score
+
+
+def test_rescore_missing_artifacts(native, tmp_path):
+    os.makedirs(abx._work_directory(
+        str(tmp_path), 'task.abx', 'cosine', True, 'float64'))
+    with pytest.raises(ValueError, match='no ABX distances'):
+        native(None, rescore_from=str(tmp_path))
+
+
+@pytest.mark.parametrize('distance, normalized', [
+    ('cosine', True), ('cosine', False), ('KL', None)])
+def test_float32_tolerance(native, features_path, distance, normalized):
+    scores = {
+        dtype: native(features_path, distance, normalized, dtype=dtype)
+        for dtype in ('float64', 'float32')}
+    assert abs(scores['float64'] - scores['float32']) <= (
+        abx.FLOAT32_TOLERANCE)
+
+
+def test_float32_cache(native, features_path):
+    # the cached features (here parsed by a previous evaluation, as by the
+    # validation or the bitrate) are replaced by their float32 copy
+    features = {}
+    score = native(features_path, features=features)
+    assert all(feats.dtype == np.float64 for _, feats in features.values())
+
+    assert abs(native(features_path, features=features, dtype='float32')
+               - score) <= abx.FLOAT32_TOLERANCE
+    assert len(features) == 4
+    assert all(feats.dtype == np.float32 for _, feats in features.values())
+
+
+def test_load_features_2019(tmp_path):
+    # parsed as by the validation, single dimension features included
+    filename = str(tmp_path / 'a.txt')
+    with open(filename, 'w') as fout:
+        fout.write('1\n\n2\n3\n')
+    data = abx._load_features_2019(filename)
+    assert np.allclose(data['time'], [0, 0.5, 0.75])
+    assert data['features'].tolist() == [[1], [2], [3]]
+
+    with open(filename, 'w') as fout:
+        fout.write('1 2\n3\n')
+    with pytest.raises(ValueError, match='vector size changed'):
+        abx._load_features_2019(filename)
+
+
+@pytest.mark.parametrize('options, error', [
+    ({'compression': 'zip'}, "compression must be 'gzip' or 'lzf'"),
+    ({'compression': 12}, r'compression level must be in \[0, 9\]'),
+    ({'chunk_size': (0.001, 0.002)}, 'chunk size is below 8 Ko')])
+def test_write_features_errors(tmp_path, features, options, error):
+    h5_filename = str(tmp_path / 'features.h5')
+    with pytest.raises(ValueError, match=error):
+        abx._write_features(features, h5_filename, **options)
+
+
+def test_write_features(tmp_path, features):
+    h5_filename = str(tmp_path / 'features.h5')
+    abx._write_features(features, h5_filename, compression=4)
+    assert os.path.isfile(h5_filename)
+
+    (tmp_path / 'features.txt').write_text('not a HDF5 file')
+    with pytest.raises(ValueError, match='not a HDF5 file'):
+        abx._write_features(features, str(tmp_path / 'features.txt'))
+
+
+def test_invalid_h5_compression(features_path):
+    with pytest.raises(ValueError, match='h5 compression must be'):
+        abx.abx(
+            features_path, '2017', 'task.abx', 'across', 'cosine', True,
+            h5_compression='zip')
@@ -0,0 +1,143 @@
+"""Tests of the bound-based pruning of the ABX distances"""
+
+import numpy as np
+import pytest
+
+from zerospeech2020.evaluation import abx_bounds, abx_engine
+
+from conftest import cosine, dtw, make_blocks, make_features
+
+
+def kl(x, y):
+    """Kullback-Leibler divergences between the frames of x and y
+
+    This is negative when the frames are not probability distributions.
+
+    """
+    x, y = x[:, None, :], y[None, :, :]
+    return (x * np.log(x / y)).sum(axis=2)
+
+
+def euclidean(x, y):
+    """Euclidean distances between the frames of x and y"""
+    return np.sqrt(((x[:, None, :] - y[None, :, :]) ** 2).sum(axis=2))
+
+
+def signed(x, y):
+    """Signed frame distances, negative for features of opposite signs"""
+    return x @ y.T
+
+
+METRICS = {
+    'cosine': cosine, 'euclidean': euclidean, 'kl': kl, 'signed': signed}
+
+
+def _phone_features(low, high, noise=0.1):
+    """Features of the task_index fixture, each phone having its own frames
+
+    The frames of an item are those of its phone with some noise, so that
+    the bounds decide most of the triplets.
+
+    """
+    rng = np.random.default_rng(0)
+    phones = {p: rng.uniform(low, high, 3) for p in 'ab'}
+    features = make_features(low=low, high=high)
+    for block in make_blocks():
+        for name, onset, offset, phone, _ in block['items']:
+            times, feats = features[name]
+            frames = (times >= onset) & (times <= offset)
+            feats[frames] = np.clip(
+                phones[phone] + rng.normal(0, noise, (frames.sum(), 3)),
+                low, high)
+    return features
+
+
+@pytest.mark.parametrize('normalized', [True, False])
+@pytest.mark.parametrize('metric, low, high', [
+    ('cosine', 0, 1), ('cosine', -1, 1), ('euclidean', -10, 10)])
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+def test_pair_bounds(metric, low, high, normalized, dtype):
+    frame_distance = METRICS[metric]
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        x = rng.uniform(low, high, (rng.integers(1, 12), 3))
+        if rng.random() < 0.3:
+            # close items, the bounds being decided by the margin
+            y = x[np.sort(rng.integers(0, len(x), rng.integers(1, 12)))]
+            y += rng.normal(0, 10 ** rng.uniform(-9, -2), y.shape)
+        else:
+            y = rng.uniform(low, high, (rng.integers(1, 12), 3))
+        x, y = x.astype(dtype), y.astype(dtype)
+        lower, upper = abx_bounds.pair_bounds(
+            x, y, frame_distance, normalized)
+        assert lower <= dtw(x, y, frame_distance, normalized) <= upper
+
+
+def test_pair_bounds_cost():
+    # the bounds require O(N + M) frame distances, not the N x M matrix
+    sizes = []
+
+    def frame_distance(x, y):
+        sizes.append(x.shape[0] * y.shape[0])
+        return cosine(x, y)
+
+    x, y = make_features()['f0'][1][:50], make_features()['f1'][1][:40]
+    abx_bounds.pair_bounds(x, y, frame_distance, True)
+    assert sum(sizes) <= 2 * (50 + 40) + 8
+
+
+def test_pair_bounds_margin():
+    # identical items: the bounds are not exact, not even at zero
+    x = np.ones((4, 3))
+    lower, upper = abx_bounds.pair_bounds(x, x, cosine, True)
+    assert lower < 0 < upper
+
+
+def test_pair_bounds_negative():
+    # the KL divergence of non-distributions has negative frame distances
+    x = np.asarray([[0.9, 0.9], [0.2, 0.5]])
+    y = np.asarray([[0.1, 0.2], [0.8, 0.8]])
+    assert kl(x, y).min() < 0
+    assert abx_bounds.pair_bounds(x, y, kl, True) == (-np.inf, np.inf)
+
+    assert abx_bounds.pair_bounds(
+        np.asarray([[1.0]]), np.asarray([[np.nan]]), signed, True) == (
+            -np.inf, np.inf)
+
+
+@pytest.mark.parametrize('normalized', [True, False])
+@pytest.mark.parametrize('metric, low, high', [
+    ('cosine', 0, 1), ('cosine', -1, 1), ('euclidean', -1, 1),
+    ('signed', -1, 1)])
+def test_pruned_scores(task_index, metric, low, high, normalized):
+    frame_distance = METRICS[metric]
+
+    def distance(x, y, normalized):
+        return dtw(x, y, frame_distance, normalized)
+
+    features = abx_engine.FeatureStore(_phone_features(low, high))
+    expected = abx_engine.score(task_index, abx_engine.compute_distances(
+        task_index, features, distance, normalized))
+
+    scores, stats = abx_bounds.score(
+        task_index, features, distance, frame_distance, normalized)
+    assert np.array_equal(scores, expected)
+    assert stats['triplets'] == task_index.n_triplets
+    if metric in ('cosine', 'euclidean'):
+        assert stats['pruned_triplets'] > 0
+    if metric == 'signed':
+        assert stats['pruned_triplets'] == 0
+
+
+@pytest.mark.parametrize('distance', ['cosine'])
+def test_pruned_scores_abxpy(task_index, distance):
+    abx = pytest.importorskip('zerospeech2020.evaluation.abx')
+    features = abx_engine.FeatureStore(make_features(low=0.1, high=1))
+    normalized = True
+    expected = abx_engine.score(task_index, abx_engine.compute_distances(
+        task_index, features, abx._DIST2FUN[distance], normalized))
+
+    scores, _ = abx_bounds.score(
+        task_index, features, abx._DIST2FUN[distance],
+        abx._DIST2FRAMES[distance], normalized)
+    assert np.array_equal(scores, expected)
@@ -0,0 +1,277 @@
+"""Tests of the native ABX engine on small compiled tasks"""
+
+import logging
+
+import numpy as np
+import pandas
+import pytest
+
+from zerospeech2020.evaluation import abx_engine
+
+from conftest import dtw_cosine, make_blocks, write_index
+
+
+def _load(path):
+    data = np.loadtxt(path)
+    return {'time': data[:, 0], 'features': data[:, 1:]}
+
+
+def _expected_distances(index, features):
+    """The distance of each pair, computed one by one"""
+    items = abx_engine.item_features(index, features, range(index.n_items))
+    return np.asarray([
+        dtw_cosine(items[i], items[j], True) for i, j in index.pair_items])
+
+
+def test_feature_store(features):
+    store = abx_engine.FeatureStore(features)
+    assert sorted(store) == sorted(features)
+    assert len(store) == len(features)
+
+    times, feats = features['f1']
+    assert np.array_equal(store['f1'][0], times)
+    assert np.array_equal(store['f1'][1], feats)
+
+    frames = store.frames('f1', 0.1, 0.2)
+    assert np.array_equal(frames, feats[(times >= 0.1) & (times <= 0.2)])
+    assert np.shares_memory(frames, store.features)
+    assert not len(store.frames('f1', 0.5, 0.501))
+    with pytest.raises(KeyError):
+        store.frames('f9', 0, 1)
+
+
+def test_feature_store_unsorted_times():
+    times = np.asarray([0.3, 0.1, 0.2, 0.0])
+    feats = np.arange(8.).reshape(4, 2)
+    store = abx_engine.FeatureStore({'f': (times, feats)})
+    assert np.array_equal(store.frames('f', 0.05, 0.25), feats[[1, 2]])
+
+
+def test_item_features(task_index, features):
+    items = abx_engine.item_features(task_index, features, [0, 1])
+    store_items = abx_engine.item_features(
+        task_index, abx_engine.FeatureStore(features), [0, 1])
+    for item, from_store in zip(items, store_items):
+        assert item.shape == (10, 3)
+        assert np.array_equal(item, from_store)
+
+
+def test_item_features_errors(tmp_path, features):
+    block = {
+        'by': 'c0',
+        'items': [('f0', 0, 0.1, 'a', 's0'), ('f0', 0.1, 0.2, 'b', 's0'),
+                  ('f1', 0, 0.1, 'a', 's1'), ('f9', 0, 0.1, 'a', 's1'),
+                  ('f1', 0.8, 0.9, 'a', 's1')],
+        'triplets': [(0, 1, 2), (0, 1, 3), (0, 1, 4)]}
+    index = write_index(str(tmp_path / 'index'), [block])
+
+    with pytest.raises(ValueError, match='features not found for file f9'):
+        abx_engine.item_features(index, features, [3])
+    with pytest.raises(ValueError, match='no features found for file f1'):
+        abx_engine.item_features(
+            index, abx_engine.FeatureStore(features), [4])
+
+
+def test_item_cache(task_index, features):
+    store = abx_engine.FeatureStore(features)
+    item_size = abx_engine.item_features(task_index, store, [0])[0].nbytes
+
+    # room for 3 items
+    cache = abx_engine.ItemCache(size=3.5 * item_size / 2 ** 20)
+    for items in ([0, 1, 0], [2, 1], [3], [1, 0]):
+        found = cache.get(task_index, store, items)
+        for item, feats in zip(items, found):
+            expected = abx_engine.item_features(task_index, store, [item])[0]
+            assert np.array_equal(feats, expected)
+            # the cached features are owned copies
+            assert feats.flags['C_CONTIGUOUS'] and feats.flags['OWNDATA']
+            assert not np.shares_memory(feats, store.features)
+
+    # 0 is evicted by 3 (as 1 and 2 were used since), then fetched again
+    assert cache.stats() == {
+        'hits': 3, 'misses': 5, 'hit_rate': 3 / 8,
+        'bytes_fetched': 5 * item_size}
+    assert len(cache) == 3 and cache.nbytes == 3 * item_size
+
+
+def test_item_cache_too_small(task_index, features):
+    store = abx_engine.FeatureStore(features)
+    cache = abx_engine.ItemCache(size=0)
+    found = cache.get(task_index, store, [0, 1, 0])
+    assert np.array_equal(found[0], found[2])
+    assert len(cache) == 0 and cache.nbytes == 0
+    assert cache.stats()['misses'] == 2 and cache.stats()['hits'] == 1
+
+    with pytest.raises(ValueError, match='features not found'):
+        cache.get(task_index, {}, [1])
+
+
+@pytest.mark.parametrize('njobs', [1, 2])
+def test_compute_distances(task_index, features, njobs):
+    distances = abx_engine.compute_distances(
+        task_index, abx_engine.FeatureStore(features), dtw_cosine, True,
+        njobs=njobs)
+    assert np.allclose(
+        distances, _expected_distances(task_index, features))
+
+
+def test_pair_jobs(task_index, features):
+    # the jobs are yielded one at a time, each with the items of its pairs
+    store = abx_engine.FeatureStore(features)
+    pairs = np.arange(task_index.n_pairs)
+    jobs = abx_engine._pair_jobs(task_index, store, pairs, 2)
+    assert not isinstance(jobs, (list, tuple))
+
+    n_pairs = 0
+    for pair_items, feats in jobs:
+        items = np.asarray(task_index.pair_items[pairs[
+            n_pairs:n_pairs + len(pair_items)]])
+        for (i, j), (x, y) in zip(pair_items, items):
+            expected = abx_engine.item_features(task_index, store, [x, y])
+            assert np.array_equal(feats[i], expected[0])
+            assert np.array_equal(feats[j], expected[1])
+        n_pairs += len(pair_items)
+    assert n_pairs == task_index.n_pairs
+
+
+def test_compute_distances_subset(task_index, features):
+    pairs = np.arange(0, task_index.n_pairs, 3)
+    distances = abx_engine.compute_distances(
+        task_index, abx_engine.FeatureStore(features), dtw_cosine, True,
+        pairs=pairs)
+
+    expected = _expected_distances(task_index, features)
+    assert np.allclose(distances[pairs], expected[pairs])
+    assert np.isnan(np.delete(distances, pairs)).all()
+
+
+def test_compute_several_metrics(task_index, features):
+    store = abx_engine.FeatureStore(features)
+    distances = abx_engine.compute_distances(
+        task_index, store, [(dtw_cosine, True), (dtw_cosine, False)], None)
+    assert distances.shape == (task_index.n_pairs, 2)
+    for column, normalized in enumerate((True, False)):
+        assert np.array_equal(distances[:, column], (
+            abx_engine.compute_distances(
+                task_index, store, dtw_cosine, normalized)))
+
+
+@pytest.mark.parametrize('njobs, chunk_size', [(1, 1000), (2, 10)])
+def test_stream_distances(task_index, features, features_path, njobs,
+                          chunk_size):
+    expected = abx_engine.compute_distances(
+        task_index, abx_engine.load_features(features_path, _load),
+        dtw_cosine, True)
+    distances = abx_engine.stream_distances(
+        task_index, features_path, _load, dtw_cosine, True, njobs=njobs,
+        nreaders=2, prefetch=1, chunk_size=chunk_size)
+    assert np.array_equal(distances, expected)
+
+
+def test_stream_distances_cache(task_index, features_path, caplog):
+    # the blocks are split in jobs sharing items, fetched once if cached
+    log = logging.getLogger('test')
+    with caplog.at_level(logging.DEBUG, logger='test'):
+        abx_engine.stream_distances(
+            task_index, features_path, _load, dtw_cosine, True,
+            chunk_size=5, log=log)
+        abx_engine.stream_distances(
+            task_index, features_path, _load, dtw_cosine, True,
+            chunk_size=5, cache_size=0, log=log)
+    hits = [
+        float(record.getMessage().split('%')[0].split()[-1])
+        for record in caplog.records]
+    assert hits[0] > 0 and hits[1] == 0
+
+
+def test_score(tmp_path):
+    block = {
+        'by': 'c0',
+        'items': [('f0', 0, 0.1, 'a', 's0'), ('f0', 0.1, 0.2, 'b', 's0'),
+                  ('f1', 0, 0.1, 'a', 's1'), ('f1', 0.1, 0.2, 'b', 's1')],
+        'triplets': [(0, 1, 2), (1, 0, 3)]}
+    index = write_index(str(tmp_path / 'index'), [block])
+    pairs = [tuple(p) for p in np.asarray(index.pair_items)]
+    assert pairs == [(0, 2), (0, 3), (1, 2), (1, 3)]
+
+    def distances(**values):
+        return np.asarray([values[f'd{i}{j}'] for i, j in pairs], float)
+
+    # X closer to A, to B, and ties
+    assert list(abx_engine.score(index, distances(
+        d02=0.1, d12=0.5, d13=0.1, d03=0.5))) == [1, 1]
+    assert list(abx_engine.score(index, distances(
+        d02=0.5, d12=0.1, d13=0.5, d03=0.1))) == [-1, -1]
+    assert list(abx_engine.score(index, distances(
+        d02=0.2, d12=0.2, d13=0.1, d03=0.5))) == [0, 1]
+    assert list(abx_engine.score(index, distances(
+        d02=0.2, d12=0.2, d13=0.1, d03=0.5), triplets=[1])) == [1]
+
+
+def test_analyze(tmp_path):
+    items = [('f0', 0, 0.1, 'a', 's0'), ('f0', 0.1, 0.2, 'b', 's0'),
+             ('f1', 0, 0.1, 'a', 's1'), ('f1', 0.1, 0.2, 'b', 's1'),
+             ('f1', 0.2, 0.3, 'a', 's1')]
+    blocks = [
+        {'by': 'c0', 'items': items, 'triplets': [(0, 1, 2), (0, 1, 4)]},
+        {'by': 'c1', 'items': items[:4], 'triplets': [(1, 0, 3)]}]
+    index = write_index(str(tmp_path / 'index'), blocks)
+
+    table = abx_engine.analyze(index, np.asarray([1, 0, -1], dtype=np.int8))
+    assert list(table.columns) == [
+        'by', 'phone_1', 'phone_2', 'speaker_1', 'speaker_2', 'score', 'n']
+    assert table.to_dict('records') == [
+        {'by': 'c0', 'phone_1': 'a', 'phone_2': 'b', 'speaker_1': 's0',
+         'speaker_2': 's1', 'score': 0.75, 'n': 2},
+        {'by': 'c1', 'phone_1': 'b', 'phone_2': 'a', 'speaker_1': 's0',
+         'speaker_2': 's1', 'score': 0.0, 'n': 1}]
+
+    # on a subset of the triplets
+    table = abx_engine.analyze(
+        index, np.asarray([0, 1], dtype=np.int8), triplets=np.asarray([1, 2]))
+    assert list(table['score']) == [0.5, 1.0]
+    assert list(table['n']) == [1, 1]
+
+
+def test_sample_triplets(task_index):
+    cells = abx_engine._cells(task_index, np.arange(task_index.n_triplets))
+    sizes = np.bincount(cells)
+    assert sizes.max() > 2
+
+    sample = abx_engine.sample_triplets(task_index, 2)
+    assert np.array_equal(sample, np.unique(sample))
+    assert np.array_equal(
+        np.bincount(cells[sample], minlength=len(sizes)),
+        np.minimum(sizes, 2))
+    assert np.array_equal(
+        sample, abx_engine.sample_triplets(task_index, 2, seed=0))
+
+    everything = abx_engine.sample_triplets(task_index, sizes.max())
+    assert np.array_equal(everything, np.arange(task_index.n_triplets))
+
+
+def test_bootstrap(task_index):
+    triplets = abx_engine.sample_triplets(task_index, 3)
+    scores = np.ones(len(triplets), dtype=np.int8)
+    expected = abx_engine.analyze(task_index, scores, triplets)
+
+    tables = list(abx_engine.bootstrap(task_index, scores, triplets, 5))
+    assert len(tables) == 5
+    for table in tables:
+        # resampling within the cells keeps the cells and their size
+        pandas.testing.assert_frame_equal(table, expected)
+
+    scores = np.random.default_rng(0).choice([-1, 0, 1], len(triplets))
+    means = [
+        table['score'].mean() for table in abx_engine.bootstrap(
+            task_index, scores.astype(np.int8), triplets, 20)]
+    assert len(set(means)) > 1
+
+
+def test_empty_blocks_are_skipped(tmp_path, features):
+    blocks = make_blocks(n_contexts=8)
+    index = write_index(str(tmp_path / 'index'), blocks)
+    assert index.bys == [block['by'] for block in blocks]
+    assert np.array_equal(
+        np.diff(index.triplet_offsets),
+        [len(block['triplets']) for block in blocks])
@@ -0,0 +1,99 @@
+"""Tests of the incremental computation of the ABX distances"""
+
+import os
+
+import numpy as np
+import pytest
+
+from zerospeech2020.evaluation import abx_engine, abx_incremental
+
+from conftest import dtw_cosine
+
+
+# not replaced by the `computed` fixture
+_compute_distances = abx_engine.compute_distances
+
+
+def _load(path):
+    data = np.loadtxt(path)
+    return {'time': data[:, 0], 'features': data[:, 1:]}
+
+
+@pytest.fixture
+def computed(monkeypatch):
+    """The pairs computed by abx_engine.compute_distances() at each call"""
+    computed = []
+
+    def wrapper(index, features, distance, normalized, **kwargs):
+        pairs = kwargs.get('pairs')
+        computed.append(
+            np.arange(index.n_pairs) if pairs is None else np.asarray(pairs))
+        return _compute_distances(
+            index, features, distance, normalized, **kwargs)
+
+    monkeypatch.setattr(abx_engine, 'compute_distances', wrapper)
+    return computed
+
+
+def _full(index, features_path):
+    return _compute_distances(
+        index, abx_engine.load_features(features_path, _load),
+        dtw_cosine, True)
+
+
+def _incremental(index, features_path, state_dir):
+    return abx_incremental.compute_distances(
+        index, features_path, _load, dtw_cosine, True, state_dir)
+
+
+def test_incremental(task_index, features_path, tmp_path, computed):
+    state_dir = str(tmp_path / 'state')
+    expected = _full(task_index, features_path)
+
+    assert np.array_equal(
+        _incremental(task_index, features_path, state_dir), expected)
+    assert len(computed[0]) == task_index.n_pairs
+
+    # nothing changed
+    assert np.array_equal(
+        _incremental(task_index, features_path, state_dir), expected)
+    assert len(computed) == 1
+
+    # only the pairs with an item in f2 are computed again
+    filename = os.path.join(features_path, 'f2.txt')
+    data = np.loadtxt(filename)
+    data[:, 1:] = np.random.default_rng(1).uniform(size=data[:, 1:].shape)
+    np.savetxt(filename, data)
+    expected = _full(task_index, features_path)
+
+    assert np.array_equal(
+        _incremental(task_index, features_path, state_dir), expected)
+    files = np.asarray(task_index.item_file)[
+        np.asarray(task_index.pair_items)]
+    f2 = task_index.files.index('f2')
+    assert np.array_equal(
+        computed[1], np.where((files == f2).any(axis=1))[0])
+
+
+def test_incompatible_state(task_index, features_path, tmp_path, computed):
+    state_dir = str(tmp_path / 'state')
+    os.makedirs(state_dir)
+    np.save(os.path.join(state_dir, 'distances.npy'), np.zeros(3))
+    with open(os.path.join(state_dir, 'hashes.json'), 'w') as fout:
+        fout.write('{}')
+
+    # the state does not match the task, everything is computed
+    assert np.array_equal(
+        _incremental(task_index, features_path, state_dir),
+        _full(task_index, features_path))
+    assert len(computed[0]) == task_index.n_pairs
+    assert np.load(os.path.join(state_dir, 'distances.npy')).shape == (
+        task_index.n_pairs,)
+
+
+def test_missing_file(task_index, features_path, tmp_path):
+    state_dir = str(tmp_path / 'state')
+    _incremental(task_index, features_path, state_dir)
+    os.remove(os.path.join(features_path, 'f1.txt'))
+    with pytest.raises(ValueError):
+        _incremental(task_index, features_path, state_dir)
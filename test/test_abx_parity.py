@@ -0,0 +1,163 @@
+"""Parity of the native ABX engine with ABXpy on a real ABXpy task file
+
+The task is generated by ABXpy from an item file, compiled by abx_task and its
+triplets and pairs are compared to the ones expected from the items. The
+distances, scores and analyze tables of the native engine are then compared
+to the ones of ABXpy.
+
+"""
+
+import itertools
+
+import h5py
+import numpy as np
+import pandas
+import pytest
+
+pytest.importorskip('ABXpy.task')
+pytest.importorskip('tables')
+import ABXpy.task
+from ABXpy.analyze import analyze
+from ABXpy.distances.distances import compute_distances
+from ABXpy.score import score
+
+from zerospeech2020.evaluation import abx, abx_engine, abx_task
+
+from conftest import make_features
+
+
+def _items(n_files=4, n_contexts=2, seed=0):
+    """(file, onset, offset, phone, context, speaker) of items of 0.1s"""
+    rng = np.random.default_rng(seed)
+    return [
+        (f'f{f}', round(0.1 * n, 1), round(0.1 * n + 0.1, 1),
+         'ab'[rng.integers(2)], f'c{rng.integers(n_contexts)}', f's{f % 2}')
+        for f in range(n_files) for n in range(8)]
+
+
+def _expected_triplets(items):
+    """The triplets of an 'across speaker, by context' task"""
+    return sorted(
+        tuple((item[0], item[1]) for item in (a, b, x))
+        for a, b, x in itertools.permutations(items, 3)
+        if a[4] == b[4] == x[4] and a[3] == x[3] != b[3]
+        and a[5] == b[5] != x[5])
+
+
+def _triplets(index, triplets):
+    files = np.asarray(index.files)[np.asarray(index.item_file)]
+    onsets = np.round(np.asarray(index.item_onset), 1)
+    return sorted(
+        tuple((str(files[i]), float(onsets[i])) for i in triplet)
+        for triplet in np.asarray(triplets).tolist())
+
+
+@pytest.fixture(scope='module')
+def task(tmp_path_factory):
+    """An ABXpy task file, its compiled index and the features"""
+    directory = tmp_path_factory.mktemp('parity')
+    items = _items()
+    item_file = str(directory / 'items.item')
+    with open(item_file, 'w') as fout:
+        fout.write('#file onset offset #phone context speaker\n')
+        for item in items:
+            fout.write(' '.join(str(i) for i in item) + '\n')
+
+    task_file = str(directory / 'task.abx')
+    ABXpy.task.Task(
+        item_file, 'phone', by='context', across='speaker'
+    ).generate_triplets(task_file)
+
+    features_path = directory / 'features'
+    features_path.mkdir()
+    for name, (times, feats) in make_features().items():
+        np.savetxt(str(features_path / f'{name}.txt'),
+                   np.column_stack((times, feats)))
+
+    index = abx_task.load_task(
+        task_file, cache_dir=str(directory / 'cache'))
+    return {
+        'items': items, 'file': task_file, 'index': index,
+        'features': str(features_path), 'directory': directory}
+
+
+@pytest.fixture(scope='module')
+def distances(task):
+    """The distances computed by ABXpy and by the native engine"""
+    features_file = str(task['directory'] / 'features.h5')
+    distance_file = str(task['directory'] / 'distances.h5')
+    abx._convert(task['features'], features_file, abx._load_features_2017)
+    compute_distances(
+        features_file, 'features', task['file'], distance_file,
+        abx._DIST2FUN['cosine'], True, n_cpu=1)
+
+    native = abx_engine.compute_distances(
+        task['index'],
+        abx_engine.load_features(task['features'], abx._load_features_2017),
+        abx._DIST2FUN['cosine'], True)
+    with h5py.File(distance_file, 'r') as fdist:
+        abxpy = fdist['distances']['data'][:, 0].astype(np.float64)
+    return {'file': distance_file, 'native': native, 'abxpy': abxpy}
+
+
+def test_triplets(task):
+    index = task['index']
+    expected = _expected_triplets(task['items'])
+    assert index.n_triplets == len(expected)
+    assert _triplets(index, index.triplets) == expected
+
+
+def test_pairs(task):
+    # the AX and BX pairs of each triplet
+    index = task['index']
+    triplets = np.asarray(index.triplets)
+    pairs = np.asarray(index.pair_items)[np.asarray(index.triplet_pairs)]
+    for column, item in ((0, 0), (1, 1)):
+        assert np.array_equal(
+            np.sort(pairs[:, column], axis=1),
+            np.sort(triplets[:, [item, 2]], axis=1))
+
+
+def test_distances(distances):
+    # the pairs are not in the same order in ABXpy's distance file
+    assert not np.isnan(distances['abxpy']).any()
+    assert np.allclose(
+        np.sort(distances['native']), np.sort(distances['abxpy']))
+
+
+def test_score_analyze(task, distances):
+    directory = task['directory']
+    score(task['file'], distances['file'], str(directory / 'scores.h5'))
+    analyze(task['file'], str(directory / 'scores.h5'),
+            str(directory / 'analyze.csv'))
+    expected = pandas.read_csv(str(directory / 'analyze.csv'), sep='\t')
+
+    index = task['index']
+    table = abx_engine.analyze(
+        index, abx_engine.score(index, distances['native']))
+
+    columns = ['by'] + index.regressors
+    expected = expected.sort_values(columns).reset_index(drop=True)
+    table = table.sort_values(columns).reset_index(drop=True)
+    assert len(table) == len(expected)
+    for column in columns:
+        assert list(table[column].astype(str)) == list(
+            expected[column].astype(str))
+    assert np.array_equal(table['n'], expected['n'])
+    assert np.allclose(table['score'], expected['score'])
+
+    for task_type in ('across', 'within'):
+        assert np.isclose(
+            abx._average_frame(table.copy(), task_type),
+            abx._average(str(directory / 'analyze.csv'), task_type))
+
+
+@pytest.mark.parametrize('prune', [False, True])
+def test_engines(task, prune, tmp_path, monkeypatch):
+    monkeypatch.setenv('ZS2020_CACHE', str(tmp_path))
+    expected = abx.abx(
+        task['features'], '2017', task['file'], 'across', 'cosine', True,
+        engine='abxpy')
+    assert np.isclose(abx.abx(
+        task['features'], '2017', task['file'], 'across', 'cosine', True,
+        engine='native', prune=prune), expected)
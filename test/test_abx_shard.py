@@ -0,0 +1,82 @@
+"""Tests of the sharded ABX evaluation"""
+
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip('ABXpy')
+from zerospeech2020.evaluation import abx, abx_engine, abx_shard, abx_task
+
+from conftest import make_blocks, write_index
+
+
+@pytest.fixture
+def queue(tmp_path, features_path, monkeypatch):
+    """A work queue on the task of conftest.make_blocks()"""
+    monkeypatch.setattr(
+        abx_task, 'compile_task',
+        lambda task, directory: write_index(
+            directory, make_blocks(n_contexts=6)))
+    task = tmp_path / 'task.abx'
+    task.write_text('task')
+
+    queue_dir = str(tmp_path / 'queue')
+    abx_shard.prepare(
+        queue_dir, features_path, str(task), '2017', 'across', 'cosine',
+        True, 3)
+    return queue_dir
+
+
+def test_split(queue):
+    index = abx_task.TaskIndex(os.path.join(queue, 'index'))
+    shards = abx_shard._split(index, 3)
+    assert len(shards) == 3
+    assert sorted(by for shard in shards for by in shard) == list(
+        range(len(index.bys)))
+
+    # the largest shard is at most the largest block heavier than the others
+    npairs = np.diff(index.pair_offsets)
+    loads = [npairs[shard].sum() for shard in shards]
+    assert max(loads) - min(loads) <= npairs.max()
+
+    assert len(abx_shard._split(index, 100)) == len(index.bys)
+
+
+def test_shards(queue, features_path):
+    assert sorted(os.listdir(os.path.join(queue, 'todo'))) == [
+        '00000.json', '00001.json', '00002.json']
+    with pytest.raises(ValueError, match='3 shards are not done'):
+        abx_shard.merge(queue)
+
+    # an interrupted worker
+    assert abx_shard._claim(queue) == '00000'
+    abx_shard.requeue(queue)
+    assert not os.listdir(os.path.join(queue, 'running'))
+
+    assert abx_shard.work(queue) == ['00000', '00001', '00002']
+    assert abx_shard.work(queue) == []
+    score = abx_shard.merge(queue)
+
+    # identical to a single node evaluation
+    index = abx_task.TaskIndex(os.path.join(queue, 'index'))
+    distances = abx_engine.compute_distances(
+        index,
+        abx_engine.load_features(features_path, abx._load_features_2017),
+        abx._DIST2FUN['cosine'], True)
+    expected = abx_engine.analyze(index, abx_engine.score(index, distances))
+    assert score == abx._average_frame(expected.copy(), 'across')
+    assert os.path.isfile(os.path.join(queue, 'analyze.csv'))
+
+
+def test_prepare_errors(queue, features_path, tmp_path):
+    task = str(tmp_path / 'task.abx')
+    with pytest.raises(ValueError, match='already exists'):
+        abx_shard.prepare(
+            queue, features_path, task, '2017', 'across', 'cosine', True, 3)
+    with pytest.raises(ValueError, match='unknown distance'):
+        abx_shard.prepare(
+            str(tmp_path / 'other'), features_path, task, '2017', 'across',
+            'euclidean', True, 3)
+    with pytest.raises(ValueError, match='not an ABX queue directory'):
+        abx_shard.work(str(tmp_path))
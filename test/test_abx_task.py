@@ -0,0 +1,193 @@
+"""Tests of the compilation and caching of the ABX task files
+
+The real task files generated by ABXpy are checked in test_abx_parity.py, the
+task files here are written with the same layout from the blocks of
+conftest.make_blocks(), so that the compiled index can be compared with
+conftest.write_index().
+
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from zerospeech2020.evaluation import abx_task
+
+from conftest import make_blocks, write_index
+
+
+REGRESSORS = ['phone_1', 'phone_2', 'speaker_1', 'speaker_2']
+
+
+def _write_abx(task_file, blocks):
+    """Writes the blocks as an ABX task file in the ABXpy layout
+
+    The item indices in the task are not contiguous, the pairs are stored in
+    both orders and the labels of each block are in its own order, as
+    nothing in ABXpy guarantees otherwise.
+
+    """
+    import h5py
+    import pandas
+
+    triplets, by_index, pairs, tables = [], [], [], {}
+    with h5py.File(task_file, 'w') as fh:
+        fh['bys'] = np.asarray([b['by'] for b in blocks], dtype='S')
+        for n, block in enumerate(blocks):
+            ids = 1000 * n + 3 * np.arange(len(block['items']))
+            base = int(ids.max()) + 1
+            block_triplets = ids[
+                np.asarray(block['triplets'], dtype=np.int64).reshape(-1, 3)]
+
+            keys = set()
+            for a, b, x in block_triplets:
+                for i, j in ((a, x), (b, x)):
+                    i, j = sorted((i, j))[::1 if (i + j) % 2 else -1]
+                    keys.add(int(i + base * j))
+            fh.require_group('unique_pairs')
+            start = sum(len(p) for p in pairs)
+            pairs.append(sorted(keys))
+            fh['unique_pairs'].attrs[block['by']] = (
+                base, start, start + len(keys))
+
+            start = sum(len(t) for t in triplets)
+            triplets.append(block_triplets)
+            by_index.append((start, start + len(block_triplets)))
+
+            items = block['items']
+            values = {
+                'phone_1': [items[a][3] for a, _, _ in block['triplets']],
+                'phone_2': [items[b][3] for _, b, _ in block['triplets']],
+                'speaker_1': [items[a][4] for a, _, _ in block['triplets']],
+                'speaker_2': [items[x][4] for _, _, x in block['triplets']]}
+            group = fh.create_group(f'regressors/{block["by"]}')
+            group['indexed_datasets'] = np.asarray(REGRESSORS, dtype='S')
+            indexed = []
+            for regressor in REGRESSORS:
+                labels = sorted(set(values[regressor]), reverse=True)
+                group[f'indexes/{regressor}'] = np.asarray(labels, dtype='S')
+                indexed.append([labels.index(v) for v in values[regressor]])
+            group['indexed_data'] = np.asarray(indexed, dtype=np.int64).T
+
+            tables[block['by']] = pandas.DataFrame(
+                {'file': [i[0] for i in items],
+                 'onset': [float(i[1]) for i in items],
+                 'offset': [float(i[2]) for i in items]},
+                index=ids)
+
+        fh['triplets/data'] = np.concatenate(triplets)
+        fh['triplets/by_index'] = np.asarray(by_index, dtype=np.int64)
+        fh['unique_pairs/data'] = np.concatenate(pairs).reshape(-1, 1)
+
+    for by, table in tables.items():
+        table.to_hdf(task_file, key='feat_dbs/' + by, mode='a')
+
+
+def _triplet_items(index, what):
+    """The (file, onset) of the A, B and X items of each triplet"""
+    items = {
+        'triplets': np.asarray(index.triplets),
+        'pairs': np.asarray(index.pair_items)[
+            np.asarray(index.triplet_pairs)].reshape(-1, 4)}[what]
+    files = np.asarray(index.files)[np.asarray(index.item_file)]
+    onsets = np.asarray(index.item_onset)
+    return [
+        tuple((files[i], onsets[i]) for i in row) for row in items]
+
+
+@pytest.fixture
+def task_file(tmp_path):
+    pytest.importorskip('tables')
+    task_file = str(tmp_path / 'task.abx')
+    _write_abx(task_file, make_blocks())
+    return task_file
+
+
+def test_compile_task(task_file, tmp_path):
+    expected = write_index(str(tmp_path / 'expected'), make_blocks())
+    abx_task.compile_task(task_file, str(tmp_path / 'index'))
+    index = abx_task.TaskIndex(str(tmp_path / 'index'))
+
+    assert index.bys == expected.bys
+    assert index.files == expected.files
+    assert index.regressors == expected.regressors
+    assert index.labels == expected.labels
+    for name in ('item_offsets', 'item_file', 'item_onset', 'item_offset',
+                 'pair_offsets', 'triplet_offsets', 'triplets',
+                 'triplet_regressors'):
+        assert np.array_equal(getattr(index, name), getattr(expected, name))
+
+    # the pairs may be stored in any order, the AX and BX pairs of each
+    # triplet are the same items
+    assert index.n_pairs == expected.n_pairs
+    assert (
+        {frozenset(p) for p in np.asarray(index.pair_items).tolist()} ==
+        {frozenset(p) for p in np.asarray(expected.pair_items).tolist()})
+    pairs = [
+        (frozenset(r[:2]), frozenset(r[2:]))
+        for r in _triplet_items(index, 'pairs')]
+    triplets = _triplet_items(index, 'triplets')
+    assert pairs == [
+        (frozenset((a, x)), frozenset((b, x))) for a, b, x in triplets]
+
+
+def test_compile_task_errors(task_file, tmp_path):
+    directory = str(tmp_path / 'index')
+    with open(str(tmp_path / 'bad.abx'), 'w') as fout:
+        fout.write('not a task\n')
+    with pytest.raises(ValueError, match='failed to parse ABX task'):
+        abx_task.compile_task(str(tmp_path / 'bad.abx'), directory)
+    assert not os.path.exists(directory)
+
+    block = make_blocks()[0]
+    _write_abx(str(tmp_path / 'empty.abx'), [{**block, 'triplets': []}])
+    with pytest.raises(ValueError, match='ABX task has no triplets'):
+        abx_task.compile_task(str(tmp_path / 'empty.abx'), directory)
+    assert not os.path.exists(directory)
+
+
+def test_load_task_cache(tmp_path, monkeypatch):
+    expected = write_index(str(tmp_path / 'expected'), make_blocks())
+    compiled = []
+
+    def read_abx(task_file):
+        compiled.append(task_file)
+        arrays = {
+            name: np.asarray(getattr(expected, name)) for name in
+            abx_task._ARRAYS}
+        meta = {
+            'bys': expected.bys, 'files': expected.files,
+            'regressors': expected.regressors, 'labels': expected.labels}
+        return arrays, meta
+
+    monkeypatch.setattr(abx_task, '_read_abx', read_abx)
+    # bypass the in-memory cache to test the one on disk
+    load_task = abx_task.load_task.__wrapped__
+    cache_dir = str(tmp_path / 'cache')
+    task_file = str(tmp_path / 'task.abx')
+    with open(task_file, 'w') as fout:
+        fout.write('task')
+
+    index = load_task(task_file, cache_dir)
+    assert compiled == [task_file]
+    assert np.array_equal(index.triplets, expected.triplets)
+
+    # compiled once
+    assert load_task(task_file, cache_dir).directory == index.directory
+    assert len(compiled) == 1
+
+    # compiled again when the task changes or the index is outdated
+    with open(task_file, 'a') as fout:
+        fout.write('modified')
+    assert load_task(task_file, cache_dir).directory != index.directory
+    assert len(compiled) == 2
+
+    monkeypatch.setattr(abx_task, '_INDEX_VERSION', 0)
+    with pytest.raises(ValueError, match='outdated'):
+        abx_task.TaskIndex(index.directory)
+    load_task(task_file, cache_dir)
+    assert len(compiled) == 3
+
+    with pytest.raises(ValueError, match='not found'):
+        load_task(str(tmp_path / 'missing.abx'), cache_dir)
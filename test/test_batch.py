@@ -0,0 +1,56 @@
+"""Tests of the batch evaluation of several submissions"""
+
+import logging
+
+import pytest
+
+pytest.importorskip('ABXpy')
+pytest.importorskip('tde')
+from zerospeech2020.evaluation import batch
+
+
+def _track2_cell(score):
+    def evaluate(*args, log, abx_options):
+        return score
+    return evaluate
+
+
+def _failing_cell(exception):
+    def evaluate(*args, log, abx_options):
+        raise exception
+    return evaluate
+
+
+@pytest.mark.parametrize('exception, message', [
+    (ValueError('bad format'), 'bad format'),
+    (KeyError('s0101a'), "KeyError: 's0101a'"),
+    (OSError('unable to open file'), 'OSError: unable to open file'),
+    (AssertionError('tde failed'), 'AssertionError: tde failed')])
+def test_run_cell_catches_errors(exception, message):
+    result = batch._run_cell(
+        'submission', _failing_cell(exception), (), logging.getLogger(), None)
+    assert isinstance(result, ValueError)
+    assert str(result) == message
+
+
+def test_failing_cell_fails_its_submission_only(tmp_path, monkeypatch):
+    cells = {
+        'good': [
+            (('2017-track2', 'english'), _track2_cell({'ned': 0.5}), ()),
+            (('2017-track2', 'french'), _track2_cell({'ned': 0.25}), ())],
+        'bad': [
+            (('2017-track2', 'english'), _track2_cell({'ned': 0.5}), ()),
+            (('2017-track2', 'french'), _failing_cell(KeyError('x')), ())]}
+    monkeypatch.setattr(
+        batch, '_list_cells', lambda submission, *args: cells[submission])
+    monkeypatch.setattr(batch.utils, 'unzip_if_needed', lambda path, log: path)
+
+    scores = batch.evaluate(
+        {'good': 'good', 'bad': 'bad'}, None, str(tmp_path),
+        tracks=['2017-track2'])
+
+    assert scores['good'] == {
+        '2017-track2': {'english': {'ned': 0.5}, 'french': {'ned': 0.25}}}
+    assert scores['bad'] == {'error': "2017-track2/french: KeyError: 'x'"}
+    assert (tmp_path / 'good.json').is_file()
+    assert (tmp_path / 'results.tsv').is_file()
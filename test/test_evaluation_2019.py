@@ -0,0 +1,135 @@
+"""Tests of the scheduling of the 2019 evaluation jobs"""
+
+import logging
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip('ABXpy')
+from zerospeech2020.evaluation import evaluation_2019
+
+
+@pytest.fixture
+def submission(tmp_path):
+    for folder in ('test', 'auxiliary_embedding1'):
+        os.makedirs(str(tmp_path / '2019' / 'english' / folder))
+    return str(tmp_path)
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Runs the jobs in this process, records the bitrate and ABX calls"""
+    calls = {'bitrate': [], 'abx': [], 'n_jobs': []}
+
+    def parallel(n_jobs):
+        calls['n_jobs'].append(n_jobs)
+        return lambda jobs: [
+            function(*args, **kwargs) for function, args, kwargs in jobs]
+
+    def bitrate(features, language, cache=None):
+        calls['bitrate'].append(cache)
+        cache['a.txt'] = (np.zeros(1), np.zeros((1, 2)))
+        return 1.0
+
+    def abx_metrics(features_path, year, task, task_type, metrics, njobs=1,
+                    log=None, features=None, **kwargs):
+        calls['abx'].append((metrics, njobs, features))
+        return {distance: 10.0 for distance, _ in metrics}
+
+    monkeypatch.setattr(evaluation_2019.joblib, 'Parallel', parallel)
+    monkeypatch.setattr(evaluation_2019.bitrate, 'bitrate', bitrate)
+    monkeypatch.setattr(evaluation_2019.abx, 'abx_metrics', abx_metrics)
+    monkeypatch.setattr(
+        evaluation_2019.abx, 'get_tasks', lambda *args: {'english': None})
+    return calls
+
+
+FOLDERS = [('english', 'test'), ('english', 'auxiliary_embedding1')]
+
+
+@pytest.mark.parametrize('njobs', [1, 4])
+def test_bitrate_in_jobs(submission, calls, njobs):
+    # without validation, each job parses its folder for bitrate and ABX
+    results = evaluation_2019._evaluate_folders(
+        submission, 'dataset', FOLDERS, True, njobs,
+        logging.getLogger(), abx_options={'engine': 'native'})
+
+    assert calls['n_jobs'] == [min(njobs, 2)]
+    assert len(calls['bitrate']) == 2
+    for cache, (_, _, features) in zip(calls['bitrate'], calls['abx']):
+        assert features is cache and 'a.txt' in cache
+    assert results[('english', 'test')] == (1.0, {
+        'cosine': 10.0, 'KL': 10.0, 'levenshtein': 10.0})
+
+
+@pytest.mark.parametrize('njobs', [1, 4])
+def test_validated_features(submission, calls, njobs):
+    features = evaluation_2019.features_cache(submission, ['english'])
+    for cache in features.values():
+        cache['a.txt'] = (np.zeros(1), np.zeros((1, 2)))
+    caches = [
+        features[os.path.realpath(os.path.join(submission, '2019', *key))]
+        for key in FOLDERS]
+
+    evaluation_2019._evaluate_folders(
+        submission, 'dataset', FOLDERS, True, njobs,
+        logging.getLogger(), abx_options={'engine': 'native'},
+        features=features)
+
+    # the bitrate is computed here from the validated features, which are
+    # sent to the ABX jobs as memory maps when they run in worker processes
+    assert [id(c) for c in calls['bitrate']] == [id(c) for c in caches]
+    for cache, (_, _, abx_features) in zip(caches, calls['abx']):
+        if njobs == 1:
+            assert abx_features is cache
+        else:
+            assert list(abx_features) == ['a.txt']
+            for shared, array in zip(abx_features['a.txt'], cache['a.txt']):
+                assert isinstance(shared, np.memmap)
+                assert np.array_equal(shared, array)
+
+    # the evaluated folders are released
+    assert list(features) == [os.path.realpath(os.path.join(
+        submission, '2019', 'english', 'auxiliary_embedding2'))]
+
+
+def test_job_per_distance(submission, calls):
+    results = evaluation_2019._evaluate_folders(
+        submission, 'dataset', FOLDERS, True, 6,
+        logging.getLogger())
+
+    # one job per folder and distance, bitrate in the first one of a folder
+    assert calls['n_jobs'] == [6]
+    assert len(calls['abx']) == 6
+    assert len(calls['bitrate']) == 2
+    assert results[('english', 'auxiliary_embedding1')] == (1.0, {
+        'cosine': 10.0, 'KL': 10.0, 'levenshtein': 10.0})
+
+
+def test_shared_features(tmp_path):
+    # the workers map the features instead of receiving a copy
+    import joblib
+
+    cache = {'a.txt': (np.arange(3.), np.arange(6.).reshape(3, 2))}
+    shared = evaluation_2019._shared_features(cache, str(tmp_path / 'a'))
+
+    def job(features):
+        times, feats = features['a.txt']
+        return isinstance(feats, np.memmap), times.sum(), feats.sum()
+
+    assert joblib.Parallel(n_jobs=2)(
+        joblib.delayed(job)(shared) for _ in range(2)) == [(True, 3, 15)] * 2
+
+
+def test_worker_log():
+    # the workers log messages are not lost
+    import joblib
+
+    def job():
+        log = logging.getLogger()
+        evaluation_2019._configure_log(log, logging.DEBUG)
+        return log.getEffectiveLevel(), bool(logging.getLogger().handlers)
+
+    assert joblib.Parallel(n_jobs=2)(
+        joblib.delayed(job)() for _ in range(2)) == [(logging.DEBUG, True)] * 2
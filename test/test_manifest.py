@@ -0,0 +1,87 @@
+"""Tests of the manifest compiled from the file lists in share/"""
+
+import gzip
+import json
+import os
+
+import pytest
+
+from zerospeech2020 import manifest
+
+
+def _lines(*path):
+    with open(os.path.join(manifest._SHARE, *path), 'r') as fin:
+        return [line.strip() for line in fin if line.strip()]
+
+
+def test_manifest_is_up_to_date(tmp_path):
+    compiled = str(tmp_path / 'manifest.json.gz')
+    manifest.compile_manifest(output=compiled)
+    with gzip.open(compiled, 'rt') as fin:
+        expected = json.load(fin)
+    with gzip.open(os.path.join(
+            manifest._SHARE, 'manifest.json.gz'), 'rt') as fin:
+        assert json.load(fin) == expected
+
+
+def test_track1_files():
+    lines = _lines('2017', 'track1', 'english_filelist.txt')
+    files = manifest.load().track1_files('english', '10s')
+    assert files == sorted(
+        os.path.basename(line).replace('.wav', '.txt')
+        for line in lines if line.startswith('english/10s/'))
+
+    with pytest.raises(ValueError, match='unknown duration'):
+        manifest.load().track1_files('english', '2s')
+    with pytest.raises(ValueError, match='unknown language'):
+        manifest.load().track1_files('klingon', '1s')
+
+
+def test_track2_wavs():
+    lines = _lines('2017', 'track2', 'french_filelist.txt')
+    assert manifest.load().track2_wavs('french') == {
+        os.path.basename(line)[:-len('.wav')] for line in lines}
+
+
+@pytest.mark.parametrize('language', ['english', 'surprise'])
+def test_2019_files(language):
+    data = manifest.load()
+    embedding = [
+        line.split(' ') for line in _lines(
+            '2019', language, 'embedding_filelist.txt')]
+    bitrate = [
+        line.split(' ') for line in _lines(
+            '2019', language, 'bitrate_filelist.txt')]
+    required = [
+        os.path.basename(line) for line in _lines(
+            '2019', language, 'required_filelist.txt')]
+
+    assert list(data.embedding_files(language).items()) == [
+        (name, float(duration)) for name, duration in embedding]
+    assert list(data.bitrate_files(language).items()) == [
+        (name, float(duration)) for name, duration in bitrate]
+    assert data.test_wavs(language) == [
+        f for f in required if f.endswith('.wav')]
+    assert data.required_files(language) == set(required)
+
+
+def test_outdated_manifest(tmp_path):
+    filename = str(tmp_path / 'manifest.json.gz')
+    with gzip.open(filename, 'wt') as fout:
+        json.dump({'version': 0}, fout)
+    with pytest.raises(ValueError, match='outdated manifest'):
+        manifest.load(filename)
+    with pytest.raises(ValueError, match='cannot load manifest'):
+        manifest.load(str(tmp_path / 'missing.json.gz'))
+
+
+def test_compile_errors(tmp_path):
+    share = tmp_path / 'share'
+    for language in manifest._LANGUAGES_2017:
+        for track in ('track1', 'track2'):
+            (share / '2017' / track).mkdir(parents=True, exist_ok=True)
+            (share / '2017' / track / f'{language}_filelist.txt').write_text(
+                f'{language}/1s/0.wav\n{language}/1s/2.wav\n')
+
+    with pytest.raises(ValueError, match='not numbered from 0 to 1'):
+        manifest.compile_manifest(str(share), str(tmp_path / 'out.json.gz'))
@@ -0,0 +1,165 @@
+"""Tests of the reader of the 2017 track2 class files"""
+
+import contextlib
+import io
+
+import numpy as np
+import pytest
+
+from zerospeech2020 import read_2017_classes
+
+
+def _write(tmp_path, text):
+    class_file = str(tmp_path / 'classes.txt')
+    with open(class_file, 'w') as fout:
+        fout.write(text)
+    return class_file
+
+
+def test_read(tmp_path):
+    classes = read_2017_classes.read(_write(
+        tmp_path,
+        'Class 1\nf2 0.5 1.0\nf1 0.0 0.25\n\n'
+        'Class 2\n\n'
+        'Class 3 a b\nf1 0.25 0.5\n\n'))
+    assert len(classes) == 3
+    assert classes.names == ['1', '2', '3']
+    assert classes.bounds.tolist() == [0, 2, 2, 3]
+    assert classes.files == ['f1', 'f2']
+    assert classes.file_ids.tolist() == [1, 0, 0]
+    assert classes.onsets.tolist() == [0.5, 0.0, 0.25]
+    assert classes.offsets.tolist() == [1.0, 0.25, 0.5]
+
+
+@pytest.mark.parametrize('text, error', [
+    ('Class 1\nf1 0 1\n', 'must end with an empty line'),
+    ('\nClass 1\nf1 0 1\n\n', 'line 1: empty line before the first class'),
+    ('Class\nf1 0 1\n\n', 'line 1: missing class number'),
+    ('Class 1\nf1 0\n\n', 'line 2: wrong format: f1 0'),
+    ('Class 1\nf1 0 a\n\n', 'line 2: timestamp is not a number: a'),
+    ('Class 1\nf1 1 1\n\n', 'line 2: offset must be greater than onset'),
+    ('Class 1\nf1 0 1\n\nClass 1\nf1 1 2\n\n',
+     'line 6: two classes have the same number 1'),
+    ('Class 1\nf1 0 1\n\n\n', 'line 4: two classes have the same number 1'),
+    ('Class 1\nf9 0 1\n\n', 'f9 is not a valid wav')])
+def test_read_errors(tmp_path, text, error):
+    with pytest.raises(ValueError, match=error):
+        read_2017_classes.read(_write(tmp_path, text), wavs={'f1'})
+
+
+def test_read_not_unique(tmp_path):
+    # empty classes are not numbered
+    class_file = _write(
+        tmp_path, 'Class 1\n\nClass 1\nf1 0 1\n\nClass 2\nf1 1 2\n\n')
+    assert read_2017_classes.read(class_file).names == ['1', '1', '2']
+
+    class_file = _write(
+        tmp_path, 'Class 1\nf1 0 1\n\nClass 1\nf1 1 2\n\n')
+    assert read_2017_classes.read(
+        class_file, unique=False).names == ['1', '1']
+
+
+# ---------------------------------------------------------------------------
+# parity with tde.readers.disc_reader.Disc
+
+
+@pytest.fixture
+def gold(tmp_path):
+    tde = pytest.importorskip('tde.readers.gold_reader')
+
+    # phones shorter and longer than 60ms, with timestamps in ms
+    phones = [
+        ('SIL', 0.0, 0.2), ('a', 0.2, 0.25), ('b', 0.25, 0.31),
+        ('c', 0.31, 0.4), ('SPN', 0.4, 0.459), ('a', 0.459, 0.52),
+        ('b', 0.52, 0.7), ('SIL', 0.7, 0.8)]
+    (tmp_path / 'gold.phn').write_text(''.join(
+        f'{wav} {onset} {offset} {phone}\n' for wav in ('f1', 'f2')
+        for phone, onset, offset in phones))
+    (tmp_path / 'gold.wrd').write_text(''.join(
+        f'{wav} 0.2 0.4 abc\n{wav} 0.459 0.7 ab\n' for wav in ('f1', 'f2')))
+    return tde.Gold(
+        wrd_path=str(tmp_path / 'gold.wrd'),
+        phn_path=str(tmp_path / 'gold.phn'))
+
+
+def _disc(class_file, gold):
+    disc_reader = pytest.importorskip('tde.readers.disc_reader')
+    with contextlib.redirect_stdout(io.StringIO()):
+        return disc_reader.Disc(class_file, gold)
+
+
+def _to_disc(class_file, gold):
+    track2_engine = pytest.importorskip(
+        'zerospeech2020.evaluation.track2_engine')
+    return read_2017_classes.read(class_file, unique=False).to_disc(
+        track2_engine.gold_intervals(gold)[1])
+
+
+def _check_parity(class_file, gold):
+    expected = _disc(class_file, gold)
+    disc = _to_disc(class_file, gold)
+    assert disc.clusters == expected.clusters
+    assert sorted(disc.intervals) == sorted(expected.intervals)
+    return disc
+
+
+def test_boundary_phones(tmp_path, gold):
+    # the first and last phones are kept when the fragment overlaps half of
+    # them (below 60ms) or 30ms of them, just below or above the limits
+    fragments = [
+        (0.225, 0.4), (0.226, 0.4), (0.224, 0.4), (0.2, 0.28), (0.2, 0.279),
+        (0.2, 0.281), (0.37, 0.52), (0.371, 0.52), (0.369, 0.6),
+        (0.43, 0.49), (0.4295, 0.4885), (0.1, 0.2), (0.2, 0.459),
+        (0.0, 0.8), (0.0, 0.2), (0.69, 0.75), (0.3, 0.33), (0.8, 0.9)]
+    class_file = _write(tmp_path, ''.join(
+        f'Class {n}\nf1 {onset} {offset}\nf2 {onset} {offset}\n\n'
+        for n, (onset, offset) in enumerate(fragments)))
+    disc = _check_parity(class_file, gold)
+    # the fragments with no transcription are discarded
+    assert str(len(fragments) - 1) not in disc.clusters
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_random_fragments(tmp_path, gold, seed):
+    # overlapping fragments, repeated in several classes
+    rng = np.random.default_rng(seed)
+    fragments = []
+    with open(str(tmp_path / 'classes.txt'), 'w') as fout:
+        for n in range(20):
+            fout.write(f'Class {n}\n')
+            for _ in range(rng.integers(1, 6)):
+                if fragments and rng.random() < 0.2:
+                    wav, onset, offset = fragments[
+                        rng.integers(len(fragments))]
+                else:
+                    wav = rng.choice(['f1', 'f2'])
+                    onset = rng.integers(0, 850) / 1000
+                    offset = onset + rng.integers(1, 400) / 1000
+                    fragments.append((wav, onset, offset))
+                fout.write(f'{wav} {onset} {offset}\n')
+            fout.write('\n')
+    _check_parity(str(tmp_path / 'classes.txt'), gold)
+
+
+def test_same_number(tmp_path, gold):
+    # the classes whose fragments are all discarded are not numbered, as in
+    # Disc
+    class_file = _write(
+        tmp_path,
+        'Class 1\nf1 0.8 0.9\n\nClass 1\nf1 0.2 0.4\n\n'
+        'Class 2\n\nClass 2\nf2 0.2 0.4\n\n')
+    assert list(_check_parity(class_file, gold).clusters) == ['1', '2']
+
+    class_file = _write(
+        tmp_path,
+        'Class 1\nf1 0.2 0.4\n\nClass 1\nf1 0.8 0.9\n\n')
+    with pytest.raises(AssertionError, match='same number 1'):
+        _disc(class_file, gold)
+    with pytest.raises(ValueError, match='same number 1'):
+        _to_disc(class_file, gold)
+
+
+def test_file_not_in_gold(tmp_path, gold):
+    class_file = _write(tmp_path, 'Class 1\nf3 0.2 0.4\n\n')
+    with pytest.raises(ValueError, match='f3: file not found in gold'):
+        _to_disc(class_file, gold)
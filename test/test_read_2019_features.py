@@ -0,0 +1,57 @@
+"""Tests of the reader of the 2019 features files"""
+
+import numpy as np
+import pytest
+
+from zerospeech2020 import read_2019_features
+
+
+@pytest.mark.parametrize('content, times, features', [
+    ('1 2\n3 4\n', [0, 0.5], [[1, 2], [3, 4]]),
+    # blank lines are skipped but counted in the times
+    ('1 2\n\n3 4\n\n', [0, 0.5], [[1, 2], [3, 4]]),
+    # single dimension features
+    ('1\n2\n0\n', [0, 1 / 3, 2 / 3], [[1], [2], [0]])])
+def test_read_array(tmp_path, content, times, features):
+    filename = str(tmp_path / 'a.txt')
+    with open(filename, 'w') as fout:
+        fout.write(content)
+
+    found_times, found_features = read_2019_features.read_array(filename)
+    assert np.allclose(found_times, times)
+    assert found_features.tolist() == features
+    assert list(read_2019_features.read(filename)) == [
+        tuple(f) for f in features]
+
+
+@pytest.mark.parametrize('content, error', [
+    ('', 'File is empty'),
+    ('\n\n', 'File is empty'),
+    ('1 2\n3\n', 'vector size changed'),
+    ('1 a\n', 'Error coverting to float')])
+def test_read_array_errors(tmp_path, content, error):
+    filename = str(tmp_path / 'a.txt')
+    with open(filename, 'w') as fout:
+        fout.write(content)
+
+    with pytest.raises(read_2019_features.ReadZrsc2019Exception, match=error):
+        read_2019_features.read_array(filename)
+
+
+def test_read_entries_cache(tmp_path):
+    (tmp_path / 'a.txt').write_text('1 2\n3 4\n1 2\n')
+    (tmp_path / 'b.txt').write_text('5 6\n')
+
+    entries = [('a.txt', 1.0), ('b.txt', 0.5)]
+    expected = read_2019_features.read_entries(
+        entries, str(tmp_path), False, False)
+    cache = {}
+    assert read_2019_features.read_entries(
+        entries, str(tmp_path), False, False, cache=cache) == expected
+    assert sorted(cache) == ['a.txt', 'b.txt']
+
+    # the cached files are not read again
+    (tmp_path / 'a.txt').unlink()
+    assert read_2019_features.read_entries(
+        entries, str(tmp_path), False, False, cache=cache) == expected
+    assert dict(expected[0]) == {(1, 2): 2, (3, 4): 1, (5, 6): 1}
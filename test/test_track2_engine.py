@@ -0,0 +1,242 @@
+"""Parity tests of the native track2 engine with tde.measures"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip('tde')
+from tde.measures.boundary import Boundary
+from tde.measures.coverage import Coverage
+from tde.measures.ned import Ned
+from tde.measures.token_type import TokenType
+from tde.readers.disc_reader import Disc
+from tde.readers.gold_reader import Gold
+
+from zerospeech2020.evaluation import track2_engine
+
+
+# the timestamps are multiples of a power of 2, so that the overlaps of
+# intervals on the grid are exact and the ties between words are real ties
+STEP = 1 / 64
+
+
+def _write_gold(directory, files, seed):
+    """Writes a random gold with words of 1 to 3 phones between silences"""
+    rng = np.random.default_rng(seed)
+    phones, words = [], []
+    for name in files:
+        time = 0
+        for _ in range(rng.integers(2, 6)):
+            # a silence (or noise) then a word
+            duration = STEP * rng.integers(1, 8)
+            phones.append(
+                (name, time, time + duration, rng.choice(['SIL', 'SPN'])))
+            time += duration
+
+            onset, transcription = time, ''
+            for _ in range(rng.integers(1, 4)):
+                duration = STEP * rng.integers(1, 12)
+                phone = rng.choice(list('abcd'))
+                phones.append((name, time, time + duration, phone))
+                transcription += phone
+                time += duration
+            words.append((name, onset, time, transcription))
+        phones.append((name, time, time + STEP, 'SIL'))
+
+    for ext, intervals in (('phn', phones), ('wrd', words)):
+        with open(str(directory / f'gold.{ext}'), 'w') as fout:
+            fout.write(''.join(
+                f'{name} {onset} {offset} {label}\n'
+                for name, onset, offset, label in intervals))
+    return Gold(
+        wrd_path=str(directory / 'gold.wrd'),
+        phn_path=str(directory / 'gold.phn'))
+
+
+def _write_classes(directory, gold, seed, n_classes=12):
+    """Writes random discovered classes on the files of the gold"""
+    rng = np.random.default_rng(seed)
+    ends = {
+        name: max(interval.end for interval in tree)
+        for name, tree in gold.phones.items()}
+    files = sorted(ends)
+
+    intervals = []
+    with open(str(directory / 'classes.txt'), 'w') as fout:
+        for n in range(n_classes):
+            fout.write(f'Class {n}\n')
+            for _ in range(rng.integers(1, 7)):
+                if intervals and rng.random() < 0.2:
+                    # the same interval in several classes
+                    name, onset, offset = intervals[
+                        rng.integers(len(intervals))]
+                else:
+                    name = files[rng.integers(len(files))]
+                    onset = STEP * rng.integers(0, ends[name] / STEP)
+                    offset = onset + STEP * rng.integers(1, 40)
+                    intervals.append((name, onset, offset))
+                fout.write(f'{name} {onset} {offset}\n')
+            fout.write('\n')
+    return _read_disc(directory / 'classes.txt', gold)
+
+
+def _read_disc(class_file, gold):
+    return Disc(str(class_file), gold)
+
+
+def _check_parity(gold, disc):
+    words, phones = track2_engine.gold_intervals(gold)
+    intervals = track2_engine.DiscoveredIntervals.from_disc(disc, phones)
+
+    # NED
+    expected = Ned(disc)
+    expected.compute_ned()
+    ned, n_pairs = track2_engine.ned(disc.clusters)
+    assert n_pairs == expected.n_pairs
+    np.testing.assert_allclose(ned, expected.ned, rtol=1e-12)
+
+    # coverage
+    expected = Coverage(gold, disc)
+    expected.compute_coverage()
+    assert track2_engine.coverage(phones, intervals) == pytest.approx(
+        expected.coverage, rel=1e-12)
+
+    # boundary
+    expected = Boundary(gold, disc)
+    expected.compute_boundary()
+    precision, recall, fscore = track2_engine.boundary(
+        words, phones, intervals)
+    np.testing.assert_allclose(
+        [precision, recall], [expected.precision, expected.recall],
+        rtol=1e-12)
+    _check_fscore(fscore, precision, recall, lambda: expected.fscore)
+
+    # token and type
+    expected = TokenType(gold, disc)
+    expected.compute_token_type()
+    precision, recall, fscore, n_types = track2_engine.token_type(
+        words, phones, intervals)
+    np.testing.assert_allclose(precision, expected.precision, rtol=1e-12)
+    np.testing.assert_allclose(recall, expected.recall, rtol=1e-12)
+    assert n_types == len(expected.type_seen)
+    for n in range(2):
+        _check_fscore(
+            fscore[n], precision[n], recall[n],
+            lambda: expected.fscore[n])
+
+
+def _check_fscore(fscore, precision, recall, expected):
+    # tde fails when nothing is found, the fscore is then 0
+    if precision == 0 and recall == 0:
+        assert fscore == 0
+    else:
+        np.testing.assert_allclose(fscore, expected(), rtol=1e-12)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_parity(tmp_path, seed):
+    gold = _write_gold(tmp_path, ['f1', 'f2', 'f3'], seed)
+    _check_parity(gold, _write_classes(tmp_path, gold, seed))
+
+
+@pytest.fixture
+def gold(tmp_path):
+    # two words 'ab' and 'c' around silences, of the same duration
+    (tmp_path / 'gold.phn').write_text(
+        'f1 0.0 0.25 SIL\n'
+        'f1 0.25 0.5 a\n'
+        'f1 0.5 0.75 b\n'
+        'f1 0.75 1.0 SIL\n'
+        'f1 1.0 1.5 c\n'
+        'f1 1.5 1.75 SPN\n'
+        'f1 1.75 2.0 SIL\n')
+    (tmp_path / 'gold.wrd').write_text(
+        'f1 0.25 0.75 ab\n'
+        'f1 1.0 1.5 c\n')
+    return Gold(
+        wrd_path=str(tmp_path / 'gold.wrd'),
+        phn_path=str(tmp_path / 'gold.phn'))
+
+
+def _disc(tmp_path, gold, classes):
+    (tmp_path / 'classes.txt').write_text(''.join(
+        f'Class {n}\n' + ''.join(
+            f'f1 {onset} {offset}\n' for onset, offset in intervals) + '\n'
+        for n, intervals in enumerate(classes)))
+    return _read_disc(tmp_path / 'classes.txt', gold)
+
+
+def test_silences(tmp_path, gold):
+    # transcriptions made of silences only, or empty once the silences
+    # are removed for the NED
+    disc = _disc(tmp_path, gold, [
+        [(0.0, 0.25), (0.75, 1.0), (1.75, 2.0)],
+        [(1.5, 2.0), (0.0, 0.25)],
+        [(0.0, 0.5), (0.25, 0.75)]])
+    assert disc.clusters
+    _check_parity(gold, disc)
+
+
+def test_outside_transcription(tmp_path, gold):
+    # the intervals without transcription are ignored, with their class
+    # when all its intervals are
+    disc = _disc(tmp_path, gold, [
+        [(2.5, 3.0), (3.0, 3.5)],
+        [(0.25, 0.75), (1.0, 1.5), (2.5, 3.0)]])
+    assert list(disc.clusters) == ['1']
+    _check_parity(gold, disc)
+
+
+def test_ties(tmp_path, gold):
+    # intervals overlapping the same proportion of the words 'ab' and 'c'
+    disc = _disc(tmp_path, gold, [
+        [(0.5, 1.25), (0.625, 1.125)],
+        [(0.25, 1.5), (0.5, 1.25)]])
+    _check_parity(gold, disc)
+
+
+def test_tie_break(tmp_path):
+    # the interval overlaps half of the words x and y, both transcribed 'a',
+    # the word chosen by tde is the one of the second interval, counted once
+    (tmp_path / 'gold.phn').write_text(
+        'f1 0.0 0.25 SIL\nf1 0.25 0.75 a\nf1 0.75 1.0 SIL\n')
+    (tmp_path / 'gold.wrd').write_text('f1 0.25 0.5 x\nf1 0.5 0.75 y\n')
+    gold = Gold(
+        wrd_path=str(tmp_path / 'gold.wrd'),
+        phn_path=str(tmp_path / 'gold.phn'))
+    disc = _disc(tmp_path, gold, [[(0.375, 0.625), (0.5, 0.75)]])
+    _check_parity(gold, disc)
+
+    words, phones = track2_engine.gold_intervals(gold)
+    precision, _, _, _ = track2_engine.token_type(
+        words, phones, track2_engine.DiscoveredIntervals.from_disc(
+            disc, phones))
+    assert precision[0] == 0.5
+
+
+def test_no_pairs(tmp_path, gold):
+    disc = _disc(tmp_path, gold, [[(0.25, 0.75)], [(1.0, 1.5)]])
+    ned, n_pairs = track2_engine.ned(disc.clusters)
+    assert np.isnan(ned) and n_pairs == 0
+
+
+def test_ned_sampled(tmp_path):
+    gold = _write_gold(tmp_path, ['f1', 'f2', 'f3'], 0)
+    disc = _write_classes(tmp_path, gold, 0, n_classes=30)
+    expected = Ned(disc)
+    expected.compute_ned()
+
+    # enough pairs: the NED is exact
+    ned, n_pairs = track2_engine.ned(disc.clusters, max_pairs=100)
+    assert n_pairs == expected.n_pairs
+    assert ned == pytest.approx(expected.ned, rel=1e-12)
+
+    # the sampled NED is an estimate of the NED, on all the pairs
+    estimates = [
+        track2_engine.ned(disc.clusters, max_pairs=3, seed=seed)
+        for seed in range(200)]
+    assert all(n_pairs == expected.n_pairs for _, n_pairs in estimates)
+    assert np.mean([ned for ned, _ in estimates]) == pytest.approx(
+        expected.ned, abs=0.01)
+
+    with pytest.raises(ValueError, match='max_pairs must be a positive'):
+        track2_engine.ned(disc.clusters, max_pairs=0)
@@ -0,0 +1,70 @@
+"""Tests of the validation of the 2019 part"""
+
+import logging
+import os
+import wave
+
+import pytest
+
+from zerospeech2020.validation import submission_2019, submission_2020
+
+
+def _write_wav(filename, nframes=160):
+    with wave.open(filename, 'w') as fwav:
+        fwav.setnchannels(1)
+        fwav.setsampwidth(2)
+        fwav.setframerate(16000)
+        fwav.writeframes(b'\0\0' * nframes)
+
+
+@pytest.mark.parametrize('max_errors', [None, 5])
+def test_check_wavs_max_errors(tmp_path, max_errors):
+    wavs = [f'{n:03d}.wav' for n in range(200)]
+    _write_wav(str(tmp_path / wavs[0]))
+    for wav in wavs[1:]:
+        (tmp_path / wav).write_bytes(b'')
+
+    val = submission_2019.LanguageValidation(
+        'english', logging.getLogger(), njobs=1,
+        max_errors=max_errors)
+    val._check_wavs(str(tmp_path), wavs)
+
+    if max_errors is None:
+        assert len(val.errors) == 199
+    else:
+        assert max_errors <= len(val.errors) < 199
+    assert all('cannot read wav file 2019/english/' in e for e in val.errors)
+
+
+def test_max_errors_is_passed_to_2019(tmp_path, monkeypatch):
+    created = {}
+
+    class Submission2019:
+        def __init__(self, *args, **kwargs):
+            created.update(kwargs)
+
+        def validate(self):
+            pass
+
+    monkeypatch.setattr(submission_2020, 'Submission2019', Submission2019)
+    submission = submission_2020.Submission2020(str(tmp_path), max_errors=7)
+    submission._validate_2019(1)
+    assert created['max_errors'] == 7
+
+
+def test_features_cache(tmp_path):
+    for folder in ('test', 'other'):
+        (tmp_path / folder).mkdir()
+        (tmp_path / folder / 'a.txt').write_text('1 2\n3 4\n')
+
+    # only the directories listed in the cache are cached
+    features = {os.path.realpath(str(tmp_path / 'test')): {}}
+    val = submission_2019.LanguageValidation(
+        'english', logging.getLogger(), features)
+    for folder in ('test', 'other'):
+        val._check_embedding(str(tmp_path / folder), {'a.txt': 1.0})
+
+    assert list(features) == [os.path.realpath(str(tmp_path / 'test'))]
+    times, feats = features[os.path.realpath(str(tmp_path / 'test'))]['a.txt']
+    assert times.tolist() == [0, 0.5]
+    assert feats.tolist() == [[1, 2], [3, 4]]
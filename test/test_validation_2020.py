@@ -0,0 +1,83 @@
+"""Tests of the validation of a whole submission"""
+
+import os
+import threading
+
+import pytest
+
+from zerospeech2020.validation import submission_2020
+
+
+@pytest.fixture
+def validated(tmp_path, monkeypatch):
+    """Replaces the 2017 and 2019 validations, records their calls
+
+    The validations fail for the years in `errors` and wait on
+    `state['barrier']` when it is set.
+
+    """
+    calls = []
+    errors = set()
+    state = {'barrier': None}
+
+    def validation(year):
+        class Submission:
+            def __init__(self, submission, is_open_source, **kwargs):
+                self._kwargs = kwargs
+
+            def validate(self):
+                calls.append(
+                    (year, self._kwargs['njobs'], threading.current_thread()))
+                if state['barrier'] is not None:
+                    state['barrier'].wait()
+                if year in errors:
+                    raise ValueError(f'invalid {year}')
+        return Submission
+
+    monkeypatch.setattr(
+        submission_2020, 'Submission2017', validation('2017'))
+    monkeypatch.setattr(
+        submission_2020, 'Submission2019', validation('2019'))
+
+    (tmp_path / 'metadata.yaml').write_text(
+        'author: me\naffiliation: here\nopen source: true\n')
+    for year in ('2017', '2019'):
+        (tmp_path / year).mkdir()
+    return str(tmp_path), calls, errors, state
+
+
+def test_concurrent(validated):
+    submission, calls, _, state = validated
+
+    # each part waits for the other one, they must run at the same time
+    state['barrier'] = threading.Barrier(2, timeout=10)
+    submission_2020.Submission2020(submission, njobs=5).validate()
+    assert not state['barrier'].broken
+
+    # the jobs are shared, the 2017 part runs in the main thread
+    assert sorted((year, njobs) for year, njobs, _ in calls) == [
+        ('2017', 3), ('2019', 2)]
+    threads = {year: thread for year, _, thread in calls}
+    assert threads['2017'] is threading.main_thread()
+    assert threads['2019'] is not threading.main_thread()
+
+
+@pytest.mark.parametrize('year', ['2017', '2019'])
+def test_single_part(validated, year):
+    # a part validated alone has all the jobs
+    submission, calls, _, _ = validated
+    os.rmdir(os.path.join(submission, '2019' if year == '2017' else '2017'))
+    submission_2020.Submission2020(submission, njobs=4).validate()
+    assert [(y, njobs) for y, njobs, _ in calls] == [(year, 4)]
+
+
+@pytest.mark.parametrize('errors, message', [
+    ({'2017'}, 'invalid 2017'),
+    ({'2019'}, 'invalid 2019'),
+    ({'2017', '2019'}, 'invalid 2017; invalid 2019')])
+def test_errors_of_both_parts(validated, errors, message):
+    submission, calls, failing, _ = validated
+    failing.update(errors)
+    with pytest.raises(ValueError, match=message):
+        submission_2020.Submission2020(submission).validate()
+    assert len(calls) == 2
@@ -12,11 +12,16 @@ import tempfile
 import warnings
 
 import ABXpy
+import h5features
 from ABXpy.distance import default_distance, dtw_kl_distance, edit_distance
-from ABXpy.misc.any2h5features import convert
+from ABXpy.distances.metrics.cosine import cosine_distance
 from ABXpy.score import score
 from ABXpy.analyze import analyze
 
+from zerospeech2020 import read_2019_features
+from zerospeech2020.evaluation import (
+    abx_bounds, abx_engine, abx_incremental, abx_task)
+
 
 def get_tasks(dataset, year):
     """Return the paths to the ABX tasks file
@@ -127,6 +132,19 @@ def _add_surprise_tasks(dataset, year, tasks):
     return tasks
 
 
+def compile_tasks(dataset, log=logging.getLogger()):
+    """Compiles all the ABX tasks of the dataset for the native ABX engine
+
+    The compiled tasks are stored in abx_task.cache_directory(). Already
+    compiled tasks are not compiled again.
+
+    """
+    for year in ('2017', '2019'):
+        for task in get_tasks(dataset, year).values():
+            log.info('compiling %s', task)
+            abx_task.load_task(task)
+
+
 def _load_features_2017(file_path):
     """Get features and return dict giving time and features"""
     time = []
@@ -143,20 +161,57 @@ def _load_features_2017(file_path):
 
 
 def _load_features_2019(file_path):
-    # read file, get features and return dict giving time and features
-    time = []
-    features = []
-    with open(file_path, 'r') as fin:
-        data = fin.readlines()
-        for i, line in enumerate(data):
-            unit_data = line.strip('\n').split(' ')
-            if len(unit_data) == 1:
-                continue
-            time.append(i/(len(data)))
-            features.append([float(x) for x in unit_data])
-    time = np.array(time)
-    features = np.array(features)
-    return {'time': np.array(time), 'features': np.array(features)}
+    """Get features and return dict giving time and features
+
+    The file is parsed as by the validation (see
+    zerospeech2020.read_2019_features.read_array), so that the evaluated
+    features are the validated ones and can be shared between both.
+
+    """
+    try:
+        time, features = read_2019_features.read_array(file_path)
+    except read_2019_features.ReadZrsc2019Exception as err:
+        raise ValueError(f'invalid features file {file_path}: {err}')
+    return {'time': time, 'features': features}
+
+
+def _cached_loader(load_fun, features, dtype='float64'):
+    """Wraps a features loading function to use a cache of parsed features
+
+    The files not already in `features` are loaded with `load_fun` and added
+    to it. The features are cast to `dtype` before being cached, replacing
+    any cached features of another type, so that a single copy of them is
+    kept in memory.
+
+    """
+    load_fun = _typed_loader(load_fun, dtype)
+
+    def load(file_path):
+        filename = os.path.basename(file_path)
+        if filename not in features:
+            data = load_fun(file_path)
+            features[filename] = (data['time'], data['features'])
+        times, feats = features[filename]
+        if feats.dtype != dtype:
+            feats = np.asarray(feats, dtype=dtype)
+            features[filename] = (times, feats)
+        return {'time': times, 'features': feats}
+    return load
+
+
+def _typed_loader(load_fun, dtype):
+    """Wraps a features loading function to cast the features to `dtype`
+
+    The timestamps are not converted, they are compared to the onsets and
+    offsets of the ABX items and must keep their precision.
+
+    """
+    def load(file_path):
+        data = load_fun(file_path)
+        return {
+            'time': data['time'],
+            'features': np.asarray(data['features'], dtype=dtype)}
+    return load
 
 
 def _average(filename, task_type):
@@ -176,7 +231,15 @@ def _average(filename, task_type):
         better
 
     """
-    df = pandas.read_csv(filename, sep='\t')
+    return _average_frame(pandas.read_csv(filename, sep='\t'), task_type)
+
+
+def _average_frame(df, task_type):
+    """Compute ABX averaged score from an ABX analyze table
+
+    See _average() for details.
+
+    """
     if task_type == 'across':
         # aggregate on context
         groups = df.groupby(
@@ -197,24 +260,294 @@ def _average(filename, task_type):
     # aggregate on talker
     groups = df.groupby(['phone_1', 'phone_2'], as_index=False)
     df = groups['score'].mean()
-    average = df.mean()['score']
+    average = df['score'].mean()
 
     return (1.0 - average) * 100
 
 
+# number of bootstrap resamples used to estimate the confidence interval of
+# preview ABX scores
+_N_BOOTSTRAP = 200
+
+
+# storage layout of the features converted for ABXpy: a fast lossless
+# compression and chunks holding about the features of a single file (bounded
+# in Mo), as ABXpy reads the features of the items of a by-block one file at a
+# time
+H5_COMPRESSION = 'lzf'
+H5_CHUNK_SIZE = (0.008, 4)
+
+
+# size (in Mo) of the batches of features parsed and appended to the file
+# converted for ABXpy, this bounds the memory used by the conversion
+H5_BATCH_SIZE = 64
+
+
+# maximal difference (in points of ABX error rate) between the scores
+# computed on float32 and on float64 features, checked on the synthetic tasks
+# of the tests and measured on real features by benchmarks/float32_tolerance.py
+FLOAT32_TOLERANCE = 0.01
+
+
+_DIST2FUN = {
+    'cosine': default_distance,
+    'KL': dtw_kl_distance,
+    'levenshtein': edit_distance}
+
+
+# the frame distances of the DTW based distances, used to bound them. The
+# bounds require a metric, which the KL divergence is not.
+_DIST2FRAMES = {
+    'cosine': cosine_distance}
+
+
+def _abx_native(features_path, task, task_type, load_fun,
+                distance, normalized, njobs, log, state_dir=None,
+                prune=False, work_dir=None):
+    """Runs the ABX pipeline with the in-package engine
+
+    When `work_dir` is specified, the distances, scores and analyze table are
+    saved in it (only the scores and analyze table when pruning).
+
+    """
+    log.debug('loading ABX task ...')
+    index = abx_task.load_task(task)
+
+    if prune and distance in _DIST2FRAMES:
+        log.debug('loading features ...')
+        features = abx_engine.load_features(features_path, load_fun)
+
+        log.debug('computing abx score with pruned %s distances ...', distance)
+        scores, stats = abx_bounds.score(
+            index, features, _DIST2FUN[distance], _DIST2FRAMES[distance],
+            normalized, njobs=njobs)
+        log.info(
+            'DTW pruning: %.1f%% of %s triplets scored from bounds, '
+            '%.1f%% of %s distances computed',
+            100 * stats['pruned_triplets'] / max(stats['triplets'], 1),
+            stats['triplets'],
+            100 * stats['exact_pairs'] / max(stats['pairs'], 1),
+            stats['pairs'])
+        return _analyze(index, scores, task_type, work_dir)
+
+    if state_dir:
+        # a state for each version of the task, identified by its index
+        state_dir = os.path.join(state_dir, os.path.basename(index.directory))
+
+        log.debug('computing %s distances from %s ...', distance, state_dir)
+        distances = abx_incremental.compute_distances(
+            index, features_path, load_fun, _DIST2FUN[distance], normalized,
+            state_dir, njobs=njobs, log=log)
+    else:
+        # the features are read while the distances are computed
+        log.debug('computing %s distances ...', distance)
+        distances = abx_engine.stream_distances(
+            index, features_path, load_fun, _DIST2FUN[distance], normalized,
+            njobs=njobs, log=log)
+
+    if work_dir:
+        np.save(os.path.join(work_dir, 'distances.npy'), distances)
+
+    log.debug('computing abx score ...')
+    scores = abx_engine.score(index, distances)
+    return _analyze(index, scores, task_type, work_dir)
+
+
+def _analyze(index, scores, task_type, work_dir=None):
+    """Returns the ABX score, saving the scores and analyze in `work_dir`
+
+    Nothing is saved when `work_dir` is None.
+
+    """
+    analyze = abx_engine.analyze(index, scores)
+    if work_dir:
+        np.save(os.path.join(work_dir, 'scores.npy'), scores)
+        analyze.to_csv(
+            os.path.join(work_dir, 'analyze.csv'), sep='\t', index=False)
+    return _average_frame(analyze, task_type)
+
+
+def _work_directory(root, task, distance, normalized, dtype):
+    """Returns the directory of the artifacts of an ABX evaluation in `root`
+
+    There is a directory for each task and distance parameters.
+
+    """
+    return os.path.join(
+        root, os.path.splitext(os.path.basename(task))[0],
+        f'{distance}_{normalized}_{dtype}')
+
+
+def _rescore(work_dir, task, task_type, log):
+    """Runs the score, analyze and average stages on persisted artifacts
+
+    The distances are read from `work_dir`, as computed by ABXpy
+    (distance_<task_type>.h5, scored by ABXpy in a temporary directory) or
+    saved by the native engine (distances.npy). When no distances are
+    available (in pruning mode), the saved scores are used. `work_dir` is
+    not modified.
+
+    """
+    abxpy = os.path.join(work_dir, f'distance_{task_type}.h5')
+    if os.path.isfile(abxpy):
+        log.debug('rescoring distances from %s ...', abxpy)
+        temp_dir = tempfile.mkdtemp()
+        try:
+            return _score_analyze(task, abxpy, temp_dir, task_type)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    log.debug('loading ABX task ...')
+    index = abx_task.load_task(task)
+
+    native = os.path.join(work_dir, 'distances.npy')
+    saved = os.path.join(work_dir, 'scores.npy')
+    if os.path.isfile(native):
+        log.debug('rescoring distances from %s ...', native)
+        scores = abx_engine.score(index, np.load(native))
+    elif os.path.isfile(saved):
+        log.debug('rescoring scores from %s ...', saved)
+        scores = np.load(saved)
+    else:
+        raise ValueError(f'no ABX distances found in {work_dir}')
+
+    if scores.shape != (index.n_triplets,):
+        raise ValueError(f'ABX artifacts in {work_dir} do not match {task}')
+    return _average_frame(abx_engine.analyze(index, scores), task_type)
+
+
+def _abx_preview(features_path, task, task_type, load_fun,
+                 distance, normalized, preview, njobs, log):
+    """Runs an approximate ABX pipeline on a stratified sample of triplets"""
+    log.debug('loading ABX task ...')
+    index = abx_task.load_task(task)
+
+    # sample the triplets and get the pairs and files they need
+    triplets = abx_engine.sample_triplets(index, preview)
+    pairs = np.unique(index.triplet_pairs[triplets])
+    items = np.unique(index.pair_items[pairs])
+    files = set(index.files[f] for f in np.unique(index.item_file[items]))
+    log.debug(
+        'preview on %s triplets out of %s (%s pairs, %s files)',
+        len(triplets), index.n_triplets, len(pairs), len(files))
+
+    log.debug('loading features ...')
+    features = abx_engine.load_features(features_path, load_fun, files=files)
+
+    log.debug('computing %s distances ...', distance)
+    distances = abx_engine.compute_distances(
+        index, features, _DIST2FUN[distance], normalized,
+        njobs=njobs, pairs=pairs)
+
+    log.debug('computing abx score ...')
+    scores = abx_engine.score(index, distances, triplets)
+    abx_score = _average_frame(
+        abx_engine.analyze(index, scores, triplets), task_type)
+
+    log.debug('computing confidence interval ...')
+    estimates = [
+        _average_frame(analyze, task_type) for analyze in
+        abx_engine.bootstrap(index, scores, triplets, _N_BOOTSTRAP)]
+
+    return {
+        'score': float(abx_score),
+        'confidence_interval': [
+            float(e) for e in np.percentile(estimates, [2.5, 97.5])],
+        'triplets': int(len(triplets))}
+
+
+def _convert(features_path, h5_filename, load_fun,
+             compression=H5_COMPRESSION, batch_size=H5_BATCH_SIZE):
+    """Converts the features to the h5features format read by ABXpy
+
+    This replaces ABXpy.misc.any2h5features.convert, which loads all the
+    features in memory and uses the default h5features layout. The features
+    files are parsed and appended to `h5_filename` by batches of about
+    `batch_size` Mo, so that the memory used by the conversion does not
+    depend on the size of the features. See _write_features() for the
+    storage layout.
+
+    """
+    files = sorted(os.listdir(features_path))
+    if not files:
+        raise ValueError(f'no features found in {features_path}')
+    _write_features(
+        _batches(features_path, files, load_fun, batch_size), h5_filename,
+        compression=compression)
+
+
+def _batches(features_path, files, load_fun, batch_size):
+    """Yields the features of `files` by batches of about `batch_size` Mo"""
+    batch, size = {}, 0
+    for f in files:
+        data = load_fun(os.path.join(features_path, f))
+        batch[os.path.splitext(f)[0]] = (data['time'], data['features'])
+        size += data['features'].nbytes
+        if size >= batch_size * 2 ** 20:
+            yield batch
+            batch, size = {}, 0
+    if batch:
+        yield batch
+
+
+def _write_features(features, h5_filename,
+                    compression=H5_COMPRESSION, chunk_size=H5_CHUNK_SIZE):
+    """Writes features in the h5features format
+
+    Parameters
+    ----------
+    features (dict or iterable): filename -> (times, features), as returned
+        by abx_engine.load_features(), or an iterable of such dicts appended
+        one after the other to the file.
+
+    h5_filename (str): the h5features file to write
+
+    compression (str or int): 'lzf', 'gzip', a gzip level or None, see
+        h5features.Writer
+
+    chunk_size (tuple): (min, max) size of a chunk in Mo, the chunk size
+        being the median size of the features of a file (in the first batch)
+        within those bounds. 'auto' to let HDF5 choose the chunks.
+
+    """
+    batches = iter([features] if isinstance(features, dict) else features)
+    first = next(batches)
+
+    if chunk_size != 'auto':
+        chunk_size = float(np.clip(
+            np.median([feats.nbytes for _, feats in first.values()])
+            / 2 ** 20, *chunk_size))
+
+    # h5features reports invalid options and write failures as IOError
+    try:
+        with h5features.Writer(
+                h5_filename, chunk_size=chunk_size,
+                compression=compression) as writer:
+            writer.write(_data(first), 'features')
+            for batch in batches:
+                writer.write(_data(batch), 'features', append=True)
+    except IOError as err:
+        raise ValueError(f'cannot write features to {h5_filename}: {err}')
+
+
+def _data(features):
+    """Returns features as h5features.Data"""
+    return h5features.Data(
+        list(features.keys()),
+        [times for times, _ in features.values()],
+        [feats for _, feats in features.values()],
+        check=True)
+
+
 def _abx(features_path, temp_dir, task, task_type, load_fun,
-         distance, normalized, njobs, log):
+         distance, normalized, njobs, log, h5_compression=H5_COMPRESSION):
     """Runs the ABX pipeline"""
-    dist2fun = {
-        'cosine': default_distance,
-        'KL': dtw_kl_distance,
-        'levenshtein': edit_distance}
-
     # convert
     log.debug('loading features ...')
     features = os.path.join(temp_dir, 'features.h5')
     if not os.path.isfile(features):
-        convert(features_path, h5_filename=features, load=load_fun)
+        _convert(
+            features_path, features, load_fun, compression=h5_compression)
 
     # avoid annoying log message
     numexpr.set_num_threads(njobs)
@@ -225,7 +558,8 @@ def _abx(features_path, temp_dir, task, task_type, load_fun,
     distance_file = os.path.join(temp_dir, 'distance_{}.h5'.format(task_type))
     with warnings.catch_warnings():
         # inhibit some useless warnings about complex to float conversion
-        warnings.filterwarnings("ignore", category=np.ComplexWarning)
+        warnings.filterwarnings(
+            "ignore", category=abx_engine.COMPLEX_WARNING)
 
         # compute the distances
         ABXpy.distances.distances.compute_distances(
@@ -233,27 +567,160 @@ def _abx(features_path, temp_dir, task, task_type, load_fun,
             'features',
             task,
             distance_file,
-            dist2fun[distance],
+            _DIST2FUN[distance],
             normalized,
             n_cpu=njobs)
     sys.stdout = sys.__stdout__
 
     log.debug('computing abx score ...')
-    # score
-    score_file = os.path.join(temp_dir, 'score_{}.h5'.format(task_type))
+    return _score_analyze(task, distance_file, temp_dir, task_type)
+
+
+def _score_analyze(task, distance_file, output_dir, task_type):
+    """Runs the ABXpy score, analyze and average stages on distances
+
+    The score and analyze files are written in `output_dir`.
+
+    """
+    score_file = os.path.join(output_dir, 'score_{}.h5'.format(task_type))
     score(task, distance_file, score_file)
 
-    # analyze
-    analyze_file = os.path.join(temp_dir, 'analyze_{}.csv'.format(task_type))
+    analyze_file = os.path.join(output_dir, 'analyze_{}.csv'.format(task_type))
     analyze(task, score_file, analyze_file)
 
-    # average
-    abx_score = _average(analyze_file, task_type)
-    return abx_score
+    return _average(analyze_file, task_type)
+
+
+def _loader(year, features, dtype):
+    """Returns the features loading function used by abx()"""
+    # get the features loading function according to year
+    try:
+        load_fun = {
+            '2017': _load_features_2017,
+            '2019': _load_features_2019}[str(year)]
+    except KeyError:
+        raise ValueError(f'year must be 2017 or 2019, it is {year}')
+
+    if dtype not in ('float64', 'float32'):
+        raise ValueError(f'dtype must be float64 or float32, it is {dtype}')
+
+    # the cached features are cast in place, the bitrate computations sharing
+    # the cache are done before ABX on the raw values
+    if features is not None:
+        return _cached_loader(load_fun, features, dtype)
+    return _typed_loader(load_fun, dtype)
+
+
+def single_pass(abx_options):
+    """Returns True if abx_metrics() computes the distances in one pass
+
+    This is the case with the native engine, out of the preview, incremental,
+    pruning, work directory and rescoring modes.
+
+    """
+    abx_options = abx_options or {}
+    return (
+        abx_options.get('engine') == 'native'
+        and not abx_options.get('preview')
+        and not abx_options.get('incremental')
+        and not abx_options.get('prune')
+        and not abx_options.get('work_dir')
+        and not abx_options.get('rescore_from'))
+
+
+def abx_metrics(features_path, year, task, task_type, metrics,
+                njobs=1, log=logging.getLogger(), **abx_options):
+    """Run the ABX pipeline for several distances on the same features
+
+    When single_pass(abx_options) is True, each pair of the task is visited
+    once: the features of its items are fetched once and all the distances
+    are computed on them, giving a distances table per metric. Otherwise
+    abx() is run for each distance. The scores are the same in both cases.
+
+    Parameters
+    ----------
+    features_path (str): folder containing the features to evaluate.
+
+    year (str): must be '2017' or '2019' according to evaluated part of the
+        challenge.
+
+    task (str): path to the ABX task file
+
+    task_type (str): must be 'across' or 'within'.
+
+    metrics (list): the (distance, normalized) to evaluate, distance being
+        the name of a distance and normalized choosing to normalize or not
+        DTW distance.
+
+    njobs (int): the number of CPU cores to use.
+
+    log (logging.Logger): where to send log messages.
+
+    abx_options: the other options of abx()
+
+    Raises
+    ------
+    ValueError if anything goes wrong.
+
+    Returns
+    -------
+    scores (dict): distance -> ABX score, as returned by abx()
+
+    """
+    if not single_pass(abx_options):
+        return {
+            distance: abx(
+                features_path, year, task, task_type, distance, normalized,
+                njobs=njobs, log=log, **abx_options)
+            for distance, normalized in metrics}
+
+    for distance, _ in metrics:
+        if distance not in _DIST2FUN:
+            raise ValueError(f'unknown distance {distance}')
+    load_fun = _loader(
+        year, abx_options.get('features'),
+        abx_options.get('dtype', 'float64'))
+
+    log.debug('loading ABX task ...')
+    index = abx_task.load_task(task)
+
+    log.debug(
+        'computing %s distances ...',
+        ', '.join(distance for distance, _ in metrics))
+    distances = abx_engine.stream_distances(
+        index, features_path, load_fun,
+        [(_DIST2FUN[distance], normalized)
+         for distance, normalized in metrics],
+        None, njobs=njobs, log=log)
+
+    log.debug('computing abx scores ...')
+    return {
+        distance: _average_frame(abx_engine.analyze(
+            index, abx_engine.score(index, distances[:, n])), task_type)
+        for n, (distance, _) in enumerate(metrics)}
+
+
+def incremental_options(abx_options, *names):
+    """Returns `abx_options` with dedicated state and work directories
+
+    The 'incremental', 'work_dir' and 'rescore_from' directories in
+    `abx_options` (if any) are extended with the subdirectories `names`, so
+    that each evaluated features folder has its own incremental state and
+    artifacts.
+
+    """
+    abx_options = dict(abx_options or {})
+    for option in ('incremental', 'work_dir', 'rescore_from'):
+        if abx_options.get(option):
+            abx_options[option] = os.path.join(abx_options[option], *names)
+    return abx_options
 
 
 def abx(features_path, year, task, task_type, distance, normalized,
-        njobs=1, log=logging.getLogger()):
+        njobs=1, log=logging.getLogger(), engine='abxpy', preview=None,
+        features=None, dtype='float64', incremental=None,
+        h5_compression=H5_COMPRESSION, prune=False, work_dir=None,
+        rescore_from=None):
     """Run the ABX pipeline on the specified features
 
     Parameters
@@ -275,25 +742,131 @@ def abx(features_path, year, task, task_type, distance, normalized,
 
     log (logging.Logger): where to send log messages.
 
+    engine (str): 'abxpy' to run the ABXpy pipeline, or 'native' to use the
+        in-package engine working on compiled ABX tasks (see abx_task). The
+        native engine is checked against ABXpy in test/test_abx_parity.py.
+
+    preview (int): when specified, compute an approximate ABX score on a
+        stratified sample of at most `preview` triplets for each (context,
+        speaker, phone) cell, using the native engine. Only the distances
+        required by the sampled triplets are computed.
+
+    features (dict): a cache of parsed features as filename -> (times,
+        features). The features files in it are not read again and the other
+        ones are added to it.
+
+    dtype (str): the type of the features, 'float64' or 'float32'. Using
+        float32 halves the memory used by the features and the size of the
+        converted features file. The ABX scores change by less than
+        FLOAT32_TOLERANCE (0.01 point of error rate), see
+        benchmarks/float32_tolerance.py to check it on given features. The
+        cached `features` are replaced by their float32 copy.
+
+    incremental (str): with the native engine, directory where the features
+        files hashes and the pairs distances are saved. When evaluating the
+        same features folder again, only the distances of the pairs involving
+        a modified file are computed, giving the same score as a full
+        evaluation. Ignored in preview mode.
+
+    h5_compression (str or int): with the ABXpy engine, compression of the
+        features file converted for ABXpy: 'lzf' (fast), 'gzip' (smaller but
+        slower), a gzip level in [0, 9] or None.
+
+    prune (bool): with the native engine, compute lower and upper bounds of
+        the DTW distances and score the triplets decided by the bounds
+        without computing their distances (see abx_bounds). The scores are
+        identical to a full evaluation. Ignored for the KL and levenshtein
+        distances and in preview mode.
+
+    work_dir (str): directory where the artifacts of the evaluation are kept
+        (the features file converted for ABXpy, the distances, the scores
+        and the analyze table), in a subdirectory for each task and distance
+        parameters. Any previous artifacts in that subdirectory are
+        replaced. Ignored in preview mode.
+
+    rescore_from (str): a `work_dir` of a previous evaluation with the same
+        task and distance parameters. Only the score, analyze and average
+        stages are run on the distances saved in it, the features are not
+        read.
+
     Raises
     ------
     ValueError if anything goes wrong.
 
     Returns
     -------
-    abx_score (float): ABX error rate in [0, 100], lower is better
+    abx_score (float): ABX error rate in [0, 100], lower is better. In preview
+        mode, this is a dict with the approximate 'score', its 95%
+        bootstrap 'confidence_interval' and the number of sampled
+        'triplets'.
 
     """
-    # get the features loading function according to year
-    try:
-        load_fun = {
-            '2017': _load_features_2017,
-            '2019': _load_features_2019}[str(year)]
-    except KeyError:
-        raise ValueError(f'year must be 2017 or 2019, it is {year}')
+    if rescore_from:
+        return _rescore(
+            _work_directory(rescore_from, task, distance, normalized, dtype),
+            task, task_type, log)
+
+    load_fun = _loader(year, features, dtype)
+
+    if not (h5_compression in (None, 'lzf', 'gzip') or (
+            isinstance(h5_compression, int) and 0 <= h5_compression <= 9)):
+        raise ValueError(
+            f'h5 compression must be lzf, gzip, a gzip level in [0, 9] or '
+            f'None, it is {h5_compression}')
+
+    if preview:
+        return _abx_preview(
+            features_path,
+            task,
+            task_type,
+            load_fun,
+            distance,
+            normalized,
+            preview,
+            njobs,
+            log)
 
-    # compute the ABX score, work in a temporary directory
-    temp_dir = tempfile.mkdtemp()
+    # the artifacts are kept in a work directory replacing any previous one
+    if work_dir:
+        work_dir = _work_directory(
+            work_dir, task, distance, normalized, dtype)
+        if os.path.isdir(work_dir):
+            shutil.rmtree(work_dir)
+        os.makedirs(work_dir)
+
+    if engine == 'native':
+        if prune and incremental:
+            raise ValueError(
+                'pruning cannot be combined with incremental evaluation')
+
+        # a state for each distance parameters
+        state_dir = None
+        if incremental:
+            state_dir = os.path.join(
+                incremental, f'{distance}_{normalized}_{dtype}')
+
+        return _abx_native(
+            features_path,
+            task,
+            task_type,
+            load_fun,
+            distance,
+            normalized,
+            njobs,
+            log,
+            state_dir=state_dir,
+            prune=prune,
+            work_dir=work_dir)
+    elif engine != 'abxpy':
+        raise ValueError(f'engine must be abxpy or native, it is {engine}')
+    elif incremental:
+        raise ValueError('incremental evaluation requires the native engine')
+    elif prune:
+        raise ValueError('pruning requires the native engine')
+
+    # compute the ABX score, work in a temporary directory unless the
+    # artifacts are kept
+    temp_dir = work_dir or tempfile.mkdtemp()
     try:
         return _abx(
             features_path,
@@ -304,6 +877,8 @@ def abx(features_path, year, task, task_type, distance, normalized,
             distance,
             normalized,
             njobs,
-            log)
+            log,
+            h5_compression=h5_compression)
     finally:
-        shutil.rmtree(temp_dir)
+        if not work_dir:
+            shutil.rmtree(temp_dir)
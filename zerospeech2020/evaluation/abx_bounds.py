@@ -0,0 +1,298 @@
+"""Exact ABX scores with bound-based pruning of the DTW computations
+
+The score of a triplet (A, B, X) only depends on the sign of d(A, X) - d(B,
+X). For each pair, cheap lower and upper bounds of its DTW distance are
+computed without the matrix of the frames distances, from the distances of
+the frames to the mean frames of the items. The frame distance must be a
+metric (such as the angular cosine distance), the bounds relying on the
+triangle inequality: for any frames x_i and y_j and any pivot frame c,
+
+    |d(x_i, c) - d(y_j, c)| <= d(x_i, y_j) <= d(x_i, c) + d(y_j, c)
+
+For a pair (x, y) of N and M frames, the pivots being the mean frames of x
+and y:
+
+* a DTW path starts with (x_1, y_1), ends with (x_N, y_M) and visits every
+  other row of the matrix at least once, so its cost is at least d(x_1,
+  y_1) + d(x_N, y_M) plus, for each other row, a lower bound of d(x_i, y_j)
+  for all the frames y_j, plus the smallest of those lower bounds for each
+  of its remaining cells (and the same with the columns),
+* the DTW distance is the cost of the best path, so it is at most the cost
+  of the diagonal path, which visits every row once when N >= M (every
+  column once when M >= N), and so at most d(x_1, y_1) + d(x_N, y_M) plus
+  the upper bounds of the other cells of that path,
+* when normalized, the cost is divided by the length of the path, in
+  [max(N, M), N + M - 1].
+
+Those require O(N + M) frame distances, computed for the frames of an item
+and the mean frames of all the items it is paired with at once. The pairs
+having a negative (or NaN) frame distance are not bounded.
+
+A triplet is scored from the bounds when the bounds intervals of its AX and
+BX pairs do not overlap, the exact DTW being computed only for the pairs of
+the other triplets. The scores are thus identical to a full computation.
+
+"""
+
+import warnings
+
+import joblib
+import numpy as np
+
+from zerospeech2020.evaluation import abx_engine
+
+
+# margin on each frame distance (in units of the square root of the
+# features type resolution), so that the rounding errors of the frame
+# distances, computed differently by the bounds and by the DTW, cannot make
+# a bound wrong. It is relative to the largest frame distance above 1.
+_MARGIN = 4
+
+
+# number of items whose mean frames are given at once to the frame distance
+_BATCH_SIZE = 64
+
+
+def pair_bounds(x, y, frame_distance, normalized):
+    """Returns lower and upper bounds of the DTW distance between x and y
+
+    Parameters
+    ----------
+    x, y (numpy.array): the features of two items, as (n_frames, n_dims)
+
+    frame_distance (function): returns the (N, M) matrix of distances
+        between the frames of x and y, as used by the DTW. This must be a
+        metric.
+
+    normalized (bool): normalize or not the DTW distance
+
+    Returns
+    -------
+    lower, upper (float): the bounds of the DTW distance, (-inf, inf) when
+        some frame distances are negative (or NaN).
+
+    """
+    lower, upper = _bounds_job(
+        np.asarray([[0, 1]]), [x, y], frame_distance, normalized)[0]
+    return lower, upper
+
+
+def _segments(starts, lengths):
+    """Returns the concatenated indices [start, start + length)"""
+    ends = np.cumsum(lengths)
+    return (
+        np.repeat(np.asarray(starts) - ends + lengths, lengths)
+        + np.arange(ends[-1] if len(ends) else 0))
+
+
+def _pivot_distances(edges, features, frame_distance):
+    """Returns the frame distances used to bound the pairs
+
+    An edge (i, j) gives the distances of the frames of the item i to the
+    mean frame of the item j. Returns the distances of the frames of each
+    item to its own mean frame and the distances of each edge, both
+    concatenated, and the distances of the first and the last frames of the
+    items of each edge.
+
+    """
+    lengths = np.asarray([len(feats) for feats in features])
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    frames = np.concatenate(features)
+    endpoints = (frames[offsets[:-1]], frames[offsets[1:] - 1])
+    means = np.add.reduceat(frames, offsets[:-1]) / lengths[:, None]
+
+    own = np.empty(len(frames))
+    edge_offsets = np.concatenate(([0], np.cumsum(lengths[edges[:, 0]])))
+    distances = np.empty(edge_offsets[-1])
+    first, last = np.empty(len(edges)), np.empty(len(edges))
+
+    pivots = np.unique(edges[:, 1])
+    for batch in np.array_split(
+            pivots, int(np.ceil(len(pivots) / _BATCH_SIZE))):
+        in_batch = np.flatnonzero(np.isin(edges[:, 1], batch))
+        sources = edges[in_batch, 0]
+        columns = np.searchsorted(batch, edges[in_batch, 1])
+
+        # the frames of the batch items and of the items paired with them
+        items = np.union1d(sources, batch)
+        starts = np.zeros(len(features), dtype=int)
+        starts[items] = np.cumsum(lengths[items]) - lengths[items]
+        matrix = frame_distance(
+            frames[_segments(offsets[items], lengths[items])], means[batch])
+
+        own[_segments(offsets[batch], lengths[batch])] = matrix[
+            _segments(starts[batch], lengths[batch]),
+            np.repeat(np.arange(len(batch)), lengths[batch])]
+        distances[_segments(edge_offsets[in_batch], lengths[sources])] = (
+            matrix[_segments(starts[sources], lengths[sources]),
+                   np.repeat(columns, lengths[sources])])
+
+        rows = np.searchsorted(items, sources)
+        for frame, values in zip(endpoints, (first, last)):
+            values[in_batch] = frame_distance(
+                frame[items], frame[batch])[rows, columns]
+    return own, distances, edge_offsets, first, last
+
+
+def _gap(value, low, high):
+    """Returns the distance of `value` to the interval [low, high]"""
+    return np.maximum(0, np.maximum(value - high, low - value))
+
+
+def _bounds_job(pairs, features, frame_distance, normalized):
+    pairs = np.asarray(pairs).reshape(-1, 2)
+    n_pairs = len(pairs)
+    lengths = np.asarray([len(feats) for feats in features])
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+
+    # each pair gives an edge in both directions, the frames of the source
+    # item being compared to the mean frame of the pivot item
+    edges = np.concatenate((pairs, pairs[:, ::-1]))
+    reverse = np.concatenate(
+        (np.arange(n_pairs, 2 * n_pairs), np.arange(n_pairs)))
+    source, pivot = edges[:, 0], edges[:, 1]
+    with warnings.catch_warnings():
+        # inhibit some useless warnings about complex to float conversion
+        warnings.filterwarnings(
+            "ignore", category=abx_engine.COMPLEX_WARNING)
+
+        own, distances, edge_offsets, first, last = _pivot_distances(
+            edges, features, frame_distance)
+
+    # the distances of the frames of an item, and of the frames of the
+    # reverse edge, to a pivot lie in those intervals
+    own_min = np.minimum.reduceat(own, offsets[:-1])
+    own_max = np.maximum.reduceat(own, offsets[:-1])
+    edge_min = np.minimum.reduceat(distances, edge_offsets[:-1])
+    edge_max = np.maximum.reduceat(distances, edge_offsets[:-1])
+
+    # the frames of the source of each edge, but the first and last ones
+    # bounded by the endpoints
+    size = lengths[source]
+    index = np.arange(len(distances)) - np.repeat(edge_offsets[:-1], size)
+    inner = (index > 0) & (index < np.repeat(size, size) - 1)
+    to_pivot = distances
+    to_source = own[_segments(offsets[source], size)]
+
+    # a lower bound of the distance of each frame to the frames of the pivot,
+    # from both the pivot and the source mean frames
+    lower = np.maximum(
+        _gap(to_pivot, np.repeat(own_min[pivot], size),
+             np.repeat(own_max[pivot], size)),
+        _gap(to_source, np.repeat(edge_min[reverse], size),
+             np.repeat(edge_max[reverse], size)))
+
+    # the upper bound of the cells of the diagonal path, visiting each frame
+    # of the source once, valid when the source is the longest item
+    step = np.repeat(lengths[pivot] - 1, size)
+    diagonal = index * step // np.maximum(np.repeat(size, size) - 1, 1)
+    upper = np.minimum(
+        to_pivot + own[np.repeat(offsets[pivot], size) + diagonal],
+        to_source + distances[
+            np.repeat(edge_offsets[reverse], size) + diagonal])
+
+    # the pairs with a negative (or NaN) frame distance are not bounded
+    with np.errstate(invalid='ignore'):
+        invalid = ~(np.minimum(own_min[pivot], edge_min) >= 0)
+        invalid = invalid[:n_pairs] | invalid[n_pairs:] | ~(
+            np.minimum(first, last)[:n_pairs] >= 0)
+
+    nearest = np.minimum.reduceat(lower, edge_offsets[:-1])
+    lower = np.add.reduceat(np.where(inner, lower, 0), edge_offsets[:-1])
+    upper = np.add.reduceat(np.where(inner, upper, 0), edge_offsets[:-1])
+
+    # each bounded cell involves at most 3 frame distances
+    dtype = np.result_type(*{feats.dtype for feats in features})
+    resolution = np.sqrt(np.finfo(
+        dtype if np.issubdtype(dtype, np.floating) else np.float64).eps)
+    finite = np.concatenate((own, distances, first, last))
+    finite = finite[np.isfinite(finite)]
+    margin = 3 * _MARGIN * resolution * (
+        max(1.0, finite.max()) if len(finite) else 1.0)
+
+    # the endpoints are a single cell when both items have a single frame,
+    # a path visits at least those cells and one cell for each other frame
+    # of the source, any other cell costing at least `nearest`. Its length
+    # is between `shortest` and `longest`.
+    single = (size == 1) & (lengths[pivot] == 1)
+    endpoints = np.tile(first[:n_pairs] + np.where(
+        single[:n_pairs], 0, last[:n_pairs]), 2)
+    cells = np.where(size > 1, size, np.where(single, 1, 2))
+    shortest = np.maximum(size, lengths[pivot])
+    longest = size + lengths[pivot] - 1
+
+    lower = endpoints + lower - margin * cells
+    nearest = np.maximum(nearest - margin, 0)
+    if normalized:
+        lower = np.minimum(
+            (lower + (shortest - cells) * nearest) / shortest,
+            (lower + (longest - cells) * nearest) / longest)
+    else:
+        lower += (shortest - cells) * nearest
+
+    # the diagonal path has as many cells as the longest item
+    upper = np.where(
+        size >= lengths[pivot], endpoints + upper + margin * shortest, np.inf)
+    if normalized:
+        upper /= shortest
+
+    lower = np.maximum(lower[:n_pairs], lower[n_pairs:])
+    upper = np.minimum(upper[:n_pairs], upper[n_pairs:])
+    lower[invalid], upper[invalid] = -np.inf, np.inf
+    return np.stack((lower, upper), axis=1)
+
+
+def score(index, features, distance, frame_distance, normalized, njobs=1):
+    """Scores the triplets in the task, pruning the DTW computations
+
+    Parameters
+    ----------
+    index (TaskIndex): the compiled ABX task
+
+    features (FeatureStore): as returned by abx_engine.load_features()
+
+    distance (function): the DTW distance as distance(x, y, normalized)
+
+    frame_distance (function): the frame distances used by `distance`, as
+        frame_distance(x, y) returning a (N, M) matrix
+
+    normalized (bool): normalize or not the DTW distance
+
+    njobs (int): the number of CPU cores to use
+
+    Returns
+    -------
+    scores (numpy.array): the triplets scores, identical to
+        abx_engine.score() on the exact distances
+
+    stats (dict): the number of 'triplets' and 'pairs' in the task, of
+        'pruned_triplets' scored from the bounds and of 'exact_pairs' whose
+        DTW distance has been computed
+
+    """
+    pairs = np.arange(index.n_pairs)
+    bounds = np.concatenate(joblib.Parallel(n_jobs=njobs)(
+        joblib.delayed(_bounds_job)(
+            pair_items, feats, frame_distance, normalized)
+        for pair_items, feats in abx_engine._pair_jobs(
+            index, features, pairs, njobs)))
+    lower, upper = bounds[:, 0], bounds[:, 1]
+
+    triplet_pairs = np.asarray(index.triplet_pairs)
+    ax, bx = triplet_pairs[:, 0], triplet_pairs[:, 1]
+    closer_to_a = upper[ax] < lower[bx]
+    closer_to_b = upper[bx] < lower[ax]
+
+    scores = closer_to_a.astype(np.int8) - closer_to_b.astype(np.int8)
+    undecided = np.where(~(closer_to_a | closer_to_b))[0]
+    exact = np.unique(triplet_pairs[undecided])
+    if len(undecided):
+        distances = abx_engine.compute_distances(
+            index, features, distance, normalized, njobs=njobs, pairs=exact)
+        scores[undecided] = abx_engine.score(index, distances, undecided)
+
+    return scores, {
+        'triplets': int(index.n_triplets),
+        'pruned_triplets': int(index.n_triplets - len(undecided)),
+        'pairs': int(index.n_pairs),
+        'exact_pairs': int(len(exact))}
@@ -0,0 +1,650 @@
+"""In-package ABX engine working on compiled ABX tasks
+
+Implements the distances, score and analyze stages of the ABX pipeline on top
+of a compiled task (see zerospeech2020.evaluation.abx_task), so that the ABX
+task file is never parsed again once compiled. The frame-level distances are
+still the ones from ABXpy.
+
+"""
+
+import collections
+import collections.abc
+import concurrent.futures
+import logging
+import os
+import warnings
+
+import joblib
+import numpy as np
+import pandas
+
+
+# the warning about complex to float conversion, moved to numpy.exceptions
+# (and removed from the numpy namespace) in numpy 2.0
+COMPLEX_WARNING = getattr(np, 'exceptions', np).ComplexWarning
+
+
+def load_features(features_path, load_fun, files=None):
+    """Loads the feature files in `features_path`
+
+    Parameters
+    ----------
+    features_path (str): directory containing the features files
+
+    load_fun (function): loads a file, returns a dict with 'time' and
+        'features' entries (see abx._load_features_2017).
+
+    files (set): when specified, load only those files (given without
+        extension), default is to load all the files.
+
+    Returns
+    -------
+    features (FeatureStore): file name (without extension) -> (times,
+        features)
+
+    """
+    features = {}
+    for f in sorted(os.listdir(features_path)):
+        if files is not None and os.path.splitext(f)[0] not in files:
+            continue
+        data = load_fun(os.path.join(features_path, f))
+        features[os.path.splitext(f)[0]] = (data['time'], data['features'])
+    return FeatureStore(features)
+
+
+class FeatureStore(collections.abc.Mapping):
+    """Features of several files concatenated in contiguous arrays
+
+    The frames of all the files are stored in a single array, the frames of
+    a file being a slice of it given by the files offsets. The frames of an
+    item are found by binary search on the timestamps of its file, and
+    returned as a view on the store, with no copy.
+
+    The store is a mapping file name -> (times, features), as the dict it is
+    built from.
+
+    Parameters
+    ----------
+    features (dict): file name -> (times, features)
+
+    """
+    def __init__(self, features):
+        names = list(features)
+        times = [np.asarray(features[name][0]) for name in names]
+        feats = [np.asarray(features[name][1]) for name in names]
+
+        self._files = {name: n for n, name in enumerate(names)}
+        self.offsets = np.cumsum([0] + [len(t) for t in times])
+        self.times = np.concatenate(times) if names else np.zeros(0)
+        # files with no frames may have 1d features, they are skipped
+        self.features = (
+            np.concatenate([f for t, f in zip(times, feats) if len(t)])
+            if self.offsets[-1] else np.zeros((0, 0)))
+
+        # the binary search requires sorted timestamps, the others files are
+        # scanned
+        self._sorted = np.asarray(
+            [bool(np.all(np.diff(t) >= 0)) for t in times], dtype=bool)
+
+    def __getitem__(self, name):
+        frames = self._slice(self._files[name])
+        return self.times[frames], self.features[frames]
+
+    def __iter__(self):
+        return iter(self._files)
+
+    def __len__(self):
+        return len(self._files)
+
+    def _slice(self, n):
+        return slice(self.offsets[n], self.offsets[n + 1])
+
+    def frames(self, name, onset, offset):
+        """Returns the features of `name` with a timestamp in [onset, offset]
+
+        Raises a KeyError if the file is not in the store.
+
+        """
+        n = self._files[name]
+        frames = self._slice(n)
+        times = self.times[frames]
+        if not self._sorted[n]:
+            return self.features[frames][
+                np.where((times >= onset) & (times <= offset))[0]]
+
+        start = frames.start + np.searchsorted(times, onset, side='left')
+        stop = frames.start + np.searchsorted(times, offset, side='right')
+        return self.features[start:max(start, stop)]
+
+
+def item_features(index, features, items):
+    """Returns the features of the given items
+
+    The features of an item are the frames of its file with a timestamp
+    within [onset, offset], as in ABXpy.
+
+    Parameters
+    ----------
+    index (TaskIndex): the compiled ABX task
+
+    features (FeatureStore or dict): as returned by load_features(), or a
+        dict file name -> (times, features)
+
+    items (sequence): global indices of the items in the task
+
+    Raises
+    ------
+    ValueError if an item has no features
+
+    """
+    result = []
+    for item in items:
+        filename = index.files[index.item_file[item]]
+        onset, offset = index.item_onset[item], index.item_offset[item]
+        try:
+            if isinstance(features, FeatureStore):
+                frames = features.frames(filename, onset, offset)
+            else:
+                times, feats = features[filename]
+                frames = feats[
+                    np.where((times >= onset) & (times <= offset))[0]]
+        except KeyError:
+            raise ValueError(f'features not found for file {filename}')
+
+        if not len(frames):
+            raise ValueError(
+                f'no features found for file {filename} '
+                f'at time {onset}-{offset}')
+        result.append(frames)
+    return result
+
+
+class ItemCache:
+    """Bounded LRU cache of the items features
+
+    The features of an item are sliced from the features of its file (see
+    item_features) on the first request and kept as an owned C-contiguous
+    copy, the layout used by the DTW, until they are the least recently used
+    features of a full cache. As they are copies, the features of a file can
+    be released while some of its items are still cached.
+
+    Parameters
+    ----------
+    size (float): maximal size of the cached features in Mo
+
+    """
+    def __init__(self, size=256):
+        self._capacity = size * 2 ** 20
+        self._cache = collections.OrderedDict()
+        self._size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.bytes_fetched = 0
+
+    def __len__(self):
+        return len(self._cache)
+
+    @property
+    def nbytes(self):
+        """The size of the cached features in bytes"""
+        return self._size
+
+    def get(self, index, features, items):
+        """Returns the features of the given items, as item_features()
+
+        The items not in the cache are sliced from `features`.
+
+        """
+        items = [int(item) for item in items]
+        missing = [
+            item for item in dict.fromkeys(items) if item not in self._cache]
+        fetched = dict(zip(missing, (
+            np.array(feats, order='C')
+            for feats in item_features(index, features, missing))))
+        missing = set(missing)
+
+        # an item repeated in `items` is fetched once, even if not cached
+        result = []
+        for item in items:
+            if item in self._cache:
+                feats = self._cache[item]
+                self._cache.move_to_end(item)
+                self.hits += 1
+            elif item in missing:
+                feats = fetched[item]
+                missing.remove(item)
+                self.misses += 1
+                self.bytes_fetched += feats.nbytes
+                self._add(item, feats)
+            else:
+                feats = fetched[item]
+                self.hits += 1
+            result.append(feats)
+        return result
+
+    def _add(self, item, feats):
+        # features larger than the cache are not cached
+        if feats.nbytes > self._capacity:
+            return
+        self._cache[item] = feats
+        self._size += feats.nbytes
+        while self._size > self._capacity:
+            self._size -= self._cache.popitem(last=False)[1].nbytes
+
+    def stats(self):
+        """Returns the hits, misses, hit rate and bytes fetched"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / max(self.hits + self.misses, 1),
+            'bytes_fetched': self.bytes_fetched}
+
+
+def compute_distances(index, features, distance, normalized,
+                      njobs=1, pairs=None):
+    """Computes the distances between the items of the pairs in the task
+
+    Parameters
+    ----------
+    index (TaskIndex): the compiled ABX task
+
+    features (FeatureStore): as returned by load_features()
+
+    distance (function or list): the distance to use as distance(x, y,
+        normalized), or a list of (distance, normalized) to compute several
+        metrics in a single visit of each pair.
+
+    normalized (bool): normalize or not the DTW distance, ignored when
+        `distance` is a list.
+
+    njobs (int): the number of CPU cores to use
+
+    pairs (numpy.array): sorted global indices of the pairs to compute,
+        default is to compute all the pairs of the task.
+
+    Returns
+    -------
+    distances (numpy.array): the distance of each pair in the task, NaN for
+        the pairs not in `pairs`. When `distance` is a list, this is a
+        (n_pairs, n_metrics) array with a column per metric.
+
+    """
+    if pairs is None:
+        pairs = np.arange(index.n_pairs)
+
+    # the jobs results are in the order of the scheduled pairs
+    pairs = np.asarray(pairs)[_schedule(index, pairs, _n_chunks(pairs, njobs))]
+
+    distances = _empty(index.n_pairs, distance)
+    distances[pairs] = np.concatenate(joblib.Parallel(n_jobs=njobs)(
+        joblib.delayed(_distances_job)(pair_items, feats, distance, normalized)
+        for pair_items, feats in _pair_jobs(index, features, pairs, njobs)))
+    return distances
+
+
+def _n_chunks(pairs, njobs):
+    """Returns the number of jobs the pairs are split in"""
+    return min(4 * njobs, max(len(pairs), 1))
+
+
+def _schedule(index, pairs, n_chunks):
+    """Orders the pairs so that each job requires as few items as possible
+
+    The items involved in the pairs are split in k consecutive groups, k being
+    chosen so that there is about a tile (a couple of groups) of pairs for
+    each of the `n_chunks` jobs. The pairs are sorted by tile, so that a job
+    requires the items of about two groups instead of all the items before
+    its last one in the task order, and consecutive tiles share a group.
+    Returns the permutation of `pairs`.
+
+    """
+    pair_items = np.sort(
+        np.asarray(index.pair_items[pairs]).reshape(-1, 2), axis=1)
+    items = np.unique(pair_items)
+    k = int(np.ceil(np.sqrt(2 * n_chunks)))
+    group = np.searchsorted(items, pair_items) // max(
+        int(np.ceil(len(items) / k)), 1)
+    return np.lexsort((
+        pair_items[:, 0], pair_items[:, 1], group[:, 1], group[:, 0]))
+
+
+def _pair_jobs(index, features, pairs, njobs):
+    """Yields the jobs of `pairs` as (pairs, items features)
+
+    The pairs are given as indices in the items features of their job. The
+    jobs are yielded as they are dispatched, so that only the features of
+    the pending jobs are copied to the workers at a time.
+
+    """
+    for chunk in np.array_split(pairs, _n_chunks(pairs, njobs)):
+        pair_items = np.asarray(index.pair_items[chunk])
+        items = np.unique(pair_items)
+        yield (
+            np.searchsorted(items, pair_items),
+            item_features(index, features, items))
+
+
+def stream_distances(index, features_path, load_fun, distance, normalized,
+                     njobs=1, nreaders=2, prefetch=16, chunk_size=1000,
+                     cache_size=256, log=logging.getLogger()):
+    """Computes the distances of all the pairs, reading features on the fly
+
+    The features files are parsed by a pool of reader threads, in the order
+    of the by-blocks and at most `prefetch` files ahead, while the distances
+    of the blocks whose files are already loaded are computed by the workers.
+    The reading of the features thus overlaps the computation of the
+    distances, and a file is released once its last block is computed.
+
+    The by-blocks with more than `chunk_size` pairs are split in several
+    jobs, their pairs being ordered so that each job requires as few items
+    as possible (see _schedule). A job is given the features of its items
+    only, taken from an ItemCache as an item is usually required by several
+    jobs of its block.
+
+    Parameters
+    ----------
+    index (TaskIndex): the compiled ABX task
+
+    features_path (str): directory containing the features files
+
+    load_fun (function): loads a features file (see load_features)
+
+    distance (function or list): the distance to use as distance(x, y,
+        normalized), or a list of (distance, normalized) to compute several
+        metrics in a single visit of each pair.
+
+    normalized (bool): normalize or not the DTW distance, ignored when
+        `distance` is a list.
+
+    njobs (int): the number of CPU cores to use for the distances
+
+    nreaders (int): the number of threads reading the features files
+
+    prefetch (int): the maximal number of files read ahead
+
+    chunk_size (int): the number of pairs in a job
+
+    cache_size (float): the maximal size of the items features cache in Mo
+
+    log (logging.Logger): where to send the cache statistics
+
+    Returns
+    -------
+    distances (numpy.array): the distance of each pair in the task, the same
+        as compute_distances().
+
+    """
+    cache = ItemCache(cache_size)
+    scheduled = []
+    results = joblib.Parallel(n_jobs=njobs, pre_dispatch='2*n_jobs')(
+        joblib.delayed(_distances_job)(pairs, feats, distance, normalized)
+        for pairs, feats in _stream_jobs(
+            index, features_path, load_fun, nreaders, prefetch, chunk_size,
+            cache, scheduled))
+
+    stats = cache.stats()
+    log.debug(
+        'items cache: %.1f%% hits over %s items, %.1f Mo fetched',
+        100 * stats['hit_rate'], stats['hits'] + stats['misses'],
+        stats['bytes_fetched'] / 2 ** 20)
+
+    # the jobs results are in the order of the scheduled pairs
+    distances = _empty(index.n_pairs, distance)
+    if results:
+        distances[np.concatenate(scheduled)] = np.concatenate(results)
+    return distances
+
+
+def _stream_jobs(index, features_path, load_fun, nreaders, prefetch,
+                 chunk_size, cache, scheduled):
+    """Yields the distances jobs as (pairs, items features) of the blocks
+
+    The items features are fetched through `cache`, the pairs of the jobs
+    are appended to `scheduled` in the order of the jobs.
+
+    """
+    # the files required by each block and the last block using each file
+    item_file = np.asarray(index.item_file)
+    block_files = [
+        np.unique(item_file[index.block(by)[0]])
+        for by in range(len(index.bys))]
+    last_block = {}
+    for by, files in enumerate(block_files):
+        last_block.update({f: by for f in files})
+
+    # missing files are not read, item_features() raises the error
+    available = {
+        os.path.splitext(f)[0]: f for f in os.listdir(features_path)}
+    order = [
+        index.files[f] for f in dict.fromkeys(np.concatenate(
+            block_files or [np.zeros(0, dtype=int)]))
+        if index.files[f] in available]
+    stream = _prefetch(
+        features_path, [available[f] for f in order], load_fun,
+        nreaders, prefetch)
+
+    features = {}
+    pairs, feats = [], []
+    for by, files in enumerate(block_files):
+        _, block_pairs, _ = index.block(by)
+        required = {
+            index.files[f] for f in files if index.files[f] in available}
+        while not required.issubset(features):
+            name, data = next(stream)
+            features[name] = (data['time'], data['features'])
+
+        block_pairs = np.arange(block_pairs.start, block_pairs.stop)
+        n_chunks = max(1, int(np.ceil(len(block_pairs) / chunk_size)))
+        if n_chunks > 1:
+            block_pairs = block_pairs[_schedule(index, block_pairs, n_chunks)]
+
+        for chunk in np.array_split(block_pairs, n_chunks):
+            # pairs indices are relative to the items features of the job
+            chunk_items = np.asarray(index.pair_items[chunk]).reshape(-1, 2)
+            items = np.unique(chunk_items)
+            pairs.append(np.searchsorted(items, chunk_items) + len(feats))
+            feats.extend(cache.get(index, features, items))
+            scheduled.append(chunk)
+            if sum(len(p) for p in pairs) >= chunk_size:
+                yield np.concatenate(pairs), feats
+                pairs, feats = [], []
+
+        for f in files:
+            if last_block[f] == by:
+                features.pop(index.files[f], None)
+
+    if pairs:
+        yield np.concatenate(pairs), feats
+
+
+def _prefetch(features_path, files, load_fun, nreaders, prefetch):
+    """Yields (name, data) for each file, reading them in background threads
+
+    At most `prefetch` files are being read or waiting to be consumed.
+
+    """
+    with concurrent.futures.ThreadPoolExecutor(nreaders) as executor:
+        pending = collections.deque()
+        files = iter(files)
+        for f in files:
+            pending.append((f, executor.submit(
+                load_fun, os.path.join(features_path, f))))
+            if len(pending) >= prefetch:
+                break
+
+        while pending:
+            f, future = pending.popleft()
+            following = next(files, None)
+            if following is not None:
+                pending.append((following, executor.submit(
+                    load_fun, os.path.join(features_path, following))))
+            yield os.path.splitext(f)[0], future.result()
+
+
+def _metrics(distance, normalized):
+    """Returns the list of (distance, normalized) to compute on each pair"""
+    return distance if isinstance(distance, list) else [(distance, normalized)]
+
+
+def _empty(n_pairs, distance):
+    """Returns an array of NaN distances with a column per metric"""
+    return np.full(
+        (n_pairs, len(distance)) if isinstance(distance, list) else n_pairs,
+        np.nan)
+
+
+def _distances_job(pairs, features, distance, normalized):
+    metrics = _metrics(distance, normalized)
+    with warnings.catch_warnings():
+        # inhibit some useless warnings about complex to float conversion
+        warnings.filterwarnings("ignore", category=COMPLEX_WARNING)
+
+        distances = np.asarray([
+            [metric(features[i], features[j], norm)
+             for metric, norm in metrics]
+            for i, j in pairs], dtype=np.float64).reshape(
+                len(pairs), len(metrics))
+    return distances if isinstance(distance, list) else distances[:, 0]
+
+
+def score(index, distances, triplets=None):
+    """Scores the triplets in the task
+
+    Parameters
+    ----------
+    index (TaskIndex): the compiled ABX task
+
+    distances (numpy.array): the pairs distances, as returned by
+        compute_distances()
+
+    triplets (numpy.array): global indices of the triplets to score, default
+        is to score all the triplets of the task.
+
+    Returns
+    -------
+    scores (numpy.array): an int8 score for each triplet: 1 when X is closer
+        to A, -1 when it is closer to B and 0 for ties.
+
+    """
+    pairs = (
+        index.triplet_pairs if triplets is None
+        else index.triplet_pairs[triplets])
+    dis = distances[np.asarray(pairs)]
+    return (
+        (dis[:, 0] < dis[:, 1]).astype(np.int8) -
+        (dis[:, 0] > dis[:, 1]).astype(np.int8))
+
+
+def analyze(index, scores, triplets=None):
+    """Averages the scores by by-block and regressors
+
+    Parameters
+    ----------
+    index (TaskIndex): the compiled ABX task
+
+    scores (numpy.array): the triplets scores, as returned by score()
+
+    triplets (numpy.array): global indices of the scored triplets, default to
+        all the triplets of the task.
+
+    Returns
+    -------
+    analyze (pandas.DataFrame): the same table as the one computed by
+        ABXpy.analyze, with columns 'by', the regressors (e.g. 'phone_1',
+        'speaker_1', etc...), 'score' (in [0, 1], ties are counted as 0.5)
+        and 'n' (the number of triplets).
+
+    """
+    if triplets is None:
+        triplets = np.arange(index.n_triplets)
+
+    data = pandas.DataFrame(
+        np.asarray(index.triplet_regressors[triplets]),
+        columns=index.regressors)
+    data['by'] = _triplets_by(index, triplets)
+    data['score'] = (scores + 1) / 2
+
+    groups = data.groupby(['by'] + index.regressors, sort=False)['score']
+    result = groups.agg(['mean', 'size']).reset_index().rename(
+        columns={'mean': 'score', 'size': 'n'})
+
+    # replace the indices by the actual labels
+    result['by'] = np.asarray(index.bys, dtype=object)[result['by']]
+    for regressor in index.regressors:
+        result[regressor] = np.asarray(
+            index.labels[regressor], dtype=object)[result[regressor]]
+    return result
+
+
+def _triplets_by(index, triplets):
+    """Returns the by-block index of each triplet"""
+    return np.searchsorted(index.triplet_offsets, triplets, side='right') - 1
+
+
+def _cells(index, triplets):
+    """Returns the analyze cell of each triplet
+
+    A cell is a row of the table returned by analyze(), i.e. a by-block
+    (context and speaker for 'within' tasks) and a combination of the
+    regressors (phones and speakers).
+
+    """
+    return np.unique(
+        np.column_stack((
+            _triplets_by(index, triplets),
+            index.triplet_regressors[triplets])),
+        axis=0, return_inverse=True)[1].ravel()
+
+
+def sample_triplets(index, size, seed=0):
+    """Stratified sampling of the triplets in the task
+
+    At most `size` triplets are sampled from each analyze cell (see
+    analyze()), so that every (context, speaker, phone) combination averaged
+    in the ABX score is represented.
+
+    Returns
+    -------
+    triplets (numpy.array): the sorted global indices of the sampled triplets
+
+    """
+    triplets = np.arange(index.n_triplets)
+    cells = _cells(index, triplets)
+
+    # sort the triplets by cell, in random order within each cell, and keep
+    # the `size` first of each cell
+    order = np.lexsort(
+        (np.random.default_rng(seed).random(len(triplets)), cells))
+    sorted_cells = cells[order]
+    rank = triplets - np.searchsorted(sorted_cells, sorted_cells)
+    return np.sort(order[rank < size])
+
+
+def bootstrap(index, scores, triplets, n_bootstrap, seed=0):
+    """Yields analyze tables of bootstrap resamples of the triplets scores
+
+    The resampling is stratified: the scores are resampled with replacement
+    within each analyze cell.
+
+    Parameters
+    ----------
+    index (TaskIndex): the compiled ABX task
+
+    scores (numpy.array): the triplets scores, as returned by score()
+
+    triplets (numpy.array): global indices of the scored triplets
+
+    n_bootstrap (int): the number of resamples
+
+    """
+    rng = np.random.default_rng(seed)
+    cells = _cells(index, triplets)
+    order = np.argsort(cells, kind='stable')
+    starts = np.searchsorted(cells[order], cells)
+    sizes = np.bincount(cells)[cells]
+
+    for _ in range(n_bootstrap):
+        picks = order[
+            starts + np.floor(rng.random(len(cells)) * sizes).astype(int)]
+        yield analyze(index, scores[picks], triplets)
@@ -0,0 +1,127 @@
+"""Incremental computation of the ABX distances
+
+The state of an evaluation, saved in a directory, is made of the content hash
+of each features file and of the distance of each pair in the ABX task. When
+the features are evaluated again, only the pairs involving an item from a
+modified file are computed, the other distances are taken from the previous
+state. As each pair distance only depends on the features of its two items,
+the distances (and thus the ABX scores) are identical to a full computation.
+
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from zerospeech2020.evaluation import abx_engine
+
+
+def _hash_files(features_path):
+    """Returns the sha1 of each file in `features_path` (without extension)"""
+    hashes = {}
+    for f in sorted(os.listdir(features_path)):
+        sha1 = hashlib.sha1()
+        with open(os.path.join(features_path, f), 'rb') as fin:
+            for block in iter(lambda: fin.read(2 ** 20), b''):
+                sha1.update(block)
+        hashes[os.path.splitext(f)[0]] = sha1.hexdigest()
+    return hashes
+
+
+def _load_state(state_dir, index):
+    """Returns the (hashes, distances) of a previous evaluation or None"""
+    try:
+        with open(os.path.join(state_dir, 'hashes.json'), 'r') as fin:
+            hashes = json.load(fin)
+        distances = np.load(os.path.join(state_dir, 'distances.npy'))
+    except (OSError, ValueError):
+        return None
+
+    if distances.shape != (index.n_pairs,):
+        return None
+    return hashes, distances
+
+
+def _save_state(state_dir, hashes, distances):
+    """Saves the state of an evaluation, replacing any previous one"""
+    os.makedirs(os.path.dirname(os.path.abspath(state_dir)), exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(state_dir)))
+    try:
+        np.save(os.path.join(tmp_dir, 'distances.npy'), distances)
+        with open(os.path.join(tmp_dir, 'hashes.json'), 'w') as fout:
+            json.dump(hashes, fout)
+
+        if os.path.isdir(state_dir):
+            shutil.rmtree(state_dir)
+        os.rename(tmp_dir, state_dir)
+    finally:
+        if os.path.isdir(tmp_dir):
+            shutil.rmtree(tmp_dir)
+
+
+def compute_distances(index, features_path, load_fun, distance, normalized,
+                      state_dir, njobs=1, log=None):
+    """Computes the pairs distances, reusing a previous evaluation
+
+    Parameters
+    ----------
+    index (TaskIndex): the compiled ABX task
+
+    features_path (str): directory containing the features files
+
+    load_fun (function): loads a features file (see abx_engine.load_features)
+
+    distance (function): the distance to use as distance(x, y, normalized)
+
+    normalized (bool): normalize or not the DTW distance
+
+    state_dir (str): directory where the state of the previous evaluation is
+        stored. It is updated with the current evaluation.
+
+    njobs (int): the number of CPU cores to use
+
+    log (logging.Logger): where to send log messages
+
+    Returns
+    -------
+    distances (numpy.array): the distance of each pair in the task
+
+    """
+    hashes = _hash_files(features_path)
+    state = _load_state(state_dir, index)
+
+    if state is None:
+        pairs = np.arange(index.n_pairs)
+        distances = np.full(index.n_pairs, np.nan)
+    else:
+        previous, distances = state
+        # a missing file is considered as changed to raise the same error
+        # as a full computation
+        changed = np.asarray([
+            f not in hashes or previous.get(f) != hashes[f]
+            for f in index.files])
+        changed_items = changed[np.asarray(index.item_file)]
+        pairs = np.where(
+            changed_items[np.asarray(index.pair_items)].any(axis=1))[0]
+
+    if log:
+        log.debug(
+            'computing %s pairs distances out of %s', len(pairs),
+            index.n_pairs)
+
+    if len(pairs):
+        items = np.unique(index.pair_items[pairs])
+        features = abx_engine.load_features(
+            features_path, load_fun,
+            files=set(index.files[f] for f in np.unique(
+                index.item_file[items])))
+        distances[pairs] = abx_engine.compute_distances(
+            index, features, distance, normalized,
+            njobs=njobs, pairs=pairs)[pairs]
+
+    _save_state(state_dir, hashes, distances)
+    return distances
@@ -0,0 +1,279 @@
+"""Sharded ABX evaluation through a file-based work queue
+
+A single ABX task is split into shards, each shard being a set of by-blocks
+(with their items, pairs and triplets), so that the shards can be evaluated
+independently by workers running on any number of hosts. The work queue is a
+directory on a shared filesystem (a local directory works for workers on a
+single host) organized as follows:
+
+* job.json: the evaluation parameters,
+* index/: the compiled ABX task (see abx_task), shared by all the workers,
+* todo/: the shards waiting for a worker,
+* running/: the shards being evaluated, a worker claims a shard by moving it
+  from todo/ to running/, this is atomic so a shard is claimed only once,
+* done/: the pairs distances and triplets scores of each evaluated shard.
+
+Once all the shards are done, the merge step computes the analyze table and
+the ABX score from the shards scores. As the score of a triplet only depends
+on its pairs distances, the result is identical to a single node evaluation
+with the native engine.
+
+"""
+
+import heapq
+import json
+import logging
+import os
+import socket
+import tempfile
+
+import numpy as np
+
+from zerospeech2020.evaluation import abx, abx_engine, abx_task
+
+
+def prepare(queue_dir, features_path, task, year, task_type, distance,
+            normalized, nshards, dtype='float64', log=logging.getLogger()):
+    """Prepares a work queue for a sharded ABX evaluation
+
+    Parameters
+    ----------
+    queue_dir (str): the queue directory to create, must be on a filesystem
+        shared by all the workers.
+
+    features_path (str): folder containing the features to evaluate, must be
+        accessible by all the workers.
+
+    task (str): path to the ABX task file
+
+    year (str): must be '2017' or '2019' according to evaluated part of the
+        challenge.
+
+    task_type (str): must be 'across' or 'within'.
+
+    distance (str): name of the distance to use
+
+    normalized (bool): choose to normalize or not DTW distance.
+
+    nshards (int): the number of shards, the by-blocks are distributed in
+        shards with about the same number of pairs.
+
+    dtype (str): the type of the features, 'float64' or 'float32'.
+
+    log (logging.Logger): where to send log messages.
+
+    Raises
+    ------
+    ValueError if the queue directory already exists or if a parameter is not
+    valid.
+
+    """
+    if os.path.exists(queue_dir):
+        raise ValueError(f'queue directory already exists: {queue_dir}')
+    if not os.path.isdir(features_path):
+        raise ValueError(f'features folder not found: {features_path}')
+    if not os.path.isfile(task):
+        raise ValueError(f'ABX task file not found: {task}')
+    if str(year) not in ('2017', '2019'):
+        raise ValueError(f'year must be 2017 or 2019, it is {year}')
+    if task_type not in ('across', 'within'):
+        raise ValueError(
+            f'task type must be across or within, it is {task_type}')
+    if distance not in abx._DIST2FUN:
+        raise ValueError(f'unknown distance {distance}')
+    if dtype not in ('float64', 'float32'):
+        raise ValueError(f'dtype must be float64 or float32, it is {dtype}')
+    if nshards < 1:
+        raise ValueError(f'number of shards must be positive, it is {nshards}')
+
+    for name in ('todo', 'running', 'done'):
+        os.makedirs(os.path.join(queue_dir, name))
+
+    log.info('compiling ABX task %s', task)
+    abx_task.compile_task(task, os.path.join(queue_dir, 'index'))
+    index = abx_task.TaskIndex(os.path.join(queue_dir, 'index'))
+
+    with open(os.path.join(queue_dir, 'job.json'), 'w') as fout:
+        json.dump({
+            'features': os.path.abspath(features_path),
+            'task': os.path.abspath(task),
+            'year': str(year),
+            'task_type': task_type,
+            'distance': distance,
+            'normalized': normalized,
+            'dtype': dtype}, fout)
+
+    shards = _split(index, nshards)
+    for n, bys in enumerate(shards):
+        filename = os.path.join(queue_dir, 'todo', f'{n:05d}.json')
+        with open(filename, 'w') as fout:
+            json.dump(bys, fout)
+    log.info(
+        'prepared %s shards of %s by-blocks in %s',
+        len(shards), len(index.bys), queue_dir)
+
+
+def _split(index, nshards):
+    """Distributes the by-blocks in shards of about the same number of pairs
+
+    Returns a list of shards, each one being the sorted list of its by-blocks
+    indices.
+
+    """
+    npairs = np.diff(index.pair_offsets)
+    nshards = min(nshards, len(npairs))
+
+    # greedy assignment of the largest blocks to the lightest shard
+    heap = [(0, n) for n in range(nshards)]
+    shards = [[] for _ in range(nshards)]
+    for by in np.argsort(-npairs, kind='stable'):
+        load, n = heapq.heappop(heap)
+        shards[n].append(int(by))
+        heapq.heappush(heap, (load + int(npairs[by]), n))
+    return [sorted(shard) for shard in shards]
+
+
+def _load_job(queue_dir):
+    try:
+        with open(os.path.join(queue_dir, 'job.json'), 'r') as fin:
+            job = json.load(fin)
+    except OSError:
+        raise ValueError(f'not an ABX queue directory: {queue_dir}')
+    return job, abx_task.TaskIndex(os.path.join(queue_dir, 'index'))
+
+
+def _claim(queue_dir):
+    """Moves a shard from todo/ to running/, returns its name or None"""
+    for shard in sorted(os.listdir(os.path.join(queue_dir, 'todo'))):
+        try:
+            os.rename(
+                os.path.join(queue_dir, 'todo', shard),
+                os.path.join(queue_dir, 'running', shard))
+            return os.path.splitext(shard)[0]
+        except FileNotFoundError:
+            # claimed by another worker
+            continue
+    return None
+
+
+def work(queue_dir, njobs=1, log=logging.getLogger()):
+    """Evaluates the shards of a queue until no more shard is available
+
+    Several workers can run concurrently on the same queue, on the same host
+    or on different hosts sharing the queue directory.
+
+    Parameters
+    ----------
+    queue_dir (str): the queue directory, as created by prepare().
+
+    njobs (int): the number of CPU cores to use for a shard.
+
+    log (logging.Logger): where to send log messages.
+
+    Returns
+    -------
+    shards (list): the names of the shards evaluated by this worker.
+
+    """
+    job, index = _load_job(queue_dir)
+    load_fun = abx._typed_loader({
+        '2017': abx._load_features_2017,
+        '2019': abx._load_features_2019}[job['year']], job['dtype'])
+
+    done = []
+    while True:
+        shard = _claim(queue_dir)
+        if shard is None:
+            return done
+
+        log.info('evaluating shard %s on %s', shard, socket.gethostname())
+        running = os.path.join(queue_dir, 'running', shard + '.json')
+        with open(running, 'r') as fin:
+            bys = json.load(fin)
+
+        pairs = np.concatenate([
+            np.arange(index.pair_offsets[by], index.pair_offsets[by + 1])
+            for by in bys])
+        triplets = np.concatenate([
+            np.arange(index.triplet_offsets[by], index.triplet_offsets[by + 1])
+            for by in bys])
+
+        # load only the features required by the shard
+        items = np.unique(index.pair_items[pairs])
+        features = abx_engine.load_features(
+            job['features'], load_fun, files=set(
+                index.files[f] for f in np.unique(index.item_file[items])))
+
+        distances = abx_engine.compute_distances(
+            index, features, abx._DIST2FUN[job['distance']],
+            job['normalized'], njobs=njobs, pairs=pairs)
+        scores = abx_engine.score(index, distances, triplets)
+
+        # write the results atomically, the shard is done once they exist
+        tmp = tempfile.NamedTemporaryFile(
+            dir=os.path.join(queue_dir, 'done'), suffix='.tmp', delete=False)
+        with tmp:
+            np.savez(
+                tmp, pairs=pairs, distances=distances[pairs],
+                triplets=triplets, scores=scores)
+        os.replace(
+            tmp.name, os.path.join(queue_dir, 'done', shard + '.npz'))
+        os.remove(running)
+        done.append(shard)
+
+
+def requeue(queue_dir, log=logging.getLogger()):
+    """Moves the running shards back to todo/, for interrupted workers
+
+    This must be called only when no worker is running on the queue.
+
+    """
+    for shard in sorted(os.listdir(os.path.join(queue_dir, 'running'))):
+        log.info('requeuing shard %s', os.path.splitext(shard)[0])
+        os.rename(
+            os.path.join(queue_dir, 'running', shard),
+            os.path.join(queue_dir, 'todo', shard))
+
+
+def merge(queue_dir, log=logging.getLogger()):
+    """Merges the shards into the ABX score
+
+    The analyze table is written in the queue directory as analyze.csv.
+
+    Raises
+    ------
+    ValueError if some shards are not done.
+
+    Returns
+    -------
+    abx_score (float): ABX error rate in [0, 100], lower is better.
+
+    """
+    job, index = _load_job(queue_dir)
+
+    pending = (
+        os.listdir(os.path.join(queue_dir, 'todo')) +
+        os.listdir(os.path.join(queue_dir, 'running')))
+    if pending:
+        raise ValueError(
+            f'{len(pending)} shards are not done in {queue_dir}')
+
+    scores = np.zeros(index.n_triplets, dtype=np.int8)
+    scored = np.zeros(index.n_triplets, dtype=bool)
+    for shard in sorted(os.listdir(os.path.join(queue_dir, 'done'))):
+        if not shard.endswith('.npz'):
+            continue
+        with np.load(os.path.join(queue_dir, 'done', shard)) as data:
+            scores[data['triplets']] = data['scores']
+            scored[data['triplets']] = True
+
+    if not scored.all():
+        raise ValueError(
+            f'{np.count_nonzero(~scored)} triplets are not scored '
+            f'in {queue_dir}')
+
+    log.info('merging %s scored triplets', index.n_triplets)
+    analyze = abx_engine.analyze(index, scores)
+    analyze.to_csv(
+        os.path.join(queue_dir, 'analyze.csv'), sep='\t', index=False)
+    return abx._average_frame(analyze, job['task_type'])
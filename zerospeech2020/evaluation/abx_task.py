@@ -0,0 +1,300 @@
+"""Precompiled and memory-mapped index of ABX task files
+
+The ABX task files (.abx) are HDF5 files generated by ABXpy. They never change
+between two submissions but ABXpy parses them again at each distance, score
+and analyze stage. This module compiles a task file once into a directory of
+numpy arrays, loaded as memory maps by the in-package ABX engine (see
+zerospeech2020.evaluation.abx_engine).
+
+The compiled index is made of the following arrays, all the items, pairs and
+triplets of the by-blocks being concatenated, the offsets of each by-block
+being stored in the *_offsets arrays:
+
+* items: item_file (index in the 'files' list), item_onset and item_offset,
+* pairs: pair_items, the (n_pairs, 2) global indices of the items in a pair,
+* triplets: triplets, the (n_triplets, 3) global indices of the A, B and X
+  items and triplet_pairs, the (n_triplets, 2) global indices of the AX and BX
+  pairs,
+* regressors: triplet_regressors, the (n_triplets, n_regressors) indices of
+  the labels ('phone_1', 'speaker_1', etc...) of each triplet.
+
+"""
+
+import functools
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+
+_INDEX_VERSION = 1
+
+_ARRAYS = [
+    'item_offsets', 'item_file', 'item_onset', 'item_offset',
+    'pair_offsets', 'pair_items',
+    'triplet_offsets', 'triplets', 'triplet_pairs', 'triplet_regressors']
+
+
+def cache_directory():
+    """Returns the directory where the compiled task indexes are stored
+
+    This is the ZS2020_CACHE environment variable if defined, or
+    ~/.cache/zerospeech2020 otherwise.
+
+    """
+    return os.environ.get(
+        'ZS2020_CACHE',
+        os.path.join(os.path.expanduser('~'), '.cache', 'zerospeech2020'))
+
+
+class TaskIndex:
+    """Read-only view on a compiled ABX task
+
+    Parameters
+    ----------
+    directory (str): the directory where the task has been compiled by
+        compile_task().
+
+    """
+    def __init__(self, directory):
+        with open(os.path.join(directory, 'index.json'), 'r') as fin:
+            meta = json.load(fin)
+        if meta['version'] != _INDEX_VERSION:
+            raise ValueError(f'outdated ABX task index: {directory}')
+
+        self.directory = directory
+        self.bys = meta['bys']
+        self.files = meta['files']
+        self.regressors = meta['regressors']
+        self.labels = meta['labels']
+
+        for name in _ARRAYS:
+            setattr(self, name, np.load(
+                os.path.join(directory, name + '.npy'), mmap_mode='r'))
+
+    @property
+    def n_items(self):
+        return self.item_file.shape[0]
+
+    @property
+    def n_pairs(self):
+        return self.pair_items.shape[0]
+
+    @property
+    def n_triplets(self):
+        return self.triplets.shape[0]
+
+    def block(self, by):
+        """Returns the items, pairs and triplets slices of a by-block"""
+        return (
+            slice(self.item_offsets[by], self.item_offsets[by + 1]),
+            slice(self.pair_offsets[by], self.pair_offsets[by + 1]),
+            slice(self.triplet_offsets[by], self.triplet_offsets[by + 1]))
+
+
+def _key(task_file):
+    """A key identifying a version of a task file"""
+    stat = os.stat(task_file)
+    return hashlib.sha1(
+        f'{os.path.abspath(task_file)}:{stat.st_size}:{stat.st_mtime_ns}'
+        .encode()).hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def load_task(task_file, cache_dir=None):
+    """Returns the TaskIndex of an ABX task file, compiling it if needed
+
+    The index is compiled once in `cache_dir` (default to cache_directory())
+    and recompiled only if the task file is modified.
+
+    """
+    if not os.path.isfile(task_file):
+        raise ValueError(f'ABX task file not found: {task_file}')
+
+    directory = os.path.join(
+        cache_dir or cache_directory(), 'abx', _key(task_file))
+    try:
+        return TaskIndex(directory)
+    except (OSError, ValueError):
+        compile_task(task_file, directory)
+        return TaskIndex(directory)
+
+
+def compile_task(task_file, directory):
+    """Compiles an ABX task file into a directory of numpy arrays
+
+    The compilation is atomic: the arrays are written in a temporary directory
+    that is renamed to `directory` once complete. An existing `directory` is
+    overwritten.
+
+    Raises
+    ------
+    ValueError if the task file cannot be parsed.
+
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(directory)), exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(directory)))
+    try:
+        arrays, meta = _read_abx(task_file)
+        for name in _ARRAYS:
+            np.save(os.path.join(tmp_dir, name + '.npy'), arrays[name])
+        meta.update({'version': _INDEX_VERSION, 'source': task_file})
+        with open(os.path.join(tmp_dir, 'index.json'), 'w') as fout:
+            json.dump(meta, fout)
+
+        if os.path.isdir(directory):
+            shutil.rmtree(directory)
+        os.rename(tmp_dir, directory)
+    finally:
+        if os.path.isdir(tmp_dir):
+            shutil.rmtree(tmp_dir)
+
+
+def _read_abx(task_file):
+    """Parses an ABX task file as written by ABXpy.task.Task
+
+    Returns the arrays and metadata of the index. The task file layout is as
+    follows: the 'bys' dataset lists the by-blocks, their triplets are in
+    'triplets/data' (local item indices of A, B and X) delimited by
+    'triplets/by_index'. The pairs of a by-block are encoded as keys in
+    'unique_pairs/data', delimited by the (base, start, stop) attribute of
+    'unique_pairs'. The items of each block are in the pandas table
+    'feat_dbs/<by>' and the triplets labels in 'regressors/<by>'.
+
+    """
+    import h5py
+    import pandas
+
+    try:
+        with h5py.File(task_file, 'r') as fh:
+            bys = [_decode(by) for by in fh['bys'][...]]
+            by_index = fh['triplets']['by_index'][...]
+
+            blocks = []
+            for n, by in enumerate(bys):
+                start, stop = by_index[n]
+                if stop <= start:
+                    continue
+                base, pstart, pstop = fh['unique_pairs'].attrs[by]
+                regressors = fh['regressors'][by]
+                blocks.append({
+                    'by': by,
+                    'triplets': fh['triplets']['data'][start:stop, :],
+                    'base': int(base),
+                    'pairs': fh['unique_pairs']['data'][pstart:pstop].ravel(),
+                    'indexed_data': regressors['indexed_data'][...],
+                    'regressors': [
+                        _decode(r) for r in regressors['indexed_datasets']],
+                    'labels': {
+                        _decode(r): [
+                            _decode(l) for l in
+                            regressors['indexes'][_decode(r)][...]]
+                        for r in regressors['indexed_datasets']}})
+
+        for block in blocks:
+            block['items'] = pandas.read_hdf(
+                task_file, 'feat_dbs/' + block['by'])
+    except (OSError, KeyError) as err:
+        raise ValueError(f'failed to parse ABX task {task_file}: {err}')
+
+    if not blocks:
+        raise ValueError(f'ABX task has no triplets: {task_file}')
+
+    # files and regressors labels are shared by all the by-blocks
+    files = sorted(set().union(*(b['items']['file'] for b in blocks)))
+    file_index = {f: i for i, f in enumerate(files)}
+    regressors = blocks[0]['regressors']
+    labels = {
+        r: sorted(set().union(*(b['labels'][r] for b in blocks)))
+        for r in regressors}
+    label_index = {r: {l: i for i, l in enumerate(labels[r])} for r in labels}
+
+    arrays = {k: [] for k in _ARRAYS}
+    n_items, n_pairs = 0, 0
+    for block in blocks:
+        items = block['items']
+        triplets = _locate(items, block['triplets'])
+        pairs = block['pairs']
+        base = block['base']
+
+        arrays['item_file'].append(
+            np.asarray([file_index[f] for f in items['file']], np.int32))
+        arrays['item_onset'].append(items['onset'].to_numpy(np.float64))
+        arrays['item_offset'].append(items['offset'].to_numpy(np.float64))
+
+        first, second = _locate(items, np.stack(
+            [pairs % base, pairs // base], axis=1)).T
+        arrays['pair_items'].append(
+            np.stack([first, second], axis=1).astype(np.int64) + n_items)
+
+        arrays['triplets'].append(triplets.astype(np.int64) + n_items)
+        arrays['triplet_pairs'].append(n_pairs + np.stack([
+            _pair_index(pairs, base, block['triplets'][:, 0],
+                        block['triplets'][:, 2]),
+            _pair_index(pairs, base, block['triplets'][:, 1],
+                        block['triplets'][:, 2])], axis=1))
+
+        if block['regressors'] != regressors:
+            raise ValueError(
+                f'inconsistent regressors in ABX task {task_file}')
+        arrays['triplet_regressors'].append(np.stack([
+            np.asarray([label_index[r][l] for l in block['labels'][r]],
+                       np.int32)[block['indexed_data'][:, i]]
+            for i, r in enumerate(regressors)], axis=1))
+
+        arrays['item_offsets'].append(n_items)
+        arrays['pair_offsets'].append(n_pairs)
+        n_items += len(items)
+        n_pairs += len(pairs)
+
+    arrays['item_offsets'].append(n_items)
+    arrays['pair_offsets'].append(n_pairs)
+    arrays['triplet_offsets'] = np.cumsum(
+        [0] + [len(b['triplets']) for b in blocks])
+
+    for name in ('item_offsets', 'pair_offsets', 'triplet_offsets'):
+        arrays[name] = np.asarray(arrays[name], dtype=np.int64)
+    for name in ('item_file', 'item_onset', 'item_offset', 'pair_items',
+                 'triplets', 'triplet_pairs', 'triplet_regressors'):
+        arrays[name] = np.concatenate(arrays[name])
+
+    meta = {
+        'bys': [b['by'] for b in blocks],
+        'files': files,
+        'regressors': regressors,
+        'labels': labels}
+    return arrays, meta
+
+
+def _decode(value):
+    return value.decode('utf8') if isinstance(value, bytes) else str(value)
+
+
+def _locate(items, indices):
+    """Converts item indices of a by-block into positions in the block"""
+    positions = items.index.get_indexer(np.asarray(indices).ravel())
+    if (positions < 0).any():
+        raise ValueError('ABX task refers to unknown items')
+    return positions.reshape(np.shape(indices))
+
+
+def _pair_index(pairs, base, first, second):
+    """Returns the position of the (first, second) pairs in `pairs`
+
+    The pairs are sorted keys made of two item indices. Distances being
+    symmetric, the pair can be stored in any order so both are looked up.
+
+    """
+    result = np.empty(len(first), dtype=np.int64)
+    found = np.zeros(len(first), dtype=bool)
+    for key in (first + base * second, second + base * first):
+        index = np.minimum(np.searchsorted(pairs, key), len(pairs) - 1)
+        match = ~found & (pairs[index] == key)
+        result[match] = index[match]
+        found |= match
+    if not found.all():
+        raise ValueError('ABX task refers to unknown pairs')
+    return result
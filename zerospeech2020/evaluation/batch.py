@@ -0,0 +1,294 @@
+"""Batch evaluation of many submissions for the ZeroSpeech2020 leaderboard
+
+All the submissions are split into independent evaluation cells (a language,
+duration and task for 2017 track1, a language for 2017 track2 and a language
+and embedding folder for 2019). The cells of all the submissions are
+interleaved and dispatched on a single pool of workers, so that all the cores
+are kept busy until the last submission is evaluated.
+
+"""
+
+import itertools
+import json
+import logging
+import os
+
+import joblib
+import pandas
+
+from zerospeech2020.evaluation import (
+    abx,
+    evaluation_2017_track1,
+    evaluation_2017_track2,
+    evaluation_2019)
+from zerospeech2020.validation import utils
+
+
+_VALID_TRACKS = ['2017-track1', '2017-track2', '2019']
+
+
+def find_submissions(paths):
+    """Returns the submissions to evaluate from a list of paths
+
+    Each path is either a submission (a directory with a top-level
+    metadata.yaml, or a zip archive) or a directory containing submissions.
+
+    Returns
+    -------
+    submissions (dict): submission name -> path, the name being the basename
+        of the submission without the .zip extension.
+
+    Raises
+    ------
+    ValueError if a path does not exist or if two submissions have the same
+    name.
+
+    """
+    submissions = {}
+    for path in paths:
+        if not os.path.exists(path):
+            raise ValueError(f'submission not found: {path}')
+
+        if os.path.isdir(path) and not os.path.isfile(
+                os.path.join(path, 'metadata.yaml')):
+            candidates = [
+                os.path.join(path, f) for f in sorted(os.listdir(path))]
+        else:
+            candidates = [path]
+
+        for candidate in candidates:
+            name = os.path.basename(os.path.normpath(candidate))
+            if name.endswith('.zip'):
+                name = name[:-len('.zip')]
+            if name in submissions:
+                raise ValueError(f'duplicated submission name: {name}')
+            submissions[name] = candidate
+    return submissions
+
+
+def evaluate(submissions, dataset, output_dir, tracks=_VALID_TRACKS,
+             normalize_2017=True, distance_2019='cosine', normalize_2019=True,
+             njobs=1, log=logging.getLogger(), abx_options=None,
+             track2_options=None):
+    """Evaluates several submissions sharing a single pool of workers
+
+    Parameters
+    ----------
+    submissions (dict): submission name -> path to the submission (directory
+        or zip archive), as returned by find_submissions().
+
+    dataset (str): path to the ZeroSpeech2020 dataset (required for the ABX
+        task files).
+
+    output_dir (str): directory where to write the results. A JSON file with
+        the complete scores is written for each submission, along with a
+        results.tsv table summarizing all the submissions.
+
+    tracks (list): the tracks to evaluate, elements must be '2017-track1',
+        '2017-track2' or '2019'.
+
+    normalize_2017 (bool): normalize DTW distance for 2017 track1.
+
+    distance_2019 (str): ABX distance used for the 2019 main score.
+
+    normalize_2019 (bool): normalize DTW distance for 2019.
+
+    njobs (int): the number of CPU cores to use.
+
+    log (logging.Logger): where to send log messages.
+
+    abx_options (dict): extra options forwarded to abx.abx (e.g. the ABX
+        engine to use).
+
+    track2_options (dict): extra options forwarded to the 2017 track2
+        evaluation (see evaluation_2017_track2.evaluate).
+
+    Returns
+    -------
+    scores (dict): submission name -> score, as returned by the evaluation of
+        a single submission. The scores of a submission failing evaluation
+        are replaced by {'error': message}.
+
+    """
+    for track in tracks:
+        if track not in _VALID_TRACKS:
+            raise ValueError(
+                f'invalid track {track}, must be in '
+                f'{", ".join(_VALID_TRACKS)}')
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    # unzip the submissions and list their evaluation cells
+    errors = {}
+    cells = {}
+    for name, path in submissions.items():
+        try:
+            submission = utils.unzip_if_needed(path, log)
+            cells[name] = list(_list_cells(
+                submission, dataset, tracks, normalize_2017, normalize_2019,
+                track2_options))
+        except Exception as err:
+            log.error('%s: %s', name, _message(err))
+            errors[name] = _message(err)
+
+    # round-robin over the submissions so that all of them make progress at
+    # the same time
+    jobs = [job for job in itertools.chain(*itertools.zip_longest(
+        *([(name, cell) for cell in cells[name]] for name in cells)))
+            if job is not None]
+    log.info(
+        'evaluating %s submissions (%s cells) on %s jobs',
+        len(submissions), len(jobs), njobs)
+
+    results = joblib.Parallel(n_jobs=njobs)(
+        joblib.delayed(_run_cell)(name, cell[1], cell[2], log, abx_options)
+        for name, cell in jobs)
+
+    # gather the cells results into per-submission scores
+    scores = {}
+    for name in submissions:
+        if name in errors:
+            scores[name] = {'error': errors[name]}
+            continue
+
+        cell_results = {
+            cell[0]: result for (job_name, cell), result in zip(jobs, results)
+            if job_name == name}
+        try:
+            scores[name] = _assemble(
+                name, cell_results, tracks, normalize_2017, distance_2019)
+        except ValueError as err:
+            log.error('%s: %s', name, err)
+            scores[name] = {'error': str(err)}
+
+    _write_results(scores, output_dir, log)
+    return scores
+
+
+def _list_cells(submission, dataset, tracks, normalize_2017, normalize_2019,
+                track2_options=None):
+    """Yields the evaluation cells of a submission
+
+    A cell is a tuple (key, function, args) where key locates the cell result
+    in the final score.
+
+    """
+    if '2019' in tracks:
+        for language in ['english']:
+            for folder in evaluation_2019._list_folders(submission, language):
+                yield (
+                    ('2019', language, folder),
+                    evaluation_2019._evaluate_folder,
+                    (submission, dataset, language, folder,
+                     normalize_2019, 1))
+
+    if '2017-track1' in tracks:
+        for language in ['english', 'french', 'mandarin']:
+            for duration in ['1s', '10s', '120s']:
+                for task in evaluation_2017_track1._VALID_TASKS:
+                    yield (
+                        ('2017-track1', language, duration, task),
+                        evaluation_2017_track1._evaluate_single,
+                        (submission, dataset, language, duration, task,
+                         normalize_2017, 1))
+
+    if '2017-track2' in tracks:
+        for language in ['english', 'french', 'mandarin']:
+            yield (
+                ('2017-track2', language),
+                _evaluate_track2,
+                (submission, language, track2_options))
+
+
+def _evaluate_track2(submission, language, track2_options, log,
+                     abx_options=None):
+    # the 2017 track2 evaluation has a different signature than others
+    return evaluation_2017_track2._evaluate_single(
+        submission, language, log, 1, track2_options=track2_options)
+
+
+def _run_cell(name, function, args, log, abx_options):
+    """Evaluates a single cell, returns the error message on failure
+
+    Any exception is caught (not only ValueError but also the errors raised
+    by tde, h5py, etc...) so that a failing cell only fails its submission,
+    without aborting the evaluation of the other cells.
+
+    """
+    try:
+        return function(
+            *args, log=log,
+            abx_options=abx.incremental_options(abx_options, name))
+    except Exception as err:
+        log.error('%s: %s', name, _message(err))
+        return ValueError(_message(err))
+
+
+def _message(err):
+    """Returns the message of an exception, with its type if unexpected"""
+    if isinstance(err, ValueError):
+        return str(err)
+    return f'{type(err).__name__}: {err}'
+
+
+def _assemble(name, cell_results, tracks, normalize_2017, distance_2019):
+    """Builds the score of a submission from its cells results"""
+    for key, result in cell_results.items():
+        if isinstance(result, ValueError):
+            raise ValueError(f'{"/".join(key)}: {result}')
+
+    score = {}
+    if '2019' in tracks:
+        score['2019'] = {}
+        for language in ['english']:
+            details = {
+                key[2]: result for key, result in cell_results.items()
+                if key[:2] == ('2019', language)}
+            score['2019'][language] = evaluation_2019._summarize(
+                name, details, distance_2019)
+
+    if '2017-track1' in tracks:
+        score['2017-track1'] = {'params': {'normalize': normalize_2017}}
+        for key, result in cell_results.items():
+            if key[0] == '2017-track1':
+                _, language, duration, task = key
+                score['2017-track1'].setdefault(
+                    language, {}).setdefault(duration, {})[task] = result
+
+    if '2017-track2' in tracks:
+        score['2017-track2'] = {
+            key[1]: result for key, result in cell_results.items()
+            if key[0] == '2017-track2'}
+
+    return score
+
+
+def _flatten(score, prefix=''):
+    """Flattens the main scores into a dict of 'a/b/c' -> value
+
+    The 'details' entries are ignored, they are only reported in the JSON
+    files.
+
+    """
+    flat = {}
+    for key, value in score.items():
+        if key.startswith('details') or key == 'params':
+            continue
+        name = f'{prefix}/{key}' if prefix else key
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name))
+        else:
+            flat[name] = value
+    return flat
+
+
+def _write_results(scores, output_dir, log):
+    for name, score in scores.items():
+        with open(os.path.join(output_dir, f'{name}.json'), 'w') as fout:
+            fout.write(json.dumps(score, indent=4) + '\n')
+
+    table = os.path.join(output_dir, 'results.tsv')
+    log.info('writing results table to %s', table)
+    pandas.DataFrame.from_dict(
+        {name: _flatten(score) for name, score in scores.items()},
+        orient='index').rename_axis('submission').to_csv(table, sep='\t')
@@ -1,9 +1,9 @@
 """Bitrate evaluation code for 2019 part of ZeroSpeech2020"""
 
 import math
-import pkg_resources
 
-from zerospeech2020.read_2019_features import read_all
+from zerospeech2020 import manifest
+from zerospeech2020.read_2019_features import read_entries
 
 
 def _entropy_symbols(symbol_counts, nlines):
@@ -57,7 +57,7 @@ def _bitrate(symbol_counts,  nlines, duration):
     return bitrate
 
 
-def bitrate(features, lang):
+def bitrate(features, lang, cache=None):
     """Returns the bitrate of given `features`
 
     Parameters
@@ -65,6 +65,9 @@ def bitrate(features, lang):
     features (str): the path to the 2019 features directory, formatted as
         specified at https://zerospeech.com/2020/instructions.html#format.
     lang (str) : must be 'english' or 'surprise'.
+    cache (dict): already parsed features, as filled by
+        zerospeech2020.read_2019_features.read_all. Files not in it are parsed
+        and added to it.
 
     Returns
     -------
@@ -74,11 +77,8 @@ def bitrate(features, lang):
         H(s) is the entropy for all symbols s that appears in the document
 
     """
-    bitrate_file_list = pkg_resources.resource_filename(
-        pkg_resources.Requirement.parse('zerospeech2020'),
-        f'zerospeech2020/share/2019/{lang}/bitrate_filelist.txt')
-
-    symbol_counts, nlines, duration = read_all(
-        bitrate_file_list, features, True, log=False)
+    symbol_counts, nlines, duration = read_entries(
+        manifest.load().bitrate_files(lang).items(), features, True,
+        log=False, cache=cache)
 
     return _bitrate(symbol_counts,  nlines, duration)
@@ -14,7 +14,7 @@ _VALID_DISTANCES = ['cosine', 'KL']
 
 
 def evaluate(submission, dataset, languages, durations,
-             normalize, njobs=1, log=logging.getLogger()):
+             normalize, njobs=1, log=logging.getLogger(), abx_options=None):
     """Evaluation of the 2017 track1: ABX score
 
     Compute the ABX score on the specified languages and durations subsets.
@@ -40,6 +40,9 @@ def evaluate(submission, dataset, languages, durations,
 
     log (logging.Logger): where to send log messages.
 
+    abx_options (dict): extra options forwarded to abx.abx (e.g. the ABX
+        engine to use).
+
     Raises
     ------
     ValueError if the method fails.
@@ -60,13 +63,13 @@ def evaluate(submission, dataset, languages, durations,
             for task in _VALID_TASKS:
                 score[language][duration][task] = _evaluate_single(
                     submission, dataset, language, duration,
-                    task, normalize, njobs, log)
+                    task, normalize, njobs, log, abx_options=abx_options)
     return {'2017-track1': score}
 
 
 def _evaluate_single(
         submission, dataset, language, duration, task,
-        normalize, njobs, log):
+        normalize, njobs, log, abx_options=None):
     log.info('evaluating 2017 track1 for %s %s %s', language, duration, task)
 
     # ensure the language is valid
@@ -95,6 +98,10 @@ def _evaluate_single(
     if not os.path.isdir(features_directory):
         raise ValueError(f'directory not found: {features_directory}')
 
+    # each features folder has its own incremental state
+    abx_options = abx.incremental_options(
+        abx_options, '2017-track1', language, duration)
+
     score = {}
     # KL distance does not support negative values, detect them here
     if _has_negative_values(features_directory):
@@ -107,24 +114,32 @@ def _evaluate_single(
             'cosine',
             normalize,
             njobs=njobs,
-            log=log)
+            log=log,
+            **abx_options)
         score['KL'] = '-'
         score['best'] = 'cosine'
     else:
-        for distance in _VALID_DISTANCES:
-            score[distance] = abx.abx(
-                features_directory,
-                '2017',
-                abx.get_tasks(dataset, '2017')[(language, duration, task)],
-                task,
-                distance,
-                normalize,
-                njobs=njobs,
-                log=log)
-        score['best'] = 'cosine' if score['cosine'] <= score['KL'] else 'KL'
+        # the distances are computed in a single pass when possible
+        score.update(abx.abx_metrics(
+            features_directory,
+            '2017',
+            abx.get_tasks(dataset, '2017')[(language, duration, task)],
+            task,
+            [(distance, normalize) for distance in _VALID_DISTANCES],
+            njobs=njobs,
+            log=log,
+            **abx_options))
+        score['best'] = (
+            'cosine' if _value(score['cosine']) <= _value(score['KL'])
+            else 'KL')
     return score
 
 
+def _value(abx_score):
+    """Returns the ABX error rate, abx_score being a preview or not"""
+    return abx_score['score'] if isinstance(abx_score, dict) else abx_score
+
+
 def _has_negative_values(directory):
     for f in os.listdir(directory):
         if np.min(np.loadtxt(os.path.join(directory, f))) < 0:
@@ -8,17 +8,23 @@ from tde.measures.token_type import TokenType
 from tde.readers.gold_reader import Gold
 from tde.readers.disc_reader import Disc
 
+import functools
 import logging
 import signal
 import os
 import pkg_resources
 import sys
 
+from zerospeech2020 import read_2017_classes
+from zerospeech2020.evaluation import track2_engine
+
 
 _VALID_LANGUAGES = ['english', 'french', 'mandarin', 'LANG1', 'LANG2']
+_VALID_ENGINES = ['tde', 'native']
 
 
-def evaluate(submission, languages, log=logging.getLogger(), njobs=1):
+def evaluate(submission, languages, log=logging.getLogger(), njobs=1,
+             track2_options=None):
     """Evaluation of the 2017 track2: term discovery
 
     Compute all the term discovery metrics on the specified languages.
@@ -36,6 +42,13 @@ def evaluate(submission, languages, log=logging.getLogger(), njobs=1):
 
     njobs (int): number of parallel jobs to compute grouping
 
+    track2_options (dict): extra options forwarded to the metrics
+        computation, 'engine' is 'tde' (the default) or 'native' to compute
+        the boundary, token/type, coverage and NED metrics with the
+        in-package engine (see track2_engine), and
+        'ned_max_pairs' (with the native engine) estimates the NED of the
+        classes with more pairs on that number of sampled pairs.
+
     Raises
     ------
     ValueError if the method fails to load classes file or gold file for
@@ -49,12 +62,13 @@ def evaluate(submission, languages, log=logging.getLogger(), njobs=1):
 
     """
     score = {
-        language: _evaluate_single(submission, language, log, njobs)
+        language: _evaluate_single(
+            submission, language, log, njobs, track2_options=track2_options)
         for language in languages}
     return {'2017-track2': score}
 
 
-def _evaluate_single(submission, language, log, njobs):
+def _evaluate_single(submission, language, log, njobs, track2_options=None):
     log.info('evaluating 2017 track2 for %s', language)
 
     # ensure the language is valid
@@ -74,9 +88,12 @@ def _evaluate_single(submission, language, log, njobs):
         submission, '2017', 'track2', f'{language}.txt')
     if not os.path.isfile(class_file):
         raise ValueError(f'file not found: {class_file}')
-    disc = _read_discovered(class_file, language, gold, log)
+    disc = _read_discovered(
+        class_file, language, gold, log,
+        engine=(track2_options or {}).get('engine', 'tde'))
 
-    ned, coverage, details = _evaluate_lang(gold, disc, log, njobs)
+    ned, coverage, details = _evaluate_lang(
+        gold, disc, log, njobs, **(track2_options or {}))
 
     return {
         'scores': {
@@ -86,10 +103,12 @@ def _evaluate_single(submission, language, log, njobs):
         'details': details}
 
 
+@functools.lru_cache(maxsize=None)
 def _read_gold(language, log):
     """Returns the gold for the given `language`
 
-    Raises ValueError on error.
+    The gold is loaded only once per process and shared by all the evaluated
+    submissions. Raises ValueError on error.
 
     """
     log.debug('reading track2 gold for %s', language)
@@ -115,8 +134,13 @@ def _read_gold(language, log):
     return Gold(wrd_path=wrd_path, phn_path=phn_path)
 
 
-def _read_discovered(class_file, language, gold, log):
+def _read_discovered(class_file, language, gold, log, engine='tde'):
     log.debug('reading discovered classes for %s', language)
+    if engine == 'native':
+        # transcribe the fragments on the columnar gold phones
+        return read_2017_classes.read(class_file, unique=False).to_disc(
+            track2_engine.gold_intervals(gold)[1])
+
     sys.stdout = open(os.devnull, 'w')
     try:
         return Disc(class_file, gold)
@@ -124,16 +148,33 @@ def _read_discovered(class_file, language, gold, log):
         sys.stdout = sys.__stdout__
 
 
-def _evaluate_lang(gold, disc, log, njobs):
+def _evaluate_lang(gold, disc, log, njobs, engine='tde', ned_max_pairs=None):
     """Compute all metrics on requested language"""
+    if engine not in _VALID_ENGINES:
+        raise ValueError(
+            f'invalid track2 engine {engine}, must be in '
+            f'{", ".join(_VALID_ENGINES)}')
+    if ned_max_pairs is not None and engine != 'native':
+        raise ValueError('NED pairs sampling requires the native engine')
+
     details = {}
 
+    if engine == 'native':
+        # columnar gold and discovered intervals shared by the metrics
+        words, phones = track2_engine.gold_intervals(gold)
+        intervals = track2_engine.DiscoveredIntervals.from_disc(disc, phones)
+
     log.debug('computing boundary...')
-    boundary = Boundary(gold, disc)
-    boundary.compute_boundary()
-    details['boundary_precision'] = boundary.precision
-    details['boundary_recall'] = boundary.recall
-    details['boundary_fscore'] = boundary.fscore
+    if engine == 'native':
+        (details['boundary_precision'], details['boundary_recall'],
+         details['boundary_fscore']) = track2_engine.boundary(
+             words, phones, intervals)
+    else:
+        boundary = Boundary(gold, disc)
+        boundary.compute_boundary()
+        details['boundary_precision'] = boundary.precision
+        details['boundary_recall'] = boundary.recall
+        details['boundary_fscore'] = boundary.fscore
 
     # put timeout, if grouping takes too long, just continue
     def handler(signum, frame):
@@ -155,23 +196,40 @@ def _evaluate_lang(gold, disc, log, njobs):
         details['grouping_fscore'] = 'NA'
 
     log.debug('computing token and type...')
-    token_type = TokenType(gold, disc)
-    token_type.compute_token_type()
-    details['token_precision'], details['type_precision'] = (
-        token_type.precision)
-    details['token_recall'], details['type_recall'] = token_type.recall
-    details['token_fscore'], details['type_fscore'] = token_type.fscore
-    details['words'] = len(token_type.type_seen)
+    if engine == 'native':
+        precision, recall, fscore, types = track2_engine.token_type(
+            words, phones, intervals)
+    else:
+        token_type = TokenType(gold, disc)
+        token_type.compute_token_type()
+        precision = token_type.precision
+        recall = token_type.recall
+        fscore = token_type.fscore
+        types = len(token_type.type_seen)
+    details['token_precision'], details['type_precision'] = precision
+    details['token_recall'], details['type_recall'] = recall
+    details['token_fscore'], details['type_fscore'] = fscore
+    details['words'] = types
 
     log.debug('computing coverage...')
-    coverage = Coverage(gold, disc)
-    coverage.compute_coverage()
-    details['coverage'] = coverage.coverage
+    if engine == 'native':
+        details['coverage'] = track2_engine.coverage(phones, intervals)
+    else:
+        coverage = Coverage(gold, disc)
+        coverage.compute_coverage()
+        details['coverage'] = coverage.coverage
 
     log.debug('computing ned...')
-    ned = Ned(disc)
-    ned.compute_ned()
-    details['ned'] = ned.ned
-    details['pairs'] = ned.n_pairs
-
-    return ned.ned, coverage.coverage, details
+    if engine == 'native':
+        details['ned'], details['pairs'] = track2_engine.ned(
+            disc.clusters, max_pairs=ned_max_pairs)
+        if ned_max_pairs is not None:
+            log.info(
+                'NED estimated on at most %s pairs per class', ned_max_pairs)
+    else:
+        ned = Ned(disc)
+        ned.compute_ned()
+        details['ned'] = ned.ned
+        details['pairs'] = ned.n_pairs
+
+    return details['ned'], details['coverage'], details
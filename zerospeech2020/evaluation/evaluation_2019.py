@@ -1,24 +1,31 @@
 """Evaluation for the 2019 part of the ZeroSpeech2020 challenge"""
 
+import contextlib
 import glob
 import logging
 import os
 import shutil
 import tempfile
 
+import joblib
+import numpy as np
+
 from zerospeech2020.evaluation import abx, bitrate
 
 
 _VALID_LANGUAGES = ['english', 'surprise']
 _VALID_DISTANCES = ['cosine', 'KL', 'levenshtein']
+_VALID_FOLDERS = ['test', 'auxiliary_embedding1', 'auxiliary_embedding2']
 
 
 def evaluate(submission, dataset, languages, distance, normalize,
-             njobs=1, log=logging.getLogger()):
+             njobs=1, log=logging.getLogger(), abx_options=None,
+             features=None):
     """Evaluation of the 2019 track: bitrate and ABX score
 
     Compute the ABX score and bitrate on the specified languages and durations
-    subsets.
+    subsets. The bitrate and ABX computations of all the languages and
+    embedding folders are run as independent jobs sharing `njobs` CPU cores.
 
     Parameters
     ----------
@@ -41,6 +48,15 @@ def evaluate(submission, dataset, languages, distance, normalize,
 
     log (logging.Logger): where to send log messages.
 
+    abx_options (dict): extra options forwarded to abx.abx (e.g. the ABX
+        engine to use).
+
+    features (dict): the features already parsed during validation, as
+        features[folder][filename] = (times, features), folder being the
+        real path of an evaluated folder (see features_cache() and
+        zerospeech2020.read_2019_features.read_all). The files in it are not
+        read again.
+
     Raises
     ------
     ValueError if the method fails.
@@ -57,20 +73,55 @@ def evaluate(submission, dataset, languages, distance, normalize,
             f'invalid distance {distance}, must be in '
             f'{", ".join(_VALID_DISTANCES)}')
 
-    score = {language: _evaluate_single(
-        submission, dataset, language, distance, normalize, njobs, log)
-             for language in languages}
+    folders = [
+        (language, folder) for language in languages
+        for folder in _list_folders(submission, language)]
+    details = _evaluate_folders(
+        submission, dataset, folders, normalize, njobs, log,
+        abx_options=abx_options, features=features)
+
+    score = {language: _summarize(
+        submission,
+        {folder: details[(lang, folder)]
+         for lang, folder in folders if lang == language},
+        distance) for language in languages}
     return {'2019': score}
 
 
+def features_cache(submission, languages):
+    """Returns an empty cache of the features of the folders to evaluate
+
+    The cache is filled by the validation of the submission (see
+    zerospeech2020.validation.submission_2019) and passed to evaluate() as
+    `features`. Only the folders evaluated for `languages` are cached, the
+    other validated folders are not kept in memory.
+
+    """
+    return {
+        os.path.realpath(os.path.join(submission, '2019', language, folder)):
+        {} for language in languages for folder in _VALID_FOLDERS}
+
+
 def _get_features(feature_folder, feat_tmp):
     for file_path in glob.iglob(feature_folder + "/*.txt"):
         filename = file_path.split('/')[-1]
-        shutil.copyfile(file_path, os.path.join(feat_tmp, filename))
+        os.symlink(
+            os.path.abspath(file_path), os.path.join(feat_tmp, filename))
+
+
+@contextlib.contextmanager
+def _features_directory(feature_folder):
+    """Yields a temporary folder with links to the features in a folder"""
+    feat_tmp = tempfile.mkdtemp()
+    try:
+        _get_features(feature_folder, feat_tmp)
+        yield feat_tmp
+    finally:
+        shutil.rmtree(feat_tmp)
 
 
-def _evaluate_single(submission, dataset, language,
-                     distance, normalize, njobs, log):
+def _list_folders(submission, language):
+    """Returns the embedding folders to evaluate for the given `language`"""
     # ensure the language is valid
     if language not in _VALID_LANGUAGES:
         raise ValueError(
@@ -80,42 +131,199 @@ def _evaluate_single(submission, dataset, language,
     if not os.path.isdir(submission):
         raise ValueError('2019 submission not found')
 
-    # to store the results
-    details_abx = {}
-    details_bitrate = {}
-
-    for folder in ['test', 'auxiliary_embedding1', 'auxiliary_embedding2']:
-        # check if folder exist, otherise don't evaluate
-        feature_folder = os.path.join(submission, "2019", language, folder)
-        if not os.path.isdir(feature_folder):
-            continue
-
-        log.info('evaluating 2019 track for %s %s', language, folder)
-
-        # Create temp folder for features
-        feat_tmp = tempfile.mkdtemp()
-        try:
-            _get_features(feature_folder, feat_tmp)
-
-            # compute bitrate
-            log.debug('computing bitrate ...')
-            bitrate_score = bitrate.bitrate(feat_tmp, language)
-            details_bitrate[folder] = bitrate_score
-            details_abx[folder] = {}
-
-            # compute abx score
-            for distance_fun in _VALID_DISTANCES:
-                details_abx[folder][distance_fun] = abx.abx(
-                    feat_tmp,
-                    '2019',
-                    abx.get_tasks(dataset, '2019')[language],
-                    'across',
-                    distance_fun,
-                    normalize if distance_fun == "cosine" else None,
-                    njobs=njobs,
-                    log=log)
-        finally:
-            shutil.rmtree(feat_tmp)
+    # check if folder exist, otherise don't evaluate
+    return [
+        folder for folder in _VALID_FOLDERS
+        if os.path.isdir(os.path.join(submission, '2019', language, folder))]
+
+
+def _evaluate_folder(submission, dataset, language, folder,
+                     normalize, njobs, log, abx_options=None, features=None):
+    """Returns the bitrate and the ABX scores of a single embedding folder"""
+    return _evaluate_folders(
+        submission, dataset, [(language, folder)], normalize, njobs, log,
+        abx_options=abx_options, features=features)[(language, folder)]
+
+
+def _evaluate_folders(submission, dataset, folders, normalize, njobs, log,
+                      abx_options=None, features=None):
+    """Evaluates the embedding folders with parallel jobs
+
+    There is one job per folder when its ABX distances are computed in a
+    single pass (see abx.single_pass), one per folder and distance otherwise.
+    The jobs are run in parallel within `njobs`, any remaining core being
+    given to the ABX computations. The jobs are given the path to the
+    folders and parse the features themselves, the first job of a folder
+    computing its bitrate and reusing the parsed features for ABX.
+
+    The bitrate of a folder whose features have been parsed during the
+    validation (see `features`) is computed here from those features, which
+    are then reused for ABX. When the jobs run in worker processes, the
+    features are first saved to a temporary folder and the workers map them
+    from there (see _shared_features).
+
+    Returns a dict (language, folder) -> (bitrate, abx scores) for each
+    (language, folder) in `folders`.
+
+    """
+    if not folders:
+        return {}
+
+    njobs = joblib.effective_n_jobs(njobs)
+    paths = {
+        key: os.path.join(submission, '2019', *key) for key in folders}
+
+    # the parsed features are released once the folders are evaluated
+    caches = {
+        key: (features or {}).pop(os.path.realpath(path), None)
+        for key, path in paths.items()}
+
+    log.info(
+        'evaluating 2019 track for %s',
+        ', '.join(f'{language} {folder}' for language, folder in folders))
+
+    bitrates = {
+        key: _bitrate(paths[key], key[0], caches[key])
+        for key in folders if caches[key]}
+
+    if abx.single_pass(abx_options):
+        jobs = [(key, _VALID_DISTANCES) for key in folders]
+    else:
+        jobs = [
+            (key, [distance])
+            for key in folders for distance in _VALID_DISTANCES]
+    abx_njobs = min(njobs, len(jobs))
+
+    # the bitrate is computed by the first job of each remaining folder
+    with_bitrate = []
+    for key, _ in jobs:
+        with_bitrate.append(key not in bitrates)
+        bitrates.setdefault(key, None)
+
+    with tempfile.TemporaryDirectory() as shared:
+        if abx_njobs > 1:
+            caches = {
+                key: _shared_features(
+                    cache, os.path.join(shared, str(index)))
+                if cache else None
+                for index, (key, cache) in enumerate(caches.items())}
+
+        results = joblib.Parallel(n_jobs=abx_njobs)(
+            joblib.delayed(_evaluate_job)(
+                paths[key], dataset, key[0], distances, normalize,
+                max(1, njobs // abx_njobs), log, log.getEffectiveLevel(),
+                abx_options, caches[key], do_bitrate)
+            for (key, distances), do_bitrate in zip(jobs, with_bitrate))
+
+    for (key, _), (bitrate_score, _) in zip(jobs, results):
+        if bitrate_score is not None:
+            bitrates[key] = bitrate_score
+
+    return {
+        key: (bitrates[key], {
+            distance: scores[distance]
+            for (k, _), (_, scores) in zip(jobs, results) if k == key
+            for distance in scores})
+        for key in folders}
+
+
+def _shared_features(cache, directory):
+    """Returns the features of `cache` mapped from .npy files in `directory`
+
+    The features are saved in `directory` and replaced by read-only memory
+    maps of the saved files, which joblib sends to the worker processes by
+    reference instead of copying them.
+
+    """
+    os.makedirs(directory)
+    shared = {}
+    for index, (filename, arrays) in enumerate(cache.items()):
+        files = [
+            os.path.join(directory, f'{index}_{name}.npy')
+            for name in ('times', 'features')]
+        for path, array in zip(files, arrays):
+            np.save(path, array)
+        shared[filename] = tuple(
+            np.load(path, mmap_mode='r') for path in files)
+    return shared
+
+
+def _evaluate_job(feature_folder, dataset, language, distances, normalize,
+                  njobs, log, level, abx_options, cache, do_bitrate):
+    """Returns the bitrate (None if not `do_bitrate`) and ABX scores of a job
+
+    `cache` is the features already parsed for the folder, possibly as
+    memory maps (see _shared_features), or None to parse them in this job.
+
+    """
+    _configure_log(log, level)
+    cache = {} if cache is None else cache
+
+    bitrate_score = None
+    if do_bitrate:
+        log.debug(
+            'computing bitrate for %s %s ...',
+            language, os.path.basename(feature_folder))
+        bitrate_score = _bitrate(feature_folder, language, cache)
+
+    log.debug(
+        'computing abx scores for %s %s ...',
+        language, os.path.basename(feature_folder))
+    return bitrate_score, _abx(
+        feature_folder, dataset, language, distances, normalize, njobs, log,
+        abx_options, cache)
+
+
+def _configure_log(log, level):
+    """Configures the logging of a worker process as in the main process
+
+    The logging configuration is not inherited by the joblib workers, whose
+    log messages would be lost otherwise.
+
+    """
+    if not logging.getLogger().handlers:
+        logging.basicConfig(
+            format='[%(levelname)s] %(message)s', level=level)
+    log.setLevel(level)
+
+
+def _bitrate(feature_folder, language, cache):
+    """Returns the bitrate of a folder, the parsed features going in `cache`"""
+    with _features_directory(feature_folder) as feat_tmp:
+        return bitrate.bitrate(feat_tmp, language, cache=cache)
+
+
+def _abx(feature_folder, dataset, language, distances, normalize,
+         njobs, log, abx_options, cache):
+    """Returns the ABX scores of a folder as a dict distance -> score"""
+    with _features_directory(feature_folder) as feat_tmp:
+        return abx.abx_metrics(
+            feat_tmp,
+            '2019',
+            abx.get_tasks(dataset, '2019')[language],
+            'across',
+            [(distance, normalize if distance == "cosine" else None)
+             for distance in distances],
+            njobs=njobs,
+            log=log,
+            features=cache,
+            **abx.incremental_options(
+                abx_options, '2019', language,
+                os.path.basename(feature_folder)))
+
+
+def _summarize(submission, details, distance):
+    """Gathers the scores of the evaluated folders of a language
+
+    `details` is a dict folder -> (bitrate, abx scores) as returned by
+    _evaluate_folder.
+
+    """
+    details_bitrate = {
+        folder: bitrate_score
+        for folder, (bitrate_score, _) in details.items()}
+    details_abx = {
+        folder: abx_score for folder, (_, abx_score) in details.items()}
 
     try:
         return {
@@ -2,15 +2,12 @@
 """Evaluate submission for the ZeroSpeech2020 challenge"""
 
 import argparse
+import importlib
 import json
 import logging
 import os
 import sys
 
-from zerospeech2020.evaluation import (
-    evaluation_2017_track1,
-    evaluation_2017_track2,
-    evaluation_2019)
 from zerospeech2020.validation import utils
 
 
@@ -19,15 +16,22 @@ logging.basicConfig(format='[%(levelname)s] %(message)s', level=logging.INFO)
 log = logging.getLogger()
 
 
-def _add_common_arguments(parser, add_dataset=True, add_njobs=True):
-    parser.add_argument(
-        'submission',
-        help='path to submission (must be a directory or a zip archive)')
-    parser.add_argument(
-        '-o', '--output', metavar='<json>', default=None,
-        help='''output JSON file to write. If not specified, write on
-        standard output. If the file already exists and is a valid JSON file,
-        update its content.''')
+def _add_common_arguments(parser, add_dataset=True, add_njobs=True,
+                          add_submission=True):
+    if add_submission:
+        parser.add_argument(
+            'submission',
+            help='path to submission (must be a directory or a zip archive)')
+        parser.add_argument(
+            '-o', '--output', metavar='<json>', default=None,
+            help='''output JSON file to write. If not specified, write on
+            standard output. If the file already exists and is a valid JSON
+            file, update its content.''')
+        parser.add_argument(
+            '--validate', action='store_true',
+            help='''validate the submission before evaluating it. The 2019
+            features parsed during validation are reused by the evaluation,
+            so that each file is read only once.''')
 
     if add_dataset:
         parser.add_argument(
@@ -47,6 +51,101 @@ def _add_common_arguments(parser, add_dataset=True, add_njobs=True):
         help='increase verbosity level to DEBUG, default is INFO.')
 
 
+def _add_abx_arguments(parser):
+    parser.add_argument(
+        '--abx-engine', default='abxpy', choices=['abxpy', 'native'],
+        help='''ABX implementation to use: 'abxpy' runs the ABXpy pipeline,
+        'native' runs the in-package engine on compiled ABX tasks (see the
+        compile-tasks command), default to %(default)s.''')
+    parser.add_argument(
+        '--preview', type=int, nargs='?', const=10, default=None,
+        metavar='<int>',
+        help='''compute a fast approximate ABX score on at most <int>
+        triplets (default to %(const)s) sampled in each (context, speaker,
+        phone) cell, reported with a 95%% bootstrap confidence interval''')
+    parser.add_argument(
+        '--dtype', default='float64', choices=['float64', 'float32'],
+        help='''type of the features used for ABX, float32 halves the memory
+        and disk usage and changes the ABX error rates by less than 0.01
+        point (see abx.FLOAT32_TOLERANCE), default to %(default)s''')
+    parser.add_argument(
+        '--incremental', metavar='<dir>', default=None,
+        help='''with the native ABX engine, save the features hashes and
+        pairs distances in <dir>. When evaluating a new version of the
+        submission with the same <dir>, only the distances involving modified
+        features files are computed, the scores are identical to a full
+        evaluation.''')
+    parser.add_argument(
+        '--prune', action='store_true',
+        help='''with the native ABX engine and the cosine distance, compute
+        cheap bounds of the DTW distances and skip the distances not
+        required to decide the triplets, the scores are identical to a full
+        evaluation''')
+    parser.add_argument(
+        '--work-dir', metavar='<dir>', default=None,
+        help='''keep the artifacts of the ABX evaluations (distances, scores
+        and analyze tables) in <dir> instead of a temporary directory, to be
+        rescored later with --rescore-from''')
+    parser.add_argument(
+        '--rescore-from', metavar='<dir>', default=None,
+        help='''compute the ABX scores from the distances saved in <dir> by
+        a previous evaluation with --work-dir, running only the score,
+        analyze and average stages''')
+    parser.add_argument(
+        '--h5-compression', default='lzf', choices=['none', 'lzf', 'gzip'],
+        help='''with the ABXpy engine, compression of the features file
+        written in the temporary directory: 'lzf' is fast, 'gzip' gives
+        smaller files, 'none' uses more disk space but less CPU, default to
+        %(default)s''')
+
+
+def _abx_options(args):
+    """Returns the options forwarded to abx.abx from command line arguments"""
+    return {
+        'engine': args.abx_engine,
+        'preview': args.preview,
+        'dtype': args.dtype,
+        'incremental': args.incremental,
+        'prune': args.prune,
+        'work_dir': args.work_dir,
+        'rescore_from': args.rescore_from,
+        'h5_compression': (
+            None if args.h5_compression == 'none' else args.h5_compression)}
+
+
+def _add_track2_arguments(parser):
+    parser.add_argument(
+        '--track2-engine', default='tde', choices=['tde', 'native'],
+        help='''implementation of the 2017 track2 metrics: 'tde' runs the
+        tde package, 'native' runs the in-package engine on columnar
+        intervals for the boundary, token/type and coverage metrics and
+        computes the NED of each distinct pair of transcriptions once (the
+        grouping is always computed by tde), default to %(default)s.''')
+    parser.add_argument(
+        '--ned-max-pairs', type=int, default=None, metavar='<int>',
+        help='''with the native track2 engine, estimate the NED of the
+        classes having more than <int> pairs of fragments on <int> sampled
+        pairs, default is to use all the pairs''')
+
+
+def _track2_options(args):
+    """Returns the options of the 2017 track2 from command line arguments"""
+    return {
+        'engine': args.track2_engine,
+        'ned_max_pairs': args.ned_max_pairs}
+
+
+def _import(name):
+    """Imports an evaluation module
+
+    The evaluation modules depend on heavy packages (ABXpy, tde, pandas,
+    h5py...), they are imported only when the requested track needs them so
+    that the program starts fast.
+
+    """
+    return importlib.import_module(f'zerospeech2020.evaluation.{name}')
+
+
 def _write_output(score, output):
     log.info(
         'writing score to %s',
@@ -68,7 +167,9 @@ def _parse_arguments():
     # define subparsers for editions/tracks
     subparser = parser.add_subparsers(
         help='''Choose the track you want to evaluate.
-        Choices are 2017-track1, 2017-track2, 2019 or all.''', dest='track')
+        Choices are 2017-track1, 2017-track2, 2019, all, batch,
+        compile-tasks or abx-shard.''',
+        dest='track')
 
     # parser for 2017 track1 part of the challenge
     parser_2017_track1 = subparser.add_parser(
@@ -76,6 +177,7 @@ def _parse_arguments():
         description='''Evaluation of the 2017 track1 part of the challenge,
         the 2 distances (cosine and KL) are evaluated''')
     _add_common_arguments(parser_2017_track1)
+    _add_abx_arguments(parser_2017_track1)
     parser_2017_track1.add_argument(
         '-l', '--language', default=None,
         choices=['english', 'french', 'mandarin'],
@@ -98,12 +200,14 @@ def _parse_arguments():
         '-l', '--language', default=None,
         choices=['english', 'french', 'mandarin'],
         help='Choose language to evaluate, default is to evaluate all.')
+    _add_track2_arguments(parser_2017_track2)
 
     # parser for 2019 part of the challenge
     parser_2019 = subparser.add_parser(
         '2019',
         description='Evaluation of 2019 part of the challenge')
     _add_common_arguments(parser_2019)
+    _add_abx_arguments(parser_2019)
     parser_2019.add_argument(
         '-d', '--distance', default='cosine',
         choices=['cosine', 'KL', 'levenshtein'],
@@ -118,6 +222,8 @@ def _parse_arguments():
         description='Evaluation of all the parts of the challenge at once, '
         'this assumes a complete submission')
     _add_common_arguments(parser_all)
+    _add_abx_arguments(parser_all)
+    _add_track2_arguments(parser_all)
 
     parser_all.add_argument(
         '-n17', '--normalize_2017', type=bool, metavar='<bool>', default=True,
@@ -132,9 +238,129 @@ def _parse_arguments():
         help="""choose to normalize DTW distance for 2019,
         default to %(default)s.""")
 
+    # parser for the evaluation of several submissions at once
+    parser_batch = subparser.add_parser(
+        'batch',
+        fromfile_prefix_chars='@',
+        description='''Evaluation of several submissions at once, sharing a
+        single pool of workers. Submissions can be listed in a text file (one
+        per line) given as @<file>.''')
+    parser_batch.add_argument(
+        'submissions', nargs='+', metavar='submission',
+        help='''path to a submission (directory or zip archive) or to a
+        directory containing submissions''')
+    parser_batch.add_argument(
+        '-o', '--output-dir', metavar='<dir>', required=True,
+        help='''output directory where to write a JSON file per submission
+        and the results.tsv table''')
+    parser_batch.add_argument(
+        '-t', '--track', dest='tracks', action='append',
+        choices=['2017-track1', '2017-track2', '2019'],
+        help='''track to evaluate, can be specified several times,
+        default is to evaluate all''')
+    _add_common_arguments(parser_batch, add_submission=False)
+    _add_abx_arguments(parser_batch)
+    _add_track2_arguments(parser_batch)
+
+    parser_batch.add_argument(
+        '-n17', '--normalize_2017', type=bool, metavar='<bool>', default=True,
+        help="""choose to normalize DTW distance for 2017 track1,
+        default to %(default)s.""")
+    parser_batch.add_argument(
+        '-d19', '--distance-2019', default='cosine',
+        choices=['cosine', 'KL', 'levenshtein'],
+        help='Choose metric for 2019 ABX score, default to %(default)s')
+    parser_batch.add_argument(
+        '-n19', '--normalize-2019', type=bool, default=True, metavar='<bool>',
+        help="""choose to normalize DTW distance for 2019,
+        default to %(default)s.""")
+
+    # parser for the compilation of the ABX tasks
+    parser_compile = subparser.add_parser(
+        'compile-tasks',
+        description='''Compile all the ABX task files of the dataset into
+        memory-mapped indexes used by the native ABX engine. This is done
+        once, the compiled tasks are stored in the directory specified by the
+        ZS2020_CACHE environment variable (default to
+        ~/.cache/zerospeech2020).''')
+    _add_common_arguments(
+        parser_compile, add_njobs=False, add_submission=False)
+
+    # parser for the sharded evaluation of an ABX task
+    parser_shard = subparser.add_parser(
+        'abx-shard',
+        description='''Sharded evaluation of a single ABX task with the native
+        engine. 'prepare' splits the task by by-blocks into shards queued in
+        <queue>, 'work' evaluates the queued shards (any number of workers
+        can run concurrently, on hosts sharing <queue>), 'requeue' requeues
+        the shards of interrupted workers and 'merge' computes the ABX score
+        once all the shards are done, the score being identical to a single
+        node evaluation.''')
+    parser_shard.add_argument(
+        'action', choices=['prepare', 'work', 'requeue', 'merge'],
+        help='the action to run on the queue')
+    parser_shard.add_argument(
+        'queue', metavar='<queue>',
+        help='the queue directory, on a filesystem shared by the workers')
+    parser_shard.add_argument(
+        '-o', '--output', metavar='<json>', default=None,
+        help='''with merge, output JSON file to write. If not specified,
+        write on standard output.''')
+    _add_common_arguments(
+        parser_shard, add_dataset=False, add_submission=False)
+
+    group = parser_shard.add_argument_group('prepare arguments')
+    group.add_argument(
+        '--features', metavar='<dir>',
+        help='the features folder to evaluate')
+    group.add_argument(
+        '--task', metavar='<abx>', help='the ABX task file to evaluate')
+    group.add_argument(
+        '--year', choices=['2017', '2019'],
+        help='the part of the challenge the features belong to')
+    group.add_argument(
+        '--task-type', choices=['across', 'within'],
+        help='the type of the ABX task')
+    group.add_argument(
+        '-d', '--distance', default='cosine',
+        choices=['cosine', 'KL', 'levenshtein'],
+        help='Choose metric for ABX score, default to %(default)s')
+    group.add_argument(
+        '-n', '--normalize', type=bool, default=True, metavar='<bool>',
+        help="choose to normalize DTW distance, default to %(default)s.")
+    group.add_argument(
+        '--shards', type=int, default=100, metavar='<int>',
+        help='number of shards, default to %(default)s')
+    group.add_argument(
+        '--dtype', default='float64', choices=['float64', 'float32'],
+        help='type of the features, default to %(default)s')
+
     return parser.parse_args()
 
 
+def _abx_shard(args):
+    """Runs an action of the sharded ABX evaluation"""
+    abx_shard = _import('abx_shard')
+
+    if args.action == 'prepare':
+        for name in ('features', 'task', 'year', 'task_type'):
+            if getattr(args, name) is None:
+                raise ValueError(
+                    f'--{name.replace("_", "-")} is required with prepare')
+        abx_shard.prepare(
+            args.queue, args.features, args.task, args.year, args.task_type,
+            args.distance, args.normalize, args.shards, dtype=args.dtype,
+            log=log)
+    elif args.action == 'work':
+        abx_shard.work(args.queue, njobs=args.njobs, log=log)
+    elif args.action == 'requeue':
+        abx_shard.requeue(args.queue, log=log)
+    else:  # args.action == 'merge'
+        _write_output(
+            {'abx': abx_shard.merge(args.queue, log=log)},
+            args.output or sys.stdout)
+
+
 def main():
     """Entry point of the evalaution program"""
     # parse arguments
@@ -145,7 +371,7 @@ def main():
         log.setLevel(logging.DEBUG)
 
     # complain if the output file already exists
-    if args.output and os.path.isfile(args.output):
+    if getattr(args, 'output', None) and os.path.isfile(args.output):
         log.warning(
             'output file %s already exists, will be overwritten', args.output)
 
@@ -162,11 +388,48 @@ def main():
     if dataset and not os.path.isdir(dataset):
         raise ValueError(f'path to dataset not found: {dataset}')
 
-    # unzip the submission if needed
-    submission = utils.unzip_if_needed(args.submission, log)
-
     # launch evaluation
     try:
+        if args.track == 'compile-tasks':
+            _import('abx').compile_tasks(dataset, log=log)
+            return
+
+        if args.track == 'abx-shard':
+            _abx_shard(args)
+            return
+
+        if args.track == 'batch':
+            batch = _import('batch')
+            batch.evaluate(
+                batch.find_submissions(args.submissions),
+                dataset,
+                args.output_dir,
+                tracks=args.tracks or ['2017-track1', '2017-track2', '2019'],
+                normalize_2017=args.normalize_2017,
+                distance_2019=args.distance_2019,
+                normalize_2019=args.normalize_2019,
+                njobs=args.njobs,
+                log=log,
+                abx_options=_abx_options(args),
+                track2_options=_track2_options(args))
+            return
+
+        # unzip the submission if needed
+        submission = utils.unzip_if_needed(args.submission, log)
+
+        # validate the submission if required, keeping the parsed 2019
+        # features of the evaluated folders for evaluation
+        features_2019 = None
+        if args.validate:
+            from zerospeech2020.validation.submission_2020 import (
+                Submission2020)
+            if args.track in ('2019', 'all'):
+                features_2019 = _import('evaluation_2019').features_cache(
+                    submission, ['english'])
+            Submission2020(
+                submission, njobs=getattr(args, 'njobs', 1), log=log,
+                features_2019=features_2019).validate()
+
         if args.track == '2017-track1':
             languages = (
                 [args.language] if args.language
@@ -174,58 +437,66 @@ def main():
             durations = (
                 [args.duration] if args.duration else ['1s', '10s', '120s'])
 
-            score = evaluation_2017_track1.evaluate(
+            score = _import('evaluation_2017_track1').evaluate(
                 submission,
                 dataset,
                 languages,
                 durations,
                 args.normalize,
                 njobs=args.njobs,
-                log=log)
+                log=log,
+                abx_options=_abx_options(args))
 
         elif args.track == '2017-track2':
             languages = (
                 [args.language] if args.language
                 else ['english', 'french', 'mandarin'])
 
-            score = evaluation_2017_track2.evaluate(
+            score = _import('evaluation_2017_track2').evaluate(
                 submission,
                 languages,
-                log=log)
+                log=log,
+                track2_options=_track2_options(args))
 
         elif args.track == '2019':
-            score = evaluation_2019.evaluate(
+            score = _import('evaluation_2019').evaluate(
                 submission,
                 dataset,
                 ['english'],
                 args.distance,
                 args.normalize,
                 njobs=args.njobs,
-                log=log)
+                log=log,
+                abx_options=_abx_options(args),
+                features=features_2019)
 
         else:  # args.track == 'all'
-            score_2019 = evaluation_2019.evaluate(
+            score_2019 = _import('evaluation_2019').evaluate(
                 submission,
                 dataset,
                 ['english'],
                 args.distance_2019,
                 args.normalize_2019,
                 njobs=args.njobs,
-                log=log)
+                log=log,
+                abx_options=_abx_options(args),
+                features=features_2019)
 
-            score_2017_track1 = evaluation_2017_track1.evaluate(
+            score_2017_track1 = _import('evaluation_2017_track1').evaluate(
                 submission,
                 dataset,
                 ['english', 'french', 'mandarin'],
                 ['1s', '10s', '120s'],
                 args.normalize_2017,
                 njobs=args.njobs,
-                log=log)
+                log=log,
+                abx_options=_abx_options(args))
 
-            score_2017_track2 = evaluation_2017_track2.evaluate(
+            score_2017_track2 = _import('evaluation_2017_track2').evaluate(
                 submission,
                 ['english', 'french', 'mandarin'],
-                log=log)
+                log=log,
+                track2_options=_track2_options(args))
 
             score = {
                 '2019': score_2019['2019'],
@@ -0,0 +1,608 @@
+"""In-package engine for the 2017 track2 metrics
+
+The boundary, coverage and token/type metrics are computed on a columnar
+representation of the gold and discovered intervals (see Intervals), built
+once for all the metrics: the intervals overlapping a time range, or the
+phones covered by the discovered intervals, are found by binary search and
+interval union instead of a walk in the interval trees of tde.
+
+The NED (normalized edit distance) of the discovered classes is computed
+without enumerating the pairs of fragments in Python, as
+tde.measures.ned.Ned does:
+
+* the phone transcription of each fragment (silences removed) is mapped once
+  to a sequence of integers, the identical transcriptions sharing the same
+  sequence,
+* in each class, the pairs of fragments are grouped by pair of sequences,
+  weighted by their number of occurrences,
+* the edit distance of each distinct pair of sequences (over all the classes)
+  is computed once, by batches of pairs in vectorized dynamic programming.
+
+The NED sum is accumulated exactly, so the NED is the one of tde up to the
+rounding of its final average.
+
+"""
+
+import collections
+import functools
+import math
+
+import numpy as np
+
+
+def ned(clusters, max_pairs=None, seed=0, batch_size=4096):
+    """Returns the NED of the discovered classes and their number of pairs
+
+    Parameters
+    ----------
+    clusters (dict): class -> list of fragments, as the `clusters` attribute
+        of tde.readers.disc_reader.Disc. A fragment is a tuple whose last
+        element is its phone transcription.
+
+    max_pairs (int): when specified, the NED of a class with more pairs is
+        estimated on `max_pairs` pairs sampled uniformly, default is to use
+        all the pairs.
+
+    seed (int): the seed of the random generator used to sample the pairs
+
+    batch_size (int): the number of edit distances computed at once
+
+    Returns
+    -------
+    ned (float): the average NED over all the pairs of fragments in the same
+        class, NaN if there is no pair, as tde.measures.ned.Ned.ned.
+
+    n_pairs (int): the number of pairs of fragments in the same class, as
+        tde.measures.ned.Ned.n_pairs.
+
+    """
+    if max_pairs is not None and max_pairs < 1:
+        raise ValueError(
+            f'max_pairs must be a positive integer, it is {max_pairs}')
+
+    sequences, classes = _encode(clusters)
+    lengths = np.asarray([len(s) for s in sequences], dtype=np.int64)
+
+    # the pairs of sequences in each class, with their weights
+    random = np.random.default_rng(seed)
+    n_pairs = 0
+    keys, weights = [], []
+    for ids in classes:
+        n = len(ids)
+        n_pairs += n * (n - 1) // 2
+        first, second, weight = _class_pairs(ids, max_pairs, random)
+        keys.append(
+            np.minimum(first, second) * len(sequences)
+            + np.maximum(first, second))
+        weights.append(weight)
+
+    if not n_pairs:
+        return float('nan'), 0
+
+    # each distinct pair of sequences is computed once
+    keys, inverse = np.unique(np.concatenate(keys), return_inverse=True)
+    weights = np.bincount(inverse, weights=np.concatenate(weights))
+    first, second = keys // len(sequences), keys % len(sequences)
+
+    distances = np.zeros(len(keys), dtype=np.int64)
+    distinct = np.where(first != second)[0]
+    distances[distinct] = _edit_distances(
+        sequences, lengths, first[distinct], second[distinct], batch_size)
+    norms = np.maximum(lengths[first], lengths[second])
+
+    # two empty transcriptions have a NED of 1
+    empty = norms == 0
+    distances[empty], norms[empty] = 1, 1
+
+    # the weighted distances are integers (unless sampled), their sums by
+    # norm are exact
+    sums = np.bincount(norms, weights=weights * distances)
+    return math.fsum(
+        sums[norm] / norm for norm in np.nonzero(sums)[0]) / n_pairs, n_pairs
+
+
+def _encode(clusters):
+    """Maps the transcriptions to sequences of integers
+
+    Returns the list of distinct sequences (as numpy arrays) and, for each
+    class, the array of the sequences indices of its fragments.
+
+    """
+    phones = collections.defaultdict(lambda: len(phones))
+    sequences = {}
+    classes = []
+    for fragments in clusters.values():
+        classes.append(np.asarray([
+            sequences.setdefault(
+                tuple(phn for phn in fragment[-1] if phn != 'SIL'),
+                len(sequences))
+            for fragment in fragments], dtype=np.int64))
+
+    return [
+        np.asarray([phones[phn] for phn in sequence], dtype=np.int64)
+        for sequence in sequences], classes
+
+
+def _class_pairs(ids, max_pairs, random):
+    """Returns the pairs of sequences in a class, with their weights
+
+    The pairs of fragments are grouped by distinct pair of sequences, or
+    sampled when there are more than `max_pairs`.
+
+    """
+    n = len(ids)
+    total = n * (n - 1) // 2
+    if max_pairs is not None and total > max_pairs:
+        # uniform sampling of pairs of distinct fragments
+        first = random.integers(n, size=max_pairs)
+        second = random.integers(n - 1, size=max_pairs)
+        second += second >= first
+        return (
+            ids[first], ids[second],
+            np.full(max_pairs, total / max_pairs))
+
+    sequences, counts = np.unique(ids, return_counts=True)
+    first, second = np.triu_indices(len(sequences), k=1)
+    return (
+        np.concatenate((sequences[first], sequences)),
+        np.concatenate((sequences[second], sequences)),
+        np.concatenate((
+            counts[first] * counts[second], counts * (counts - 1) // 2)))
+
+
+def _edit_distances(sequences, lengths, first, second, batch_size):
+    """Returns the edit distances between the pairs of sequences
+
+    The pairs are sorted by length and processed by batches, the dynamic
+    programming being vectorized over the pairs of a batch and the positions
+    in the second sequences.
+
+    """
+    distances = np.zeros(len(first), dtype=np.int64)
+    order = np.argsort(
+        np.maximum(lengths[first], lengths[second]), kind='stable')
+    for batch in np.array_split(
+            order, max(int(np.ceil(len(order) / batch_size)), 1)):
+        if len(batch):
+            distances[batch] = _edit_distances_batch(
+                [sequences[s] for s in first[batch]],
+                [sequences[s] for s in second[batch]])
+    return distances
+
+
+def _edit_distances_batch(first, second):
+    n = len(first)
+    len1 = np.asarray([len(s) for s in first])
+    len2 = np.asarray([len(s) for s in second])
+
+    # padding values never match and are beyond the lengths of the sequences
+    seq1 = np.full((n, max(len1.max(), 1)), -1, dtype=np.int64)
+    seq2 = np.full((n, max(len2.max(), 1)), -2, dtype=np.int64)
+    for i, (s1, s2) in enumerate(zip(first, second)):
+        seq1[i, :len(s1)] = s1
+        seq2[i, :len(s2)] = s2
+
+    # row i of the dynamic programming matrix, for all the pairs
+    columns = np.arange(seq2.shape[1] + 1)
+    row = np.tile(columns, (n, 1))
+    distances = len2.copy()
+    for i in range(1, len1.max() + 1):
+        substitution = row[:, :-1] + (seq1[:, i - 1:i] != seq2)
+        candidates = np.empty_like(row)
+        candidates[:, 0] = i
+        candidates[:, 1:] = np.minimum(substitution, row[:, 1:] + 1)
+
+        # insertions: row[j] = min(candidates[k] + j - k) for k <= j
+        row = np.minimum.accumulate(candidates - columns, axis=1) + columns
+
+        done = np.where(len1 == i)[0]
+        distances[done] = row[done, len2[done]]
+    return distances
+
+
+class Intervals:
+    """Labelled intervals of several files, in columnar arrays
+
+    The intervals are sorted by file and onset, the intervals of a file do not
+    overlap and are a slice of the arrays given by the files bounds.
+
+    Parameters
+    ----------
+    files (list): the names of the files
+
+    bounds (numpy.array): the intervals of the file `n` are the ones in
+        [bounds[n], bounds[n + 1]).
+
+    onsets, offsets (numpy.array): the timestamps of the intervals
+
+    labels (numpy.array): the labels of the intervals, as indices in
+        `symbols`
+
+    symbols (numpy.array): the distinct labels
+
+    trees (dict): the interval trees the intervals are built from, if any,
+        as file -> IntervalTree (see from_trees)
+
+    Raises
+    ------
+    ValueError if intervals of a file overlap
+
+    """
+    def __init__(self, files, bounds, onsets, offsets, labels, symbols,
+                 trees=None):
+        self.files = files
+        self.bounds = np.asarray(bounds, dtype=np.int64)
+        self.onsets = np.asarray(onsets, dtype=np.float64)
+        self.offsets = np.asarray(offsets, dtype=np.float64)
+        self.labels = np.asarray(labels, dtype=np.int64)
+        self.symbols = np.asarray(symbols)
+        self.trees = trees
+        self.file_ids = np.repeat(
+            np.arange(len(files)), np.diff(self.bounds))
+
+        same_file = self.file_ids[1:] == self.file_ids[:-1]
+        overlap = same_file & (self.onsets[1:] < self.offsets[:-1])
+        if np.any(overlap):
+            n = np.argmax(overlap)
+            raise ValueError(
+                f'overlapping intervals in {files[self.file_ids[n]]} at '
+                f'{self.onsets[n + 1]}')
+
+    @classmethod
+    def from_trees(cls, trees, files):
+        """Builds the intervals from a dict file -> IntervalTree
+
+        The trees are the ones of tde.readers.gold_reader.Gold, each interval
+        having its label as data. `files` is the list of all the files names,
+        a superset of the trees keys.
+
+        """
+        ids, onsets, offsets, labels = [], [], [], []
+        for n, name in enumerate(files):
+            for onset, offset, label in trees.get(name, ()):
+                ids.append(n)
+                onsets.append(onset)
+                offsets.append(offset)
+                labels.append(label)
+
+        ids = np.asarray(ids, dtype=np.int64)
+        onsets = np.asarray(onsets, dtype=np.float64)
+        offsets = np.asarray(offsets, dtype=np.float64)
+        order = np.lexsort((offsets, onsets, ids))
+        symbols, labels = np.unique(
+            np.asarray(labels, dtype=str), return_inverse=True)
+        return cls(
+            files,
+            np.searchsorted(ids[order], np.arange(len(files) + 1)),
+            onsets[order], offsets[order],
+            labels.reshape(-1)[order], symbols, trees=trees)
+
+    def locate(self, files, times):
+        """Returns the index of the first interval starting at or after times
+
+        `files` are the indices of the files of the timestamps.
+
+        """
+        index = np.zeros(len(files), dtype=np.int64)
+        for n, queries in _by_file(files, len(self.files)):
+            start, stop = self.bounds[n], self.bounds[n + 1]
+            index[queries] = start + np.searchsorted(
+                self.onsets[start:stop], times[queries], side='left')
+        return index
+
+    def overlapping(self, files, onsets, offsets):
+        """Returns the intervals strictly overlapping each time range
+
+        The intervals overlapping the time range `i` are the ones in
+        [start[i], stop[i]), as returned by IntervalTree.overlap().
+
+        """
+        start = np.zeros(len(files), dtype=np.int64)
+        stop = np.zeros(len(files), dtype=np.int64)
+        for n, queries in _by_file(files, len(self.files)):
+            first, last = self.bounds[n], self.bounds[n + 1]
+            # as the intervals do not overlap, the offsets are sorted
+            start[queries] = first + np.searchsorted(
+                self.offsets[first:last], onsets[queries], side='right')
+            stop[queries] = first + np.searchsorted(
+                self.onsets[first:last], offsets[queries], side='left')
+        return start, np.maximum(start, stop)
+
+
+class DiscoveredIntervals:
+    """The discovered intervals, in columnar arrays
+
+    Parameters
+    ----------
+    files (numpy.array): the index of the file of each interval, in the files
+        of the gold
+
+    onsets, offsets (numpy.array): the timestamps of the intervals
+
+    phone_start, phone_stop (numpy.array): the gold phones transcribing the
+        interval `i` are the ones in [phone_start[i], phone_stop[i])
+
+    """
+    def __init__(self, files, onsets, offsets, phone_start, phone_stop):
+        self.files = np.asarray(files, dtype=np.int64)
+        self.onsets = np.asarray(onsets, dtype=np.float64)
+        self.offsets = np.asarray(offsets, dtype=np.float64)
+        self.phone_start = np.asarray(phone_start, dtype=np.int64)
+        self.phone_stop = np.asarray(phone_stop, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.files)
+
+    @classmethod
+    def from_disc(cls, disc, phones):
+        """Builds the intervals from a tde.readers.disc_reader.Disc
+
+        `disc` may also be a zerospeech2020.read_2017_classes.Discovered. The
+        phone transcription of an interval is located in the gold `phones`
+        (as returned by gold_intervals) by its first phone.
+
+        """
+        files = {name: n for n, name in enumerate(phones.files)}
+        ids, onsets, offsets, first, length = list(zip(*(
+            (files[fname], onset, offset, token_ngram[0][0], len(token_ngram))
+            for fname, onset, offset, token_ngram, _ in disc.intervals))) or (
+                [()] * 5)
+
+        ids = np.asarray(ids, dtype=np.int64)
+        start = phones.locate(ids, np.asarray(first, dtype=np.float64))
+        return cls(
+            ids, onsets, offsets, start,
+            start + np.asarray(length, dtype=np.int64))
+
+
+@functools.lru_cache(maxsize=None)
+def gold_intervals(gold):
+    """Returns the words and phones of a tde Gold, as Intervals
+
+    The words and phones share the same list of files. The result is cached,
+    so that the columnar gold is built once per process.
+
+    """
+    files = sorted(set(gold.words) | set(gold.phones))
+    return (
+        Intervals.from_trees(gold.words, files),
+        Intervals.from_trees(gold.phones, files))
+
+
+def _by_file(files, n_files):
+    """Yields (file, indices of `files` equal to file) for each used file"""
+    order = np.argsort(files, kind='stable')
+    bounds = np.searchsorted(files[order], np.arange(n_files + 1))
+    for n in np.nonzero(np.diff(bounds))[0]:
+        yield n, order[bounds[n]:bounds[n + 1]]
+
+
+def _check_files(words, disc):
+    # the files in the gold have at least one word
+    missing = np.diff(words.bounds)[disc.files] == 0
+    if np.any(missing):
+        raise ValueError('{}: file not found in gold'.format(
+            words.files[disc.files[np.argmax(missing)]]))
+
+
+def _fscore(precision, recall):
+    """Returns the fscore, 0 when nothing is found
+
+    tde fails when the precision and recall are both 0, the fscore is 0
+    here.
+
+    """
+    if precision + recall == 0:
+        return 0.0
+    return 2 * (precision * recall) / (precision + recall)
+
+
+def _ratio(numerator, denominator):
+    return numerator / denominator if denominator else np.nan
+
+
+def _points(files, times):
+    """Returns the distinct (file, time) points of each set of points
+
+    The points are given as integer keys, comparable across the sets.
+
+    """
+    ranks = np.unique(
+        np.concatenate(times), return_inverse=True)[1].reshape(-1)
+    keys = np.concatenate(files) * (ranks.max(initial=0) + 1) + ranks
+    return [
+        np.unique(points) for points in np.split(
+            keys, np.cumsum([len(t) for t in times])[:-1])]
+
+
+def boundary(words, phones, disc):
+    """Returns the boundary precision, recall and fscore
+
+    Parameters
+    ----------
+    words, phones (Intervals): the gold, as returned by gold_intervals()
+
+    disc (DiscoveredIntervals): the discovered intervals
+
+    Returns
+    -------
+    precision, recall, fscore (float): as tde.measures.boundary.Boundary,
+        the fscore is 0 when no boundary is found.
+
+    """
+    _check_files(words, disc)
+
+    # the boundaries of the transcriptions of the discovered intervals and of
+    # the gold words
+    disc_down, disc_up, gold_down, gold_up = _points(
+        [disc.files, disc.files, words.file_ids, words.file_ids],
+        [phones.onsets[disc.phone_start], phones.offsets[disc.phone_stop - 1],
+         words.onsets, words.offsets])
+
+    # a boundary both upward and downward is counted once
+    n_disc = len(np.union1d(disc_down, disc_up))
+    n_gold = len(np.union1d(gold_down, gold_up))
+    n_found = len(np.union1d(
+        np.intersect1d(disc_down, gold_down),
+        np.intersect1d(disc_up, gold_up)))
+
+    precision = _ratio(n_found, n_disc)
+    recall = _ratio(n_found, n_gold)
+    return precision, recall, _fscore(precision, recall)
+
+
+def coverage(phones, disc):
+    """Returns the ratio of gold phones covered by the discovered intervals
+
+    Silences (SIL and SPN) are ignored, as in tde.measures.coverage.Coverage.
+
+    """
+    speech = ~np.isin(phones.symbols, ['SIL', 'SPN'])[phones.labels]
+
+    # union of the phones intervals of the discovered intervals
+    marks = np.zeros(len(phones.labels) + 1, dtype=np.int64)
+    np.add.at(marks, disc.phone_start, 1)
+    np.add.at(marks, disc.phone_stop, -1)
+    covered = np.cumsum(marks[:-1]) > 0
+
+    return (
+        int(np.count_nonzero(covered & speech))
+        / int(np.count_nonzero(speech)))
+
+
+def token_type(words, phones, disc):
+    """Returns the token and type precision, recall and fscore
+
+    A discovered interval hits a gold word when its transcription is the one
+    of the word it overlaps the most, as in
+    tde.measures.token_type.TokenType. When several words are overlapped
+    equally, the tie is broken as in tde, in the iteration order of the
+    words overlapping the interval in the gold interval tree (the first one
+    is chosen when `words` has no trees).
+
+    Parameters
+    ----------
+    words, phones (Intervals): the gold, as returned by gold_intervals()
+
+    disc (DiscoveredIntervals): the discovered intervals
+
+    Returns
+    -------
+    precision, recall, fscore (tuple): the (token, type) precision, recall
+        and fscore, the fscore is 0 when no word is found.
+
+    n_types (int): the number of distinct transcriptions of the discovered
+        intervals
+
+    """
+    _check_files(words, disc)
+    types = _sequence_ids(phones.labels, disc.phone_start, disc.phone_stop)
+
+    # the overlapped words of each discovered interval
+    start, stop = words.overlapping(disc.files, disc.onsets, disc.offsets)
+    intervals = np.nonzero(stop > start)[0]
+    interval = np.repeat(intervals, (stop - start)[intervals])
+    word = start[interval] + _ramps((stop - start)[intervals])
+
+    # choose the word with the most overlap, relative to the word duration
+    overlap = (
+        np.minimum(disc.offsets[interval], words.offsets[word])
+        - np.maximum(disc.onsets[interval], words.onsets[word])) / (
+            words.offsets[word] - words.onsets[word])
+    order = np.lexsort((word, -overlap, interval))
+    interval, word, overlap = interval[order], word[order], overlap[order]
+    first = np.unique(interval, return_index=True)[1]
+    counts = np.diff(np.append(first, len(interval)))
+    ties = np.add.reduceat(
+        overlap == np.repeat(overlap[first], counts), first) > 1
+    word = word[first]
+
+    # the ties are rare, they are broken on the trees as tde does
+    if words.trees is not None:
+        for n in np.nonzero(ties)[0]:
+            word[n] = _tied_word(words, disc, intervals[n])
+
+    # the transcription of the words
+    word_start, word_stop = phones.overlapping(
+        words.file_ids[word], words.onsets[word], words.offsets[word])
+    hit = _same_sequences(
+        phones.labels, word_start, word_stop,
+        disc.phone_start[intervals], disc.phone_stop[intervals])
+
+    token_hit = len(np.unique(word[hit]))
+    type_hit = len(np.unique(types[intervals][hit]))
+    n_types = len(np.unique(types))
+
+    precision = (
+        _ratio(token_hit, len(disc)), _ratio(type_hit, n_types))
+    recall = (
+        _ratio(token_hit, len(words.labels)),
+        _ratio(type_hit, len(words.symbols)))
+    fscore = (
+        _fscore(precision[0], recall[0]), _fscore(precision[1], recall[1]))
+    return precision, recall, fscore, n_types
+
+
+def _tied_word(words, disc, interval):
+    """Returns the word chosen by tde among the words overlapping `interval`
+
+    This is the first word of maximal overlap in the iteration order of the
+    words overlapping the interval in the gold interval tree.
+
+    """
+    file = disc.files[interval]
+    onset, offset = disc.onsets[interval], disc.offsets[interval]
+    chosen, best = None, 0
+    for word_onset, word_offset, _ in words.trees[words.files[file]].overlap(
+            onset, offset):
+        overlap = (min(offset, word_offset) - max(onset, word_onset)) / (
+            word_offset - word_onset)
+        if overlap > best:
+            chosen, best = word_onset, overlap
+    return words.locate(np.asarray([file]), np.asarray([chosen]))[0]
+
+
+def _ramps(lengths):
+    """Returns the concatenation of arange(length) for each length"""
+    lengths = np.asarray(lengths, dtype=np.int64)
+    return np.arange(lengths.sum()) - np.repeat(
+        np.cumsum(lengths) - lengths, lengths)
+
+
+def _sequence_ids(labels, start, stop):
+    """Returns an identifier of the sequence labels[start:stop] for each range
+
+    Two ranges have the same identifier if their labels are the same.
+
+    """
+    ids = np.zeros(len(start), dtype=np.int64)
+    length = stop - start
+    count = 0
+    for size in np.unique(length):
+        ranges = np.nonzero(length == size)[0]
+        if size:
+            _, inverse = np.unique(
+                labels[start[ranges, None] + np.arange(size)],
+                axis=0, return_inverse=True)
+            inverse = inverse.reshape(-1)
+        else:
+            inverse = np.zeros(len(ranges), dtype=np.int64)
+        ids[ranges] = count + inverse
+        count += inverse.max() + 1
+    return ids
+
+
+def _same_sequences(labels, start1, stop1, start2, stop2):
+    """Returns True where labels[start1:stop1] == labels[start2:stop2]"""
+    length = stop1 - start1
+    same = length == stop2 - start2
+    ranges = np.nonzero(same & (length > 0))[0]
+    if len(ranges):
+        size = length[ranges]
+        ramps = _ramps(size)
+        mismatch = (
+            labels[np.repeat(start1[ranges], size) + ramps]
+            != labels[np.repeat(start2[ranges], size) + ramps])
+        same[ranges[np.add.reduceat(
+            mismatch, np.cumsum(size) - size) > 0]] = False
+    return same
@@ -0,0 +1,213 @@
+"""Compiled index of the file lists in zerospeech2020/share
+
+The file lists distributed in zerospeech2020/share are compiled once in a
+compact manifest (share/manifest.json.gz) loaded by the validation and
+evaluation with a single read. The track1 lists of the 2017 part are stored
+as the number of files for each language and duration (the files being named
+0.wav to N-1.wav), the others as lists of file names (with durations for the
+2019 embeddings).
+
+The manifest must be compiled again when a file list is modified, with:
+
+    python -m zerospeech2020.manifest
+
+"""
+
+import functools
+import gzip
+import json
+import os
+import re
+
+
+_SHARE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'share')
+
+_MANIFEST_VERSION = 1
+
+_LANGUAGES_2017 = ['english', 'french', 'mandarin', 'LANG1', 'LANG2']
+
+_LANGUAGES_2019 = ['english', 'surprise']
+
+_DURATIONS = ['1s', '10s', '120s']
+
+
+class Manifest:
+    """The expected files of each track, language and duration
+
+    Parameters
+    ----------
+    data (dict): the manifest content, as written by compile_manifest()
+
+    """
+    def __init__(self, data):
+        if data.get('version') != _MANIFEST_VERSION:
+            raise ValueError('outdated manifest, please compile it again')
+        self._data = data
+        self._cache = {}
+
+    def _get(self, key, build):
+        if key not in self._cache:
+            self._cache[key] = build()
+        return self._cache[key]
+
+    def _entry(self, part, language):
+        try:
+            return self._data[part][language]
+        except KeyError:
+            raise ValueError(f'unknown language {language} for {part}')
+
+    def track1_files(self, language, duration):
+        """Returns the sorted list of expected 2017 track1 files (*.txt)"""
+        counts = self._entry('2017-track1', language)
+        if duration not in counts:
+            raise ValueError(f'unknown duration {duration}')
+        return self._get(
+            ('2017-track1', language, duration),
+            lambda: sorted(f'{n}.txt' for n in range(counts[duration])))
+
+    def track2_wavs(self, language):
+        """Returns the set of 2017 track2 wavs (without extension)"""
+        return self._get(
+            ('2017-track2', language),
+            lambda: frozenset(self._entry('2017-track2', language)))
+
+    def embedding_files(self, language):
+        """Returns the 2019 embedding files as a dict name -> duration
+
+        The files are ordered as in the file list.
+
+        """
+        return self._get(
+            ('2019-embedding', language),
+            lambda: dict(self._entry('2019', language)['embedding']))
+
+    def bitrate_files(self, language):
+        """Returns the 2019 bitrate files as a dict name -> duration
+
+        The files are ordered as in the file list.
+
+        """
+        embedding = self.embedding_files(language)
+        return self._get(
+            ('2019-bitrate', language),
+            lambda: {f: embedding[f] for f in self._entry(
+                '2019', language)['bitrate']})
+
+    def test_wavs(self, language):
+        """Returns the list of the 2019 wavs expected in the test folder"""
+        return self._entry('2019', language)['wavs']
+
+    def required_files(self, language):
+        """Returns the set of the files expected in the 2019 test folder"""
+        return self._get(
+            ('2019-required', language),
+            lambda: frozenset(self.embedding_files(language)).union(
+                self.test_wavs(language)))
+
+
+@functools.lru_cache(maxsize=None)
+def load(filename=os.path.join(_SHARE, 'manifest.json.gz')):
+    """Returns the Manifest, loaded only once per process
+
+    Raises
+    ------
+    ValueError if the manifest cannot be loaded.
+
+    """
+    try:
+        with gzip.open(filename, 'rt') as fin:
+            return Manifest(json.load(fin))
+    except (OSError, ValueError) as err:
+        raise ValueError(f'cannot load manifest {filename}: {err}')
+
+
+def _read_lines(filename):
+    with open(filename, 'r') as fin:
+        return [line.strip() for line in fin if line.strip()]
+
+
+def compile_manifest(share=_SHARE, output=None):
+    """Compiles the file lists in `share` into a manifest
+
+    Parameters
+    ----------
+    share (str): the directory containing the file lists, default to
+        zerospeech2020/share.
+
+    output (str): the manifest file to write, default to
+        `share`/manifest.json.gz.
+
+    Raises
+    ------
+    ValueError if a file list is not in the expected format.
+
+    """
+    data = {
+        'version': _MANIFEST_VERSION,
+        '2017-track1': {},
+        '2017-track2': {},
+        '2019': {}}
+
+    for language in _LANGUAGES_2017:
+        # files are <language>/<duration>/<n>.wav with n in [0, N-1]
+        filelist = os.path.join(
+            share, '2017', 'track1', f'{language}_filelist.txt')
+        numbers = {duration: set() for duration in _DURATIONS}
+        for line in _read_lines(filelist):
+            match = re.fullmatch(
+                rf'{language}/({"|".join(_DURATIONS)})/(\d+)\.wav', line)
+            if not match:
+                raise ValueError(f'{filelist}: unexpected file {line}')
+            numbers[match.group(1)].add(int(match.group(2)))
+
+        for duration, values in numbers.items():
+            if values != set(range(len(values))):
+                raise ValueError(
+                    f'{filelist}: {duration} files are not numbered '
+                    f'from 0 to {len(values) - 1}')
+        data['2017-track1'][language] = {
+            duration: len(values) for duration, values in numbers.items()}
+
+        filelist = os.path.join(
+            share, '2017', 'track2', f'{language}_filelist.txt')
+        data['2017-track2'][language] = sorted(
+            os.path.basename(line.split('.wav')[0])
+            for line in _read_lines(filelist))
+
+    for language in _LANGUAGES_2019:
+        directory = os.path.join(share, '2019', language)
+        embedding = [
+            (name, float(duration)) for name, duration in (
+                line.split(' ') for line in _read_lines(
+                    os.path.join(directory, 'embedding_filelist.txt')))]
+        bitrate = [
+            (name, float(duration)) for name, duration in (
+                line.split(' ') for line in _read_lines(
+                    os.path.join(directory, 'bitrate_filelist.txt')))]
+        required = [
+            os.path.basename(line) for line in _read_lines(
+                os.path.join(directory, 'required_filelist.txt'))]
+        wavs = [f for f in required if f.endswith('.wav')]
+
+        if set(bitrate) - set(embedding):
+            raise ValueError(
+                f'{directory}: bitrate files must be embedding files '
+                f'with the same durations')
+        if set(required) != set(name for name, _ in embedding).union(wavs):
+            raise ValueError(
+                f'{directory}: required files must be the embedding '
+                f'files and wavs')
+
+        data['2019'][language] = {
+            'embedding': embedding,
+            'bitrate': [name for name, _ in bitrate],
+            'wavs': wavs}
+
+    # mtime is fixed so that the manifest changes only with its content
+    output = output or os.path.join(share, 'manifest.json.gz')
+    with gzip.GzipFile(output, 'wb', mtime=0) as fout:
+        fout.write(json.dumps(data, separators=(',', ':')).encode('utf8'))
+
+
+if __name__ == '__main__':
+    compile_manifest()
@@ -0,0 +1,278 @@
+"""Reader of the 2017 track2 discovered classes files
+
+A class file lists the discovered classes, each class being a 'Class <n>'
+line followed by a line '<wav> <onset> <offset>' for each discovered
+fragment, and an empty line. The file is parsed in a single pass into
+columnar arrays, with the same format checks as tde.readers.disc_reader.Disc.
+The native track2 engine transcribes the fragments from those arrays (see
+Classes.to_disc), the tde engine reads the file with Disc.
+
+"""
+
+import os
+
+import numpy as np
+
+
+class Classes:
+    """The discovered classes, in columnar arrays
+
+    Parameters
+    ----------
+    class_file (str): the file the classes are read from
+
+    names (list): the numbers of the classes, in the order of the file, a
+        class being ended by each empty line
+
+    bounds (numpy.array): the fragments of the class `k` are the ones in
+        [bounds[k], bounds[k + 1])
+
+    files (list): the names of the wavs
+
+    file_ids (numpy.array): the index in `files` of the wav of each fragment
+
+    onsets, offsets (numpy.array): the timestamps of the fragments
+
+    """
+    def __init__(self, class_file, names, bounds, files, file_ids,
+                 onsets, offsets):
+        self.class_file = class_file
+        self.names = names
+        self.bounds = bounds
+        self.files = files
+        self.file_ids = file_ids
+        self.onsets = onsets
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.file_ids)
+
+    def to_disc(self, phones):
+        """Returns the classes with the fragments transcribed
+
+        The fragments are transcribed with the gold `phones` (as returned by
+        evaluation.track2_engine.gold_intervals) and the fragments with no
+        transcription are discarded, as done by
+        tde.readers.disc_reader.Disc(class_file, gold). The phones covered by
+        the fragments are found by binary search instead of a search in the
+        interval trees of the gold.
+
+        Raises
+        ------
+        ValueError if a wav is not in the gold, or if two classes have the
+        same number once the fragments with no transcription are discarded
+        (see read)
+
+        Returns
+        -------
+        disc (Discovered): the classes, with the `clusters` and `intervals`
+            of Disc
+
+        """
+        files = [self.files[n] for n in self.file_ids]
+        onsets = self.onsets.tolist()
+        offsets = self.offsets.tolist()
+
+        first, last = self._transcriptions(phones)
+        first, last = first.tolist(), last.tolist()
+        phone_onsets = phones.onsets.tolist()
+        phone_offsets = phones.offsets.tolist()
+        phone_labels = phones.symbols[phones.labels].tolist()
+
+        # a fragment is transcribed once even if it appears in several classes
+        transcriptions = {}
+        clusters = {}
+        for k, name in enumerate(self.names):
+            # as in Disc, a class number is unique among the non-empty
+            # classes, once transcribed
+            if name in clusters:
+                raise ValueError(
+                    f'two classes have the same number {name}')
+
+            fragments = []
+            for i in range(self.bounds[k], self.bounds[k + 1]):
+                fragment = (files[i], onsets[i], offsets[i])
+                if fragment not in transcriptions:
+                    span = slice(first[i], last[i])
+                    ngram = tuple(phone_labels[span])
+                    transcriptions[fragment] = (tuple(zip(
+                        phone_onsets[span], phone_offsets[span], ngram)),
+                        ngram)
+
+                token_ngram, ngram = transcriptions[fragment]
+                if token_ngram:
+                    fragments.append(fragment + (token_ngram, ngram))
+            if fragments:
+                clusters[name] = fragments
+
+        return Discovered(clusters, list(dict.fromkeys(
+            fragment for fragments in clusters.values()
+            for fragment in fragments)))
+
+    def _transcriptions(self, phones):
+        """Returns the phones transcribing each fragment
+
+        The transcription of the fragment `i` is made of the phones in
+        [first[i], last[i]), as done by Disc.get_transcription(): the phones
+        overlapping the fragment, except the first and last ones when they
+        are not covered enough (see tde.utils.check_boundary).
+
+        """
+        files = {name: n for n, name in enumerate(phones.files)}
+        for wav in self.files:
+            if wav not in files or phones.bounds[files[wav]] == (
+                    phones.bounds[files[wav] + 1]):
+                raise ValueError(f'{wav}: file not found in gold')
+
+        start, stop = phones.overlapping(
+            np.asarray([files[wav] for wav in self.files])[self.file_ids],
+            self.onsets, self.offsets)
+        size = stop - start
+        last_phone = len(phones.onsets) - 1
+        keep_first = _covered(
+            phones, np.minimum(start, last_phone), self.onsets, self.offsets)
+        keep_last = _covered(
+            phones, np.maximum(stop - 1, 0), self.onsets, self.offsets)
+        return (
+            start + ((size > 0) & ~keep_first),
+            stop - ((size > 1) & ~keep_last))
+
+
+def _covered(phones, index, onsets, offsets):
+    """Returns True where the phones `index` are covered by the fragments
+
+    This is a vectorized version of tde.utils.check_boundary, giving the same
+    results: a phone is covered if the fragment overlaps 30ms of it (for
+    phones of 60ms or more) or half of it (for shorter phones).
+
+    """
+    phone_onsets, phone_offsets = phones.onsets[index], phones.offsets[index]
+    # check_boundary rounds the durations of phones as Python floats and the
+    # overlaps as numpy floats, the two roundings may differ
+    duration = np.asarray(
+        [round(d, 3) for d in (phone_offsets - phone_onsets).tolist()],
+        dtype=np.float64)
+    overlap = (
+        np.minimum(offsets, phone_offsets) - np.maximum(onsets, phone_onsets))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = overlap / (phone_offsets - phone_onsets)
+    return np.where(
+        duration >= 0.060, np.round(overlap, 3) >= 0.030, ratio >= 0.5)
+
+
+class Discovered:
+    """The discovered classes with their fragments transcribed
+
+    This exposes the attributes of tde.readers.disc_reader.Disc used by
+    tde.measures and evaluation.track2_engine.
+
+    Parameters
+    ----------
+    clusters (dict): class number -> list of fragments, a fragment being a
+        tuple (wav, onset, offset, token_ngram, ngram)
+
+    intervals (list): the distinct fragments
+
+    """
+    def __init__(self, clusters, intervals):
+        self.clusters = clusters
+        self.intervals = intervals
+
+
+def read(class_file, wavs=None, unique=True):
+    """Reads a class file and checks its format
+
+    Parameters
+    ----------
+    class_file (str): the class file to read
+
+    wavs (set): when specified, the valid wavs names, the fragments must
+        refer to one of them.
+
+    unique (bool): when True, two non-empty classes cannot have the same
+        number, as for Disc read without gold. When False, this is checked
+        once the fragments are transcribed (see Classes.to_disc).
+
+    Raises
+    ------
+    ValueError if the file is not found or is not a valid class file
+
+    Returns
+    -------
+    classes (Classes): the classes read from the file
+
+    """
+    if not os.path.isfile(class_file):
+        raise ValueError(f'{class_file}: file not found')
+
+    names, bounds, seen = [], [0], set()
+    wav_names, onsets, offsets, numbers = [], [], [], []
+    class_number = None
+    last = None
+    with open(class_file, 'r') as fin:
+        for number, last in enumerate(fin, start=1):
+            line = last.strip()
+            if line[:5] == 'Class':
+                fields = line.split(' ')
+                if len(fields) < 2:
+                    raise ValueError(f'line {number}: missing class number')
+                class_number = fields[1]
+            elif not line:
+                # an empty line ends the current class
+                if class_number is None:
+                    raise ValueError(
+                        f'line {number}: empty line before the first class')
+                if unique and class_number in seen:
+                    raise ValueError(
+                        f'line {number}: two classes have the same number '
+                        f'{class_number}')
+                if len(wav_names) > bounds[-1]:
+                    seen.add(class_number)
+                names.append(class_number)
+                bounds.append(len(wav_names))
+            else:
+                fields = line.split(' ')
+                if len(fields) != 3:
+                    raise ValueError(
+                        f'line {number}: wrong format: {line}')
+                wav_names.append(fields[0])
+                onsets.append(fields[1])
+                offsets.append(fields[2])
+                numbers.append(number)
+
+    if last != '\n':
+        raise ValueError('the class file must end with an empty line')
+
+    onsets = _to_float(onsets, numbers)
+    offsets = _to_float(offsets, numbers)
+    bad = ~(offsets > onsets)
+    if np.any(bad):
+        raise ValueError(
+            f'line {numbers[np.argmax(bad)]}: offset must be greater '
+            f'than onset')
+
+    files, file_ids = np.unique(
+        np.asarray(wav_names, dtype=str), return_inverse=True)
+    files = files.tolist()
+    if wavs is not None:
+        for wav in files:
+            if wav not in wavs:
+                raise ValueError(f'{wav} is not a valid wav')
+
+    return Classes(
+        class_file, names, np.asarray(bounds, dtype=np.int64), files,
+        file_ids.reshape(-1), onsets, offsets)
+
+
+def _to_float(values, numbers):
+    try:
+        return np.asarray(values, dtype=np.float64).reshape(-1)
+    except ValueError:
+        # find the faulty line
+        for value, number in zip(values, numbers):
+            try:
+                float(value)
+            except ValueError:
+                raise ValueError(
+                    f'line {number}: timestamp is not a number: {value}')
+        raise
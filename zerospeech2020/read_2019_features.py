@@ -1,6 +1,8 @@
 from collections import defaultdict
 import os
 
+import numpy as np
+
 
 class ReadZrsc2019Exception(Exception):
     def __init__(self, *args, **kwargs):
@@ -26,6 +28,34 @@ def read(file):
     """ Read file and search for format errors or inconsistencies.
     Yield : "val": vector representing one line
     """
+    for _, value in _read_lines(file):
+        yield value
+
+
+def read_array(file):
+    """ Read file and search for format errors or inconsistencies.
+    Return : (times, features) arrays, the time of a vector being its relative
+    position in the file, as expected by the ABX evaluation. Blank lines are
+    skipped, the features may have a single dimension.
+    """
+    indices = []
+    vectors = []
+    lines = _read_lines(file)
+    while True:
+        try:
+            i, value = next(lines)
+        except StopIteration as stop:
+            n_lines = stop.value
+            break
+        indices.append(i)
+        vectors.append(value)
+    return np.asarray(indices) / n_lines, np.asarray(vectors)
+
+
+def _read_lines(file):
+    """ Yield : (index, val) for each non-empty line
+    Return : the number of lines in the file
+    """
     flow = open(file)
     # How many columns are there in a line
     num_cols = None
@@ -49,7 +79,7 @@ def read(file):
                         ": Inconsistent format, vector size changed")
                 try:
                     value_s = tuple(to_float(line_elts))
-                    yield value_s
+                    yield i, value_s
                 except ValueError as e:
                     raise ReadZrsc2019Exception(
                         "Error coverting to float: " + str(e))
@@ -59,41 +89,62 @@ def read(file):
     if is_empty:
         raise ReadZrsc2019Exception("File is empty")
     flow.close()
+    return i + 1
 
 
-def read_all(list_filename, folder, skip_missing_files, log):
+def read_all(list_filename, folder, skip_missing_files, log, cache=None):
+    """ Read all the files listed in list_filename and count the symbols.
+    When `cache` is a dict, parsed files are stored in it as
+    base_name -> (times, features) (see read_array) and the files already in
+    it are not read again.
+    Return : symbol counts, number of lines and total duration
+    """
     with open(list_filename, 'r') as flow:  # Only IOError that can be raised
-        n_cols = None
-        n_lines = 0
-        d_symbol_counts = defaultdict(int)
-        total_duration = 0
-        for line in flow.readlines():
-            line = line.strip()
-            if (line == ""):
+        entries = [
+            line.strip().split(' ') for line in flow.readlines()
+            if line.strip() != ""]
+    return read_entries(
+        ((base_name, float(duration_s)) for base_name, duration_s in entries),
+        folder, skip_missing_files, log, cache=cache)
+
+
+def read_entries(entries, folder, skip_missing_files, log, cache=None):
+    """ Read all the files given as (base_name, duration) entries and count
+    the symbols, as read_all.
+    Return : symbol counts, number of lines and total duration
+    """
+    n_cols = None
+    n_lines = 0
+    d_symbol_counts = defaultdict(int)
+    total_duration = 0
+    for base_name, duration in entries:
+        file_name = os.path.join(folder, base_name)
+        try:
+            n_cols_i = None
+            if cache is None:
+                vectors = read(file_name)
+            else:
+                if base_name not in cache:
+                    cache[base_name] = read_array(file_name)
+                vectors = map(tuple, cache[base_name][1])
+            for vector in vectors:
+                n_lines += 1
+                if n_cols_i is None:
+                    n_cols_i = len(vector)
+                d_symbol_counts[vector] += 1
+            if n_cols is not None:
+                if n_cols != n_cols_i:
+                    log_or_raise(
+                        "Vector dimension does not match " +
+                        "other files: " + base_name, log)
+            else:
+                n_cols = n_cols_i
+            total_duration += duration
+        except ReadZrsc2019Exception as e:
+            log_or_raise(str(e), log)
+        except IOError as e:
+            if skip_missing_files:
                 continue
-            base_name, duration_s = line.split(' ')
-            duration = float(duration_s)
-            file_name = os.path.join(folder, base_name)
-            try:
-                n_cols_i = None
-                for vector in read(file_name):
-                    n_lines += 1
-                    if n_cols_i is None:
-                        n_cols_i = len(vector)
-                    d_symbol_counts[vector] += 1
-                if n_cols is not None:
-                    if n_cols != n_cols_i:
-                        log_or_raise(
-                            "Vector dimension does not match " +
-                            "other files: " + base_name, log)
-                else:
-                    n_cols = n_cols_i
-                total_duration += duration
-            except ReadZrsc2019Exception as e:
-                log_or_raise(str(e), log)
-            except IOError as e:
-                if skip_missing_files:
-                    continue
-                log_or_raise(
-                    "Error reading file '" + base_name + "': " + str(e), log)
+            log_or_raise(
+                "Error reading file '" + base_name + "': " + str(e), log)
     return d_symbol_counts, n_lines, total_duration
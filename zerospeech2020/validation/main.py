@@ -4,7 +4,6 @@
 import argparse
 import logging
 import sys
-from .submission_2020 import Submission2020
 
 
 # setup logging
@@ -24,10 +23,19 @@ def main():
     parser.add_argument(
         '-j', '--njobs', type=int, default=1,
         help='number of parallel processes to use for validation')
+    parser.add_argument(
+        '-e', '--max-errors', type=int, default=100,
+        help='stop the validation once this number of errors is found '
+        '(default to %(default)s), use 0 to find all the errors')
     args = parser.parse_args()
 
+    # imported only once the arguments are parsed for a fast --help
+    from .submission_2020 import Submission2020
+
     try:
-        Submission2020(args.submission, njobs=args.njobs, log=log).validate()
+        Submission2020(
+            args.submission, njobs=args.njobs, log=log,
+            max_errors=args.max_errors).validate()
         sys.exit(0)
     except ValueError as err:
         log.error(f'fatal error: {err}')
@@ -3,19 +3,18 @@
 import logging
 import numpy as np
 import os
-import pkg_resources
-import sys
 
-from tde.readers.disc_reader import Disc as Track2Reader
+from zerospeech2020 import manifest, read_2017_classes
 from zerospeech2020.validation.utils import (
     validate_code, validate_yaml, validate_directory, log_errors, parallelize)
 
 
 class Submission2017:
     def __init__(self, submission, is_open_source,
-                 njobs=1, log=logging.getLogger()):
+                 njobs=1, log=logging.getLogger(), max_errors=None):
         self._log = log
         self._njobs = njobs
+        self._max_errors = max_errors
         self._is_open_source = is_open_source
 
         if not os.path.isdir(submission):
@@ -82,17 +81,9 @@ class Submission2017:
 
         return languages
 
-    def _get_track1_filelist(self, lang, duration):
-        filename = pkg_resources.resource_filename(
-            pkg_resources.Requirement.parse('zerospeech2020'),
-            f'zerospeech2020/share/2017/track1/{lang}_filelist.txt')
-        return sorted(
-            os.path.basename(f.strip()).replace('.wav', '.txt')
-            for f in open(filename, 'r') if duration in f)
-
     def _validate_track1_language(self, lang, duration):
         # ensure the expected files are here
-        expected_files = self._get_track1_filelist(lang, duration)
+        expected_files = manifest.load().track1_files(lang, duration)
         validate_directory(
             os.path.join(self._submission, 'track1', lang, duration),
             f'2017/track1/{lang}/{duration}', expected_files, self._log)
@@ -101,9 +92,12 @@ class Submission2017:
         errors = parallelize(
             self._validate_track1_file, self._njobs,
             ((os.path.join(self._submission, 'track1', lang, duration, f),
-             lang, duration) for f in expected_files))
+             lang, duration) for f in expected_files),
+            max_errors=self._max_errors)
         if errors:
-            log_errors(self._log, errors, f'2017/track1/{lang}/{duration}')
+            log_errors(
+                self._log, errors, f'2017/track1/{lang}/{duration}',
+                max_errors=self._max_errors)
 
     @staticmethod
     def _validate_track1_file(filename, lang, duration):
@@ -129,28 +123,14 @@ class Submission2017:
         return errors
 
     def _validate_track2(self):
-        # ensure each file is valid
+        # ensure each file is valid and each interval refers to an existing
+        # wav
         languages = self._get_languages('track2', suffix='.txt')
         for lang in languages:
             self._log.info(f'validating 2017/track2/{lang} ...')
             try:
-                # Track2Reader prints some messages we do not want do display
-                sys.stdout = open(os.devnull, 'w')
-                clusters = Track2Reader(os.path.join(
-                    self._submission, 'track2', f'{lang}.txt'))
-                sys.stdout = sys.__stdout__
-            except (ValueError, AssertionError) as err:
+                read_2017_classes.read(
+                    os.path.join(self._submission, 'track2', f'{lang}.txt'),
+                    wavs=manifest.load().track2_wavs(lang))
+            except ValueError as err:
                 raise ValueError(f'error in 2017/track2/{lang}: {str(err)}')
-
-            # for each interval, ensures it refeers to an existing wav
-            wavs = set(v[0] for vv in clusters.clusters.values() for v in vv)
-            wavs_list = pkg_resources.resource_filename(
-                pkg_resources.Requirement.parse('zerospeech2020'),
-                f'zerospeech2020/share/2017/track2/{lang}_filelist.txt')
-            expected_wavs = set(
-                os.path.basename(w.split('.wav')[0])
-                for w in open(wavs_list, 'r'))
-            for wav in wavs:
-                if wav not in expected_wavs:
-                    raise ValueError(
-                        f'{wav} is not a valid wav for 2017/track2/{lang}')
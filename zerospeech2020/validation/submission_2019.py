@@ -2,18 +2,24 @@
 
 import logging
 import os
-import pkg_resources
+import time
 import wave
 
-from zerospeech2020 import read_2019_features
+import joblib
+
+from zerospeech2020 import manifest, read_2019_features
 from zerospeech2020.validation.utils import (
-    validate_code, validate_yaml, validate_directory, log_errors)
+    validate_code, validate_yaml, validate_directory, log_errors, parallelize)
 
 
 class Submission2019:
-    def __init__(self, submission, is_open_source, log=logging.getLogger()):
+    def __init__(self, submission, is_open_source, njobs=1,
+                 log=logging.getLogger(), features=None, max_errors=None):
         self._log = log
+        self._njobs = njobs
+        self._max_errors = max_errors
         self._is_open_source = is_open_source
+        self._features = features
 
         if not os.path.isdir(submission):
             raise ValueError('2019 submission not found')
@@ -100,16 +106,30 @@ class Submission2019:
         return metadata
 
     def _validate_language(self, language, do_aux1, do_aux2):
-        val = LanguageValidation(language, self._log)
+        val = LanguageValidation(
+            language, self._log, self._features, njobs=self._njobs,
+            max_errors=self._max_errors)
         val.validate(self._submission, do_aux1, do_aux2)
 
         if val.errors:
-            log_errors(self._log, val.errors, f'2019/{language}')
+            log_errors(
+                self._log, val.errors, f'2019/{language}',
+                max_errors=self._max_errors)
 
 
 class LanguageValidation:
-    def __init__(self, language, log):
+    # expected format of the resynthesized wavs
+    _WAV_CHANNELS = 1
+    _WAV_FRAMERATE = 16000
+
+    def __init__(self, language, log, features=None, njobs=1,
+                 max_errors=None):
         self._log = log
+        self._njobs = njobs
+        self._max_errors = max_errors
+        # when not None, the embeddings parsed in the directories listed in
+        # it are stored as features[directory][filename] = (times, features)
+        self._features = features
         # make sure the language is valid
         if language not in ['english', 'surprise']:
             raise ValueError(
@@ -118,55 +138,77 @@ class LanguageValidation:
         self._language = language
 
         # get the files needed for the validation
-        self.required_list = self._get_file('required')
-        self.bitrate_list = self._get_file('bitrate')
-        self.embedding_list = self._get_file('embedding')
+        self.required_list = manifest.load().required_files(language)
+        self.bitrate_list = manifest.load().bitrate_files(language)
+        self.embedding_list = manifest.load().embedding_files(language)
 
         # the list of error must remains empty for the submission to
         # be validated
         self.errors = []
 
-    def _get_file(self, name):
-        filename = pkg_resources.resource_filename(
-            pkg_resources.Requirement.parse('zerospeech2020'),
-            f'zerospeech2020/share/2019/{self._language}/{name}_filelist.txt')
-
-        if not os.path.isfile(filename):
-            raise ValueError(f'file not found: {filename}')
-
-        return filename
-
-    def _check_exists(self, directory, files_list):
+    def _check_exists(self, directory, expected_files):
         if not os.path.isdir(directory):
             raise ValueError(f'directory {directory} does not exist')
         root_dir = os.path.basename(directory)
         existing_files = set(os.listdir(directory))
-        expected_files = set(
-            os.path.basename(f.strip().split(' ')[0])
-            for f in open(files_list, 'r'))
 
-        missing_files = expected_files - existing_files
+        missing_files = set(expected_files) - existing_files
         for f in missing_files:
             self.errors.append(
                 f'missing file 2019/{self._language}/{root_dir}/{f}')
 
     def _check_embedding(self, directory, files_list):
-        # ensure each embedding file has the correct format
-        read_2019_features.read_all(
-            files_list, directory, False, log=self._log)
-
-    def _check_wavs(self, wavs_list):
-        # ensure each wav is readable (valid wav header) and is not empty
-        # TODO ensure this is working
-        for wav in wavs_list:
-            wav = os.path.join(self._submission, wav)
-            try:
-                with wave.open(wav, 'r') as fwav:
-                    duration = fwav.getnframes() / fwav.getframerate()
-                    if duration <= 0:
-                        self.errors.append(f'wav file is empty: {wav}')
-            except wave.Error:
-                self.errors.append(f'cannot read wav file: {wav}')
+        # ensure each embedding file has the correct format, files_list is a
+        # dict filename -> duration
+        cache = None
+        if self._features is not None:
+            cache = self._features.get(os.path.realpath(directory))
+
+        read_2019_features.read_entries(
+            files_list.items(), directory, False, log=self._log, cache=cache)
+
+    def _check_wavs(self, directory, wavs_list):
+        # ensure each wav has a valid header and is not empty. Only the
+        # headers are read, in parallel threads as this is I/O-bound, with 4
+        # threads per job.
+        root_dir = os.path.basename(directory)
+        t0 = time.time()
+        self.errors += parallelize(
+            self._check_wav, 4 * joblib.effective_n_jobs(self._njobs),
+            ((os.path.join(directory, wav),
+              f'2019/{self._language}/{root_dir}/{wav}')
+             for wav in wavs_list),
+            max_errors=self._max_errors, threads=True)
+        duration = max(time.time() - t0, 1e-6)
+        self._log.info(
+            '    checked %s wav headers in %.1fs (%.0f files/s)',
+            len(wavs_list), duration, len(wavs_list) / duration)
+
+    @classmethod
+    def _check_wav(cls, filename, name):
+        try:
+            # wave.open parses the RIFF header and the format chunk, the
+            # samples are never read
+            with wave.open(filename, 'r') as fwav:
+                nchannels = fwav.getnchannels()
+                framerate = fwav.getframerate()
+                nframes = fwav.getnframes()
+        except wave.Error as err:
+            return [f'cannot read wav file {name}: {err}']
+        except EOFError:
+            return [f'cannot read wav file {name}: truncated header']
+
+        errors = []
+        if nchannels != cls._WAV_CHANNELS:
+            errors.append(
+                f'wav file must be mono but has {nchannels} channels: {name}')
+        if framerate != cls._WAV_FRAMERATE:
+            errors.append(
+                f'wav file must be sampled at {cls._WAV_FRAMERATE}Hz but '
+                f'is at {framerate}Hz: {name}')
+        if nframes <= 0:
+            errors.append(f'wav file is empty: {name}')
+        return errors
 
     def _validate_directory(self, directory, exist_list, embedding_list):
         self._log.info(
@@ -179,8 +221,9 @@ class LanguageValidation:
             self._check_embedding(directory, embedding_list)
 
         if not self.errors:
-            wavs_list = [f for f in open(exist_list) if f.endswith('.wav')]
-            self._check_wavs(wavs_list)
+            wavs_list = sorted(f for f in exist_list if f.endswith('.wav'))
+            if wavs_list:
+                self._check_wavs(directory, wavs_list)
 
     def validate(self, submission, do_aux1, do_aux2):
         self.errors = []
@@ -1,17 +1,27 @@
 """Usefull abstractions to validate a submission for the ZRC2020"""
 
+import concurrent.futures
 import logging
 import os
 
+import joblib
+
 from .submission_2017 import Submission2017
 from .submission_2019 import Submission2019
 from .utils import validate_directory, validate_yaml, unzip_if_needed
 
 
 class Submission2020:
-    def __init__(self, submission, njobs=1, log=logging.getLogger()):
+    def __init__(self, submission, njobs=1, log=logging.getLogger(),
+                 max_errors=None, features_2019=None):
         self._log = log
         self._njobs = njobs
+        self._max_errors = max_errors
+
+        # when not None, the 2019 embeddings parsed during validation in the
+        # directories listed here are stored to be reused by the evaluation
+        # (see evaluation_2019.features_cache)
+        self._features_2019 = features_2019
 
         # unzip the submission if this is a zip archive
         self._submission = unzip_if_needed(submission, log)
@@ -30,13 +40,39 @@ class Submission2020:
         return self._is_open_source
 
     def validate(self):
-        """Raises a ValueError if the submission is not valid"""
+        """Raises a ValueError if the submission is not valid
+
+        The 2017 and 2019 parts are validated concurrently, sharing the
+        `njobs` CPU cores, the errors found in both are reported.
+
+        """
         dir_2017, dir_2019 = self._validate_root()
-        if dir_2017:
-            self._validate_2017()
-        if dir_2019:
-            self._validate_2019()
-            self._log.info('success, the submission is valid!')
+
+        # the 2019 part is validated in a thread, the 2017 one in the main
+        # thread, so that its process pool is not started from a thread
+        njobs = joblib.effective_n_jobs(self._njobs)
+        njobs_2019 = max(1, njobs // 2) if dir_2017 else njobs
+        njobs_2017 = max(1, njobs - njobs_2019) if dir_2019 else njobs
+
+        errors = []
+        with concurrent.futures.ThreadPoolExecutor(1) as executor:
+            future = (
+                executor.submit(self._validate_2019, njobs_2019)
+                if dir_2019 else None)
+            if dir_2017:
+                try:
+                    self._validate_2017(njobs_2017)
+                except ValueError as err:
+                    errors.append(str(err))
+            if future is not None:
+                try:
+                    future.result()
+                except ValueError as err:
+                    errors.append(str(err))
+
+        if errors:
+            raise ValueError('; '.join(errors))
+        self._log.info('success, the submission is valid!')
 
     def _validate_root(self):
         existing = validate_directory(
@@ -64,16 +100,19 @@ class Submission2020:
             '    submission declared as%s open source',
             '' if self._is_open_source else ' NOT')
 
-    def _validate_2017(self):
+    def _validate_2017(self, njobs):
         """Checks if submission for 2017 subset is valid"""
         Submission2017(
             os.path.join(self._submission, '2017'),
             self._is_open_source,
-            njobs=self._njobs, log=self._log).validate()
+            njobs=njobs, log=self._log,
+            max_errors=self._max_errors).validate()
 
-    def _validate_2019(self):
+    def _validate_2019(self, njobs):
         """Checks if submission for 2019 subset is valid"""
         Submission2019(
             os.path.join(self._submission, '2019'),
             self._is_open_source,
-            log=self._log).validate()
+            njobs=njobs, log=self._log,
+            features=self._features_2019,
+            max_errors=self._max_errors).validate()
@@ -1,7 +1,9 @@
 """Utility functions for ZRC2020 validation"""
 
 import atexit
+import concurrent.futures
 import itertools
+import math
 import os
 import shutil
 import tempfile
@@ -176,22 +178,92 @@ def resume(sequence, n=10):
     return ', '.join(sequence)
 
 
-def log_errors(log, errors, name, n=20):
-    """Log the first errors, a synthesis message and raise a ValueError"""
+def log_errors(log, errors, name, n=20, max_errors=None):
+    """Log the first errors, a synthesis message and raise a ValueError
+
+    When `max_errors` is specified and reached, the validation has been
+    interrupted and the number of errors is only a lower bound.
+
+    """
     log.error(f'validation errors for {name}:')
     for error in errors[:n]:
         log.error('    %s', error)
     if len(errors) > n:
         log.error(f'    ... and {len(errors) - n} more!')
 
+    at_least = 'at least ' if max_errors and len(errors) >= max_errors else ''
     raise ValueError(
-        f'invalid submission, found {len(errors)} errors in {name}')
+        f'invalid submission, found {at_least}{len(errors)} errors in {name}')
+
+
+def parallelize(function, njobs, args, chunksize=None, max_errors=None,
+                threads=False):
+    """Applies a validation function in parallel, returns the errors found
+
+    The arguments are grouped in chunks, each chunk being processed as a
+    single job. The results are collected as soon as a chunk is processed and
+    the remaining chunks are cancelled once `max_errors` errors are found.
+
+    Parameters
+    ----------
+    function (function): called as function(*arg) for each arg in `args`,
+        returns a list of errors (empty if no error found). It must be
+        picklable when `njobs` > 1.
 
+    njobs (int): the number of parallel processes to use, as in joblib (-1
+        means all the CPUs).
 
-def parallelize(function, njobs, args):
-    return list(itertools.chain(
-        *joblib.Parallel(n_jobs=njobs)(
-            joblib.delayed(function)(*arg) for arg in args)))
+    args (iterable): the arguments of the function calls.
+
+    chunksize (int): the number of calls in a single job, default to have
+        about 8 jobs per process, and no more than 1000 calls per job.
+
+    max_errors (int): stop the validation once this number of errors is
+        reached, default is to process all the arguments.
+
+    threads (bool): when True, use `njobs` threads instead of processes. This
+        is faster for I/O-bound functions, which need not be picklable.
+
+    Returns
+    -------
+    errors (list): the errors found, ordered as `args`.
+
+    """
+    njobs = joblib.effective_n_jobs(njobs)
+    args = list(args)
+    if not chunksize:
+        chunksize = max(1, min(1000, math.ceil(len(args) / (8 * njobs))))
+    chunks = [args[i:i + chunksize] for i in range(0, len(args), chunksize)]
+
+    results = {}
+    nerrors = 0
+    if njobs == 1:
+        for i, chunk in enumerate(chunks):
+            results[i] = _apply(function, chunk)
+            nerrors += len(results[i])
+            if max_errors and nerrors >= max_errors:
+                break
+    else:
+        pool = (
+            concurrent.futures.ThreadPoolExecutor if threads
+            else concurrent.futures.ProcessPoolExecutor)
+        with pool(njobs) as executor:
+            futures = {
+                executor.submit(_apply, function, chunk): i
+                for i, chunk in enumerate(chunks)}
+            for future in concurrent.futures.as_completed(futures):
+                results[futures[future]] = future.result()
+                nerrors += len(results[futures[future]])
+                if max_errors and nerrors >= max_errors:
+                    for pending in futures:
+                        pending.cancel()
+                    break
+
+    return list(itertools.chain(*(results[i] for i in sorted(results))))
+
+
+def _apply(function, chunk):
+    return list(itertools.chain(*(function(*arg) for arg in chunk)))
 
 
 def unzip_if_needed(submission, log):